@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+
+"""
+Module that holds the backends used to annotate affymetrix probe ids with gene
+symbol, gene description, refseq id, and homologene id.
+
+Classes:
+    AnnotationBackend: interface every annotation backend implements
+    MyGeneBackend: remote backend that queries the mygene api, backed by the on
+    disk annotation cache
+    PlatformTableBackend: offline backend that joins probes against a local GPL
+    annotation table
+
+Functions:
+    makeBackend(): build the backend selected by the command line options
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from annotationCache import ANNOTATION_COLUMNS, CACHE_VERSION, AnnotationCache
+from seriesParser import openSeriesFile
+
+PLATFORM_CACHE_DIR = "../cache/platforms"
+# names a column can have in GEO .annot files, GEO full platform tables and
+# Affymetrix annotation csv files, matched case insensitively
+TABLE_COLUMNS = {
+    "affy_gene_probe_id": ["ID", "Probe Set ID", "ID_REF"],
+    "HG ID": ["HG ID", "HomoloGene", "HomoloGene ID", "Homologene.id"],
+    "Gene Name": ["Gene symbol", "Symbol", "GENE_SYMBOL"],
+    "Gene Description": [
+        "Gene title",
+        "Gene Description",
+        "GENE_NAME",
+        "Description",
+    ],
+    "RefSeq": ["RefSeq", "RefSeq Transcript ID", "RefSeq Genomic", "REFSEQ"],
+}
+
+
+class AnnotationBackend:
+    """
+    Class that defines the interface of an annotation backend.
+
+    Initialized: version string that changes whenever the backend may annotate the
+    same probes differently, used to notice stale annotations of earlier ingests
+
+    Methods: annotate(): return a dataframe with ANNOTATION_COLUMNS for the probes
+    of a platform that the backend could annotate
+    """
+
+    version = None
+
+    def annotate(self, platform, probeIDs):
+        """ Annotate probeIDs of platform, returning a dataframe with ANNOTATION_COLUMNS. """
+        raise NotImplementedError
+
+
+class MyGeneBackend(AnnotationBackend):
+    """
+    Class to annotate probes with the mygene api.
+
+    Probes missing from the cache are split into batches that are queried
+    concurrently by a bounded thread pool, each batch being retried with exponential
+    backoff when it fails. Every finished batch is written to the cache right away,
+    so a run that dies half way only queries the remaining batches when restarted.
+
+    Initialized: annotation cache that is consulted before the api is called (None
+    to always call the api), number of probes per request, maximum number of
+    requests in flight, number of retries of a failed batch, base backoff in seconds
+    between retries, url of the mygene api (None for the public one), and version
+    of the annotations
+
+    Methods: annotate(): annotate the probes missing from the cache with the mygene
+    api and store the results in the cache, queryBatch(): query one batch of probes,
+    retrying on failure, queryMyGene(): query the mygene api with a list of probes
+    """
+
+    def __init__(
+        self,
+        cache=None,
+        batchSize=1000,
+        concurrency=4,
+        retries=3,
+        backoff=1.0,
+        url=None,
+    ):
+        self.cache = cache
+        self.batchSize = batchSize
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.url = url
+        # mirrors serve the same annotations, so the url is not part of it
+        self.version = f"mygene {CACHE_VERSION}"
+
+    def annotate(self, platform, probeIDs):
+        """ Annotate probeIDs with gene symbol, gene name, refseq id, and homologene id. Probes found in the annotation cache are not queried again. """
+        # split probes into those already cached and those that need the api
+        if self.cache is None:
+            cachedDf = pd.DataFrame(columns=ANNOTATION_COLUMNS)
+            missing = list(probeIDs)
+        else:
+            cachedDf, missing = self.cache.lookup(platform, probeIDs)
+        fetched = [cachedDf]
+        failed = []
+        batches = [
+            missing[i : i + self.batchSize]
+            for i in range(0, len(missing), self.batchSize)
+        ]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {
+                executor.submit(self.queryBatch, batch): batch for batch in batches
+            }
+            for future in as_completed(futures):
+                try:
+                    fetchedDf, notFound = future.result()
+                except Exception:
+                    failed.append(futures[future])
+                    continue
+                # checkpoint the batch, including probes mygene does not know about
+                if self.cache is not None:
+                    self.cache.store(platform, fetchedDf, notFound)
+                fetched.append(fetchedDf)
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} of {len(batches)} annotation batches failed after "
+                f"{self.retries} retries, finished batches are cached and will not "
+                "be queried again"
+            )
+        annotateDf = pd.concat(fetched, ignore_index=True)
+        # only keep probes mygene returned every field for
+        annotateDf.dropna(axis=0, inplace=True)
+        annotateDf["HG ID"] = annotateDf["HG ID"].astype(float)
+        return annotateDf
+
+    def queryBatch(self, probeIDs):
+        """ Query one batch of probes, retrying with exponential backoff when the request fails. """
+        for attempt in range(self.retries + 1):
+            try:
+                return self.queryMyGene(probeIDs)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def queryMyGene(self, probeIDs):
+        """ Query MyGene API with a list of affymetrix probe IDs and return a dataframe of their annotations and the list of probes that were not found. """
+        # imported here so that only annotating remotely pays for loading it
+        import mygene
+
+        mg = mygene.MyGeneInfo()
+        # mygene pauses a second after every request, which would hold a worker of
+        # the pool idle, the requests in flight are bounded by concurrency instead
+        mg.delay = 0
+        # point the client at another server, such as a local mirror
+        if self.url is not None:
+            mg.url = self.url
+        # query with affy probe ids
+        annotateDf = mg.querymany(
+            probeIDs,
+            scopes="reporter",
+            fields="symbol, name, refseq, homologene, acession",
+            as_dataframe=True,
+            df_index=False,
+            verbose=False,
+        )
+        # probes mygene could not find
+        if "notfound" in annotateDf.columns:
+            notFoundRows = annotateDf["notfound"].fillna(False).astype(bool)
+            notFound = annotateDf.loc[notFoundRows, "query"].to_list()
+            annotateDf = annotateDf[~notFoundRows]
+        else:
+            notFound = []
+        # keep the best scoring hit of every probe
+        annotateDf = annotateDf.drop_duplicates(subset="query")
+        # reorder columns, dropping everything that is not needed
+        annotateDf = annotateDf.reindex(
+            columns=[
+                "query",
+                "homologene.id",
+                "symbol",
+                "name",
+                "refseq.genomic",
+            ],
+        )
+        # genes with several genomic refseqs come back as a list
+        annotateDf["refseq.genomic"] = annotateDf["refseq.genomic"].map(
+            lambda x: ",".join(x) if isinstance(x, list) else x
+        )
+        # rename to more human readable form
+        annotateDf.columns = ANNOTATION_COLUMNS
+        return annotateDf, notFound
+
+
+class PlatformTableBackend(AnnotationBackend):
+    """
+    Class to annotate probes offline from a local GPL annotation table such as a
+    GEO .annot file or the full table of a GEO platform.
+
+    The table is parsed once into a compact probe indexed dataframe with categorical
+    annotation columns and pre-serialized under cache/platforms/, later runs load
+    the serialized copy as long as it is newer than the table. Annotating is a
+    single vectorized reindex of that dataframe by the probes of the series.
+
+    Initialized: path of the annotation table, platform id found in the header of
+    the table (None when the header does not name one), version of the annotations
+    (the name, size and modification time of the table), and the probe indexed
+    annotation dataframe
+
+    Methods: annotate(): join probes against the table, loadTable(): parse the
+    annotation table into the probe indexed dataframe
+    """
+
+    def __init__(self, tablePath):
+        self.tablePath = tablePath
+        self.platform = None
+        name = os.path.basename(tablePath)
+        tableStat = os.stat(tablePath)
+        self.version = f"table {name} {tableStat.st_size} {tableStat.st_mtime_ns}"
+        serializedPath = os.path.join(PLATFORM_CACHE_DIR, f"{name}.pkl")
+        # reuse the pre-serialized table unless the table changed since
+        if os.path.exists(serializedPath) and os.path.getmtime(
+            serializedPath
+        ) >= os.path.getmtime(tablePath):
+            self.platform, self.table = pd.read_pickle(serializedPath)
+        else:
+            self.table = self.loadTable()
+            os.makedirs(PLATFORM_CACHE_DIR, exist_ok=True)
+            pd.to_pickle((self.platform, self.table), serializedPath)
+
+    def loadTable(self):
+        """ Parse the annotation table into a dataframe indexed by probe id with compact annotation columns. """
+        with openSeriesFile(self.tablePath) as f:
+            # skip the header of .annot and soft files up to the column names
+            for line in f:
+                if line.startswith(("^PLATFORM", "!Annotation_platform ")):
+                    self.platform = line.split("=", 1)[1].strip()
+                elif line.startswith("!platform_table_begin"):
+                    header = next(f)
+                    break
+                elif not line.startswith(("#", "!", "^")) and line.strip():
+                    header = line
+                    break
+            else:
+                raise ValueError(f"{self.tablePath} has no annotation table")
+            names = [
+                name.strip().strip('"') for name in header.rstrip("\n").split("\t")
+            ]
+            # find the columns of the table that hold each annotation
+            lowerNames = {name.lower(): name for name in names}
+            usecols = {}
+            for column, candidates in TABLE_COLUMNS.items():
+                for candidate in candidates:
+                    if candidate.lower() in lowerNames:
+                        usecols[lowerNames[candidate.lower()]] = column
+                        break
+            for column in ("affy_gene_probe_id", "Gene Name"):
+                if column not in usecols.values():
+                    raise ValueError(f"{self.tablePath} has no {column} column")
+            table = pd.read_csv(
+                f,
+                sep="\t",
+                header=None,
+                names=names,
+                usecols=list(usecols),
+                dtype=str,
+                quotechar='"',
+            )
+        table = table.rename(columns=usecols)
+        # drop the end marker of soft files and probes without a gene symbol
+        table = table[~table["affy_gene_probe_id"].str.startswith("!")]
+        table = table.dropna(subset=["Gene Name"])
+        table = table.drop_duplicates(subset="affy_gene_probe_id")
+        table = table.set_index("affy_gene_probe_id").reindex(
+            columns=ANNOTATION_COLUMNS[1:]
+        )
+        table["HG ID"] = pd.to_numeric(table["HG ID"], errors="coerce")
+        # annotations repeat a lot across probes, store them as categoricals
+        for column in ANNOTATION_COLUMNS[2:]:
+            table[column] = table[column].astype("category")
+        return table
+
+    def annotate(self, platform, probeIDs):
+        """ Annotate probeIDs by joining them against the annotation table. """
+        if self.platform is not None and platform not in (None, self.platform):
+            raise ValueError(
+                f"{self.tablePath} annotates {self.platform}, not {platform}"
+            )
+        annotateDf = self.table.reindex(pd.Index(probeIDs).drop_duplicates())
+        annotateDf = annotateDf.dropna(subset=["Gene Name"])
+        annotateDf.index.name = "affy_gene_probe_id"
+        return annotateDf.reset_index()
+
+
+def makeBackend(
+    platformTable=None,
+    useCache=True,
+    cacheTtl=None,
+    batchSize=1000,
+    concurrency=4,
+    retries=3,
+    url=None,
+):
+    """ Build a PlatformTableBackend for a table in infiles/ when one is given, a MyGeneBackend backed by the annotation cache (ttl in days) otherwise. """
+    # annotate offline from a platform table if one is given
+    if platformTable is not None:
+        return PlatformTableBackend(f"../infiles/{platformTable}")
+    # reuse annotations of probes seen in earlier runs unless told not to
+    cache = None
+    if useCache:
+        cache = AnnotationCache(ttl=None if cacheTtl is None else cacheTtl * 86400)
+    return MyGeneBackend(
+        cache,
+        batchSize=batchSize,
+        concurrency=concurrency,
+        retries=retries,
+        url=url,
+    )
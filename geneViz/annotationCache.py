@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""
+Module that keeps a persistent on disk cache of probe annotations so that probes
+already resolved for a platform are never sent to the annotation service again.
+
+Classes:
+    AnnotationCache: sqlite backed probe -> (symbol, name, refseq, homologene) cache
+    keyed by platform and probe id with time to live and versioned invalidation
+"""
+
+import os
+import sqlite3
+import time
+import pandas as pd
+
+CACHE_PATH = "../cache/annotations.sqlite"
+# bump whenever the fields stored per probe or the way they are derived change so
+# that entries written by an older version are treated as misses
+CACHE_VERSION = "1"
+# platform the probes of series whose header names none are cached under
+UNKNOWN_PLATFORM = ""
+# columns of an annotation dataframe in the order SeriesData uses them
+ANNOTATION_COLUMNS = [
+    "affy_gene_probe_id",
+    "HG ID",
+    "Gene Name",
+    "Gene Description",
+    "RefSeq",
+]
+
+
+class AnnotationCache:
+    """
+    Class to wrap a sqlite database of probe annotations.
+
+    Initialized: path of the sqlite database, time to live of an entry in seconds
+    (None to never expire), version that entries must match to be used, open
+    connection to the database, and hit and miss counters
+
+    Methods: lookup(): get the cached annotations of a list of probes and the probes
+    that still need to be resolved, store(): write freshly resolved annotations,
+    including probes the service could not find, clear(): drop cached entries,
+    stats(): hit and miss counters of this cache
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=None, version=CACHE_VERSION):
+        self.path = path
+        self.ttl = ttl
+        self.version = version
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS annotations (
+                platform TEXT NOT NULL,
+                probe TEXT NOT NULL,
+                homologene INTEGER,
+                symbol TEXT,
+                name TEXT,
+                refseq TEXT,
+                found INTEGER NOT NULL,
+                version TEXT NOT NULL,
+                fetched REAL NOT NULL,
+                PRIMARY KEY (platform, probe)
+            )
+            """
+        )
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, platform, probeIDs):
+        """ Return a dataframe of the cached annotations of probeIDs that are still valid and the list of probes that missed. """
+        platform = UNKNOWN_PLATFORM if platform is None else platform
+        query = "SELECT probe, homologene, symbol, name, refseq, found FROM annotations WHERE platform = ? AND version = ?"
+        params = [platform, self.version]
+        if self.ttl is not None:
+            query += " AND fetched >= ?"
+            params.append(time.time() - self.ttl)
+        cached = pd.read_sql_query(query, self.connection, params=params)
+        cached = cached.drop_duplicates(subset="probe").set_index("probe")
+        # vectorized membership test of the requested probes against the cache
+        requested = pd.Index(probeIDs).drop_duplicates()
+        isCached = requested.isin(cached.index)
+        missing = requested[~isCached].to_list()
+        self.hits += int(isCached.sum())
+        self.misses += len(missing)
+        # probes the service did not know about are cached too, but not returned
+        found = cached.loc[requested[isCached]]
+        found = found[found["found"] == 1].reset_index()
+        found = found.drop(columns="found")
+        found.columns = ANNOTATION_COLUMNS
+        return found, missing
+
+    def store(self, platform, annotations, notFound=()):
+        """ Write resolved annotations (a dataframe with ANNOTATION_COLUMNS) and probes that could not be found, under UNKNOWN_PLATFORM when platform is None. """
+        platform = UNKNOWN_PLATFORM if platform is None else platform
+        now = time.time()
+        rows = [
+            (
+                platform,
+                probe,
+                None if pd.isna(homologene) else int(homologene),
+                symbol,
+                name,
+                refseq,
+                1,
+                self.version,
+                now,
+            )
+            for probe, homologene, symbol, name, refseq in annotations[
+                ANNOTATION_COLUMNS
+            ].itertuples(index=False)
+        ]
+        rows += [
+            (platform, probe, None, None, None, None, 0, self.version, now)
+            for probe in notFound
+        ]
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self.connection.commit()
+
+    def clear(self, platform=None):
+        """ Drop every cached entry, or only those of a single platform. """
+        if platform is None:
+            self.connection.execute("DELETE FROM annotations")
+        else:
+            self.connection.execute(
+                "DELETE FROM annotations WHERE platform = ?", (platform,)
+            )
+        self.connection.commit()
+
+    def stats(self):
+        """ Hit and miss counters of this cache. """
+        return {"hits": self.hits, "misses": self.misses}
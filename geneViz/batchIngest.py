@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+"""
+Module that ingests a whole directory of series matrix files at once. Every file is
+parsed, annotated, combined and written by a pool of worker processes, one file per
+worker at a time, only redoing the stages whose inputs changed since the last
+ingest. Each worker builds its annotation backend once and reuses it for
+every file it is given, and all workers share the same on disk annotation cache, so
+probes of a platform resolved for one series are not queried again for the next.
+
+The sample types of every file come from a JSON manifest in infiles/ that maps file
+names, or shell style patterns of file names, to a list of sample types:
+
+    {"GSE460_series_matrix.txt": ["skin"], "GSE23006*": ["heart", "liver"]}
+
+Files are stored under the name of their series, so files of the same series (a .txt
+and a .txt.gz, or the same file name in two directories) are not ingested at all
+rather than overwriting each other from different workers.
+
+Functions:
+    readManifest(): read the file -> sample types manifest
+    sampleTypesOf(): sample types the manifest gives a file
+    findSeriesFiles(): series matrix files of a directory or glob in infiles/
+    ingestFile(): run the stale ingest stages of a single series file
+    ingestBatch(): ingest many series files across a process pool
+    printSummary(): print the timing and status of every ingested file
+"""
+
+import fnmatch
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from annotationBackend import makeBackend
+from ingestPipeline import STAGES, ingestSeries
+from seriesParser import seriesName
+
+INFILES_DIR = "../infiles"
+
+# annotation backend of a worker process, built once by _initWorker()
+_backend = None
+
+
+def readManifest(path):
+    """ Read a JSON manifest mapping file names or patterns to sample types, single types may be given as a string. """
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    return {
+        pattern: [types] if isinstance(types, str) else list(types)
+        for pattern, types in manifest.items()
+    }
+
+
+def sampleTypesOf(fileName, manifest, defaultTypes=None):
+    """ Sample types of a file, from an exact manifest entry, else the first matching pattern, else defaultTypes. """
+    if fileName in manifest:
+        return manifest[fileName]
+    for pattern, types in manifest.items():
+        if fnmatch.fnmatch(fileName, pattern):
+            return types
+    return defaultTypes
+
+
+def findSeriesFiles(pattern, infilesDir=INFILES_DIR):
+    """ Sorted names of the series matrix files in infiles/ matched by a glob, or of every series matrix file in a directory. """
+    path = os.path.join(infilesDir, pattern)
+    if os.path.isdir(path):
+        path = os.path.join(path, "*series_matrix*")
+    return sorted(
+        os.path.relpath(match, infilesDir)
+        for match in glob.glob(path)
+        if os.path.isfile(match)
+    )
+
+
+def _initWorker(backendOptions):
+    """ Build the annotation backend of a worker process. """
+    global _backend
+    _backend = makeBackend(**backendOptions)
+
+
+def ingestFile(
+    fileName, sampleTypes, output, policy="first", exportOptions=None, force=False
+):
+    """ Run the stale stages of the ingest of one series file with the backend of this worker, returning its name, status, seconds taken and the stages that ran or the error message. """
+    start = time.perf_counter()
+    try:
+        stages = ingestSeries(
+            fileName,
+            sampleTypes,
+            output,
+            _backend,
+            policy=policy,
+            exportOptions=exportOptions,
+            force=force,
+        )
+    except Exception as error:
+        return fileName, "failed", time.perf_counter() - start, repr(error)
+    ran = [stage for stage in STAGES if stages[stage] == "ran"]
+    if not ran:
+        return fileName, "fresh", time.perf_counter() - start, ""
+    message = "ran " + ", ".join(ran)
+    if "probes" in stages:
+        message += f"; {stages['probes']}"
+    return fileName, "ok", time.perf_counter() - start, message
+
+
+def ingestBatch(
+    fileNames,
+    manifest,
+    output,
+    defaultTypes=None,
+    jobs=None,
+    policy="first",
+    exportOptions=None,
+    force=False,
+    **options,
+):
+    """ Ingest every file across a pool of jobs worker processes (one per core by default), collapsing probes with policy, exporting with exportOptions and skipping what is up to date unless force is set, and return a list of (name, status, seconds, message) in completion order. Files of the same series are skipped. Other keyword arguments are passed on to makeBackend(). """
+    results = []
+    jobsToRun = []
+    # files stored under the same series name would overwrite each other
+    fileNames = list(dict.fromkeys(fileNames))
+    series = {}
+    for fileName in fileNames:
+        series.setdefault(seriesName(fileName), []).append(fileName)
+    for fileName in fileNames:
+        others = [other for other in series[seriesName(fileName)] if other != fileName]
+        if others:
+            message = f"same series {seriesName(fileName)} as {', '.join(others)}"
+            results.append((fileName, "skipped", 0.0, message))
+            continue
+        sampleTypes = sampleTypesOf(os.path.basename(fileName), manifest, defaultTypes)
+        if sampleTypes is None:
+            results.append((fileName, "skipped", 0.0, "no sample types in manifest"))
+        else:
+            jobsToRun.append((fileName, sampleTypes))
+    # build the backend once up front, so bad options fail before any worker starts
+    # and a platform table is pre-serialized once rather than by every worker
+    makeBackend(**options)
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_initWorker, initargs=(options,)
+    ) as executor:
+        futures = [
+            executor.submit(
+                ingestFile,
+                fileName,
+                sampleTypes,
+                output,
+                policy,
+                exportOptions,
+                force,
+            )
+            for fileName, sampleTypes in jobsToRun
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            print(f"{result[1]:>7} {result[2]:8.1f}s  {result[0]}", flush=True)
+            results.append(result)
+    return results
+
+
+def printSummary(results, seconds):
+    """ Print the status and time of every file followed by totals. """
+    print()
+    print(f"{'status':>7} {'seconds':>9}  file")
+    for fileName, status, taken, message in sorted(results):
+        line = f"{status:>7} {taken:9.1f}  {fileName}"
+        print(f"{line}  {message}" if message else line)
+    counts = {}
+    for result in results:
+        counts[result[1]] = counts.get(result[1], 0) + 1
+    totals = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(f"{len(results)} files in {seconds:.1f}s: {totals}")
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+
+"""
+Module that benchmarks the series matrix parser against the original readlines and
+regex based parser. Every measurement runs in a fresh process so that the reported
+peak resident memory belongs to that parser alone.
+
+With --pipeline it benchmarks the whole ingest and the data preparation of the
+visualizer instead, on a synthetic series matrix modeled on GSE460 of a chosen
+number of genes, samples per sample type and sample types, annotated offline by a
+synthetic backend. The series is ingested in a scratch copy of the folder
+structure (infiles, outfiles, data, cache) so nothing real is touched, and every
+stage runs in its own process, starting from the state the stage before it left:
+
+    parse: SeriesData reading the series matrix
+    annotate: SeriesData.annotate() with the synthetic backend
+    combine: SeriesData.combineDataFrame()
+    export: SeriesData.dataframeOutputter(), storing the datasets and a csv
+    view: what specifyDataframes() of the visualizer does for a gene list
+    query: query.query() of the gene list across the datasets
+
+The wall time and peak RSS of every stage are printed and written as JSON
+(--results), and compared against an earlier results file (--baseline): a stage
+that became slower or bigger than the baseline by more than the threshold (20% by
+default) is reported as a regression and the benchmark exits with status 1.
+
+It also checks the startup budget of the command line: with --startup, parsing the
+command line, printing the version and the help of every subcommand must finish
+within a budget (0.5 s by default) without importing pandas, numpy, pyarrow,
+mygene, matplotlib or streamlit, and the check fails with exit status 1 otherwise.
+
+Classes:
+    SyntheticBackend: annotation backend that annotates synthetic probe ids offline
+
+Functions:
+    writeSyntheticSeries(): write a synthetic series matrix modeled on GSE460
+    scaleSeriesFile(): write a copy of a series matrix file with its table repeated
+    legacyParse(): original parser that reads the whole file and splits every line
+    streamingParse(): streaming parser from seriesParser
+    runIsolated(): run a function in a fresh process and return what it returned
+    measure(): run a parser in a fresh process and return its wall time and peak RSS
+    measureStartup(): wall time and heavy imports of a command line invocation
+    checkStartup(): whether every light invocation stays within the startup budget
+    measureStage(): run a pipeline stage in a fresh process, its wall time and peak RSS
+    benchmarkPipeline(): wall time and peak RSS of every stage on a synthetic series
+    compareResults(): regressions of benchmark results against a baseline
+    main(): command line entry point for running the benchmark
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import numpy as np
+import pandas as pd
+from annotationBackend import AnnotationBackend
+from annotationCache import ANNOTATION_COLUMNS
+from commandLineParse import REGRESSION_THRESHOLD, STARTUP_BUDGET, addBenchArguments
+from seriesParser import TABLE_BEGIN, openSeriesFile, parseSeriesMatrix
+
+# timepoints in hours of the samples of GSE460, cycled through by synthetic series
+SYNTHETIC_HOURS = (0, 2, 72, 336)
+SYNTHETIC_TYPES = ("skin", "heart", "liver", "muscle", "lung", "kidney", "brain")
+# share of the genes of a synthetic series that are measured by two probes
+DUPLICATE_PROBES = 0.2
+# share of the expression values of a synthetic series that are missing
+MISSING_VALUES = 0.001
+PIPELINE_STAGES = ("parse", "annotate", "combine", "export", "view", "query")
+# differences below these are noise rather than regressions
+MIN_SECONDS = 0.05
+MIN_MB = 10
+
+
+def writeSyntheticSeries(path, genes, samples, sampleTypes, seed=0):
+    """ Write a series matrix modeled on GSE460 with genes genes (a share of them measured by two probes) and samples samples of every sample type, titled Xhrs_replicateY (with the sample type in the title when there are several) over the timepoints of GSE460. Return the sample titles. """
+    rng = np.random.default_rng(seed)
+    titles, sources = [], []
+    for sampleType in sampleTypes:
+        for i in range(samples):
+            hours = SYNTHETIC_HOURS[i % len(SYNTHETIC_HOURS)]
+            replicate = i // len(SYNTHETIC_HOURS) + 1
+            typeName = f"_{sampleType}" if len(sampleTypes) > 1 else ""
+            titles.append(f"{hours}hrs{typeName}_replicate{replicate}")
+            sources.append(f"Murine {sampleType}")
+    gsmIDs = [f"GSM{100000 + i}" for i in range(len(titles))]
+    # probe ids <gene>_<probe>_at, the second probe of every duplicated gene last
+    duplicated = np.flatnonzero(rng.random(genes) < DUPLICATE_PROBES)
+    probes = [f'"{gene}_1_at"' for gene in range(genes)]
+    probes += [f'"{gene}_2_at"' for gene in duplicated]
+    values = rng.lognormal(6, 1.5, (len(probes), len(titles))).round(1)
+    values[rng.random(values.shape) < MISSING_VALUES] = np.nan
+
+    def row(key, fields):
+        return key + "\t" + "\t".join(f'"{field}"' for field in fields) + "\n"
+
+    with open(path, "w") as out:
+        out.write('!Series_title\t"Synthetic benchmark series"\n')
+        out.write('!Series_geo_accession\t"GSE0"\n')
+        out.write(f'!Series_sample_id\t"{" ".join(gsmIDs)} "\n')
+        out.write('!Series_platform_id\t"GPL81"\n\n')
+        out.write(row("!Sample_title", titles))
+        out.write(row("!Sample_geo_accession", gsmIDs))
+        out.write(row("!Sample_source_name_ch1", sources))
+        out.write(row("!Sample_platform_id", ["GPL81"] * len(titles)))
+        out.write(f"{TABLE_BEGIN}\n")
+        out.write(row('"ID_REF"', gsmIDs))
+        table = pd.DataFrame(values, index=probes)
+        table.to_csv(out, sep="\t", header=False, quoting=3, na_rep="null")
+        out.write("!series_matrix_table_end\n")
+    return titles
+
+
+class SyntheticBackend(AnnotationBackend):
+    """
+    Class to annotate the probes of a synthetic series offline, standing in for
+    mygene in benchmarks so that they neither need the network nor measure it.
+
+    Initialized: version of the annotations, constant
+
+    Methods: annotate(): annotate probe ids <gene>_<probe>_at with the gene symbol
+    Gene<gene>, a description, refseq id and homologene id derived from the gene,
+    leaving every hundredth gene unannotated as real platforms do
+    """
+
+    version = "synthetic 1"
+
+    def annotate(self, platform, probeIDs):
+        """ Annotate probeIDs of a synthetic series, returning a dataframe with ANNOTATION_COLUMNS. """
+        probeIDs = pd.Index(probeIDs).drop_duplicates()
+        genes = probeIDs.str.split("_").str[0].astype("int64").to_numpy()
+        annotated = genes % 100 != 99
+        probeIDs, genes = probeIDs[annotated], genes[annotated]
+        symbols = pd.Index(genes).astype(str)
+        return pd.DataFrame(
+            {
+                "affy_gene_probe_id": probeIDs,
+                "HG ID": genes + 1,
+                "Gene Name": "Gene" + symbols,
+                "Gene Description": "synthetic gene " + symbols,
+                "RefSeq": "NM_" + symbols.str.zfill(6),
+            },
+            columns=ANNOTATION_COLUMNS,
+        )
+
+
+def scaleSeriesFile(filenamePath, outPath, scale):
+    """ Write a copy of a series matrix with the data table repeated scale times under new probe ids. """
+    with openSeriesFile(filenamePath) as f:
+        lines = f.readlines()
+    begin = next(i for i, line in enumerate(lines) if line.startswith(TABLE_BEGIN))
+    header, tableHeader = lines[: begin + 1], lines[begin + 1]
+    rows = [line for line in lines[begin + 2 :] if not line.startswith("!")]
+    with open(outPath, "w") as out:
+        out.writelines(header)
+        out.write(tableHeader)
+        for copy in range(scale):
+            # suffix every probe id so that the scaled table has unique probes
+            for row in rows:
+                probe, rest = row.split("\t", 1)
+                out.write(f'{probe[:-1]}_{copy}"\t{rest}')
+        out.write("!series_matrix_table_end\n")
+
+
+def legacyParse(filenamePath):
+    """ Parse a series matrix the way SeriesData originally did, kept as the benchmark reference. """
+    reCompiled = re.compile(r"^!Sample(?=_title).*|^[^!I].*")
+    with open(filenamePath, "r") as f:
+        tableData = f.readlines()
+        filterData = list(filter(reCompiled.match, tableData))
+    cleanedData = list(map(lambda x: x.split("\t"), filterData))
+    df = pd.DataFrame(cleanedData[3:], columns=cleanedData[1])
+    df.rename(columns={"!Sample_title": "affy_gene_probe_id"}, inplace=True)
+    df["affy_gene_probe_id"] = df["affy_gene_probe_id"].str.replace('"', "")
+    return df
+
+
+def streamingParse(filenamePath):
+    """ Parse a series matrix with the streaming parser. """
+    return parseSeriesMatrix(filenamePath).df
+
+
+PARSERS = {"legacy": legacyParse, "streaming": streamingParse}
+# invocations of main.py that must start without the heavy modules
+STARTUP_COMMANDS = (["-v"], ["--help"], ["ingest", "--help"], ["convert", "--help"])
+STARTUP_COMMANDS += (["serve", "--help"], ["query", "--help"], ["bench", "--help"])
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "mygene", "matplotlib", "streamlit")
+
+
+def _isolated(target, args, results):
+    """ Child process body of runIsolated(): put whether target(*args) returned and what it returned, or the traceback of what it raised, on results. """
+    try:
+        results.put((True, target(*args)))
+    except BaseException:
+        results.put((False, traceback.format_exc()))
+
+
+def runIsolated(target, *args):
+    """ Run target(*args) in a fresh process and return what it returned, so its peak RSS is its own. Raise RuntimeError with the traceback of the child when target raised, or with its exit code when it died without answering, killed for running out of memory for instance. """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_isolated, args=(target, args, results))
+    process.start()
+    try:
+        while True:
+            try:
+                returned, value = results.get(timeout=1)
+                break
+            except queue.Empty:
+                # the result may have been put just before the child exited
+                if not process.is_alive() and results.empty():
+                    process.join()
+                    raise RuntimeError(
+                        f"{target.__name__} died with exit code {process.exitcode}"
+                    )
+    finally:
+        process.join()
+    if not returned:
+        raise RuntimeError(f"{target.__name__} failed in its process:\n{value}")
+    return value
+
+
+def _runParser(parserName, filenamePath):
+    """ Child process body: run one parser and return its wall time and peak RSS. """
+    start = time.perf_counter()
+    df = PARSERS[parserName](filenamePath)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is reported in kilobytes on linux
+    peakMB = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return seconds, peakMB, len(df)
+
+
+def measure(parserName, filenamePath):
+    """ Run a parser in a fresh process and return (seconds, peak RSS in MB, rows). """
+    return runIsolated(_runParser, parserName, filenamePath)
+
+
+def measureStartup(arguments, repeats=5):
+    """ Median wall time in seconds of running main.py with arguments in a fresh python, and the sorted heavy modules it imported. """
+    command = [sys.executable, "-X", "importtime", "main.py"] + list(arguments)
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run = subprocess.run(command, cwd=directory, capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+    # -X importtime lists every imported module on stderr as "import time: ... | name"
+    imported = {
+        line.rsplit("|", 1)[1].strip().split(".")[0]
+        for line in run.stderr.splitlines()
+        if line.startswith("import time:") and "|" in line
+    }
+    return statistics.median(times), sorted(imported.intersection(HEAVY_MODULES))
+
+
+def checkStartup(budget=STARTUP_BUDGET, repeats=5):
+    """ Print the startup time of every light invocation of main.py and return whether all of them stayed within budget seconds without importing a heavy module. """
+    passed = True
+    for arguments in STARTUP_COMMANDS:
+        seconds, heavy = measureStartup(arguments, repeats)
+        ok = seconds <= budget and not heavy
+        passed = passed and ok
+        print(
+            f"{'ok' if ok else 'FAIL':>4}  main.py {' '.join(arguments):<16}"
+            f"{seconds:6.3f} s  {', '.join(heavy) or 'no heavy imports'}"
+        )
+    return passed
+
+
+def _runStage(stage, sandbox, options):
+    """ Child process body: run one stage of the pipeline benchmark in the scratch folder structure sandbox, from the state the stage before it saved, and return its wall time and peak RSS. """
+    # imported before moving into the sandbox, which holds no modules
+    import fileCleaner as fc
+    from datasetCache import datasetVersions
+    from datasetStore import listDatasets
+    from query import geneView, query
+
+    os.chdir(os.path.join(sandbox, "work"))
+    statePath = "../cache/state.pkl"
+    if stage in ("annotate", "combine", "export"):
+        fileClean = pd.read_pickle(statePath)
+    datasets = listDatasets() if stage in ("view", "query") else None
+    start = time.perf_counter()
+    if stage == "parse":
+        fileClean = fc.SeriesData(True, options["fileName"], options["sampleTypes"])
+    elif stage == "annotate":
+        fileClean.annotate(SyntheticBackend())
+    elif stage == "combine":
+        fileClean.combineDataFrame(options["policy"])
+    elif stage == "export":
+        fileClean.dataframeOutputter()
+    elif stage == "view":
+        # as specifyDataframes() does for the datasets the user selected
+        datasetVersions(datasets)
+        for name in datasets:
+            geneView(name, options["viewGenes"], "average")
+    else:
+        query(options["viewGenes"], datasets, "average")
+    seconds = time.perf_counter() - start
+    # ru_maxrss is reported in kilobytes on linux
+    peakMB = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if stage in ("parse", "annotate", "combine"):
+        pd.to_pickle(fileClean, statePath)
+    return seconds, peakMB
+
+
+def measureStage(stage, sandbox, options):
+    """ Run a stage of the pipeline benchmark in a fresh process and return (seconds, peak RSS in MB). """
+    return runIsolated(_runStage, stage, sandbox, options)
+
+
+def benchmarkPipeline(
+    genes, samples, types, viewGenes=100, repeats=3, policy="first", seed=0
+):
+    """ Ingest a synthetic series of genes genes and samples samples of each of types sample types in a scratch folder structure, stage by stage repeats times, and return the results: the configuration and, for every stage, its median wall time and peak RSS. """
+    sampleTypes = list(SYNTHETIC_TYPES[:types])
+    sampleTypes += [f"type{i}" for i in range(len(sampleTypes), types)]
+    config = {"genes": genes, "samples": samples, "types": types}
+    config.update({"viewGenes": viewGenes, "policy": policy, "seed": seed})
+    options = {"fileName": "synthetic_series_matrix.txt", "policy": policy}
+    options["sampleTypes"] = sampleTypes
+    # genes spread over the whole series, as a user would pick them
+    picked = np.linspace(0, genes - 1, min(viewGenes, genes)).astype("int64")
+    options["viewGenes"] = [f"Gene{gene}" for gene in picked]
+    stages = {}
+    with tempfile.TemporaryDirectory() as sandbox:
+        for folder in ("work", "infiles", "outfiles", "data", "cache"):
+            os.makedirs(os.path.join(sandbox, folder))
+        writeSyntheticSeries(
+            os.path.join(sandbox, "infiles", options["fileName"]),
+            genes,
+            samples,
+            sampleTypes,
+            seed,
+        )
+        for stage in PIPELINE_STAGES:
+            runs = [measureStage(stage, sandbox, options) for _ in range(repeats)]
+            stages[stage] = {
+                "seconds": statistics.median(seconds for seconds, _ in runs),
+                "peakMB": statistics.median(peakMB for _, peakMB in runs),
+            }
+    return {"config": config, "python": sys.version.split()[0], "stages": stages}
+
+
+def compareResults(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """ Describe every stage whose wall time or peak RSS grew by more than threshold (a fraction) over the baseline results, ignoring differences below MIN_SECONDS and MIN_MB, raising ValueError when the two were run with different configurations. """
+    if results["config"] != baseline["config"]:
+        raise ValueError(
+            f"baseline was run with {baseline['config']}, not {results['config']}"
+        )
+    regressions = []
+    for stage, measured in results["stages"].items():
+        if stage not in baseline["stages"]:
+            continue
+        for metric, floor in (("seconds", MIN_SECONDS), ("peakMB", MIN_MB)):
+            new, old = measured[metric], baseline["stages"][stage][metric]
+            if new > old * (1 + threshold) and new - old > floor:
+                regressions.append(
+                    f"{stage} {metric}: {old:.3f} -> {new:.3f} (+{new / old - 1:.0%})"
+                )
+    return regressions
+
+
+def main(argv=None):
+    """ Benchmark both parsers on a scaled copy of a file in infiles/ and print the results, or run the startup or pipeline benchmark, with the arguments of argv (those of the command line by default). """
+    parser = argparse.ArgumentParser(description="Benchmark the series matrix parser")
+    addBenchArguments(parser)
+    args = parser.parse_args(argv)
+    if args.startup:
+        sys.exit(0 if checkStartup(args.startup_budget) else 1)
+    if args.pipeline:
+        # read first, the results may be written over the baseline
+        baseline = None
+        if args.baseline is not None:
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+        results = benchmarkPipeline(
+            args.genes, args.samples, args.types, args.view_genes, args.repeats
+        )
+        config = results["config"]
+        print(
+            f"{config['genes']} genes x {config['samples']} samples x "
+            f"{config['types']} types, median of {args.repeats}"
+        )
+        for stage, measured in results["stages"].items():
+            print(
+                f"{stage:>10}: {measured['seconds']:8.3f} s  "
+                f"peak RSS {measured['peakMB']:8.1f} MB"
+            )
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, "w") as f:
+            json.dump(results, f, indent=1)
+        if baseline is not None:
+            try:
+                regressions = compareResults(results, baseline, args.threshold)
+            except ValueError as error:
+                parser.error(str(error))
+            for regression in regressions:
+                print(f"regression: {regression}")
+            if regressions:
+                sys.exit(1)
+            print(f"no regression over {args.baseline}")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scaledPath = os.path.join(tmp, "scaled_series_matrix.txt")
+        scaleSeriesFile(f"../infiles/{args.input}", scaledPath, args.scale)
+        sizeMB = os.path.getsize(scaledPath) / 1024 ** 2
+        print(f"{args.input} x{args.scale}: {sizeMB:.1f} MB")
+        for parserName in PARSERS:
+            seconds, peakMB, rows = measure(parserName, scaledPath)
+            print(
+                f"{parserName:>10}: {seconds:8.2f} s  peak RSS {peakMB:8.1f} MB  {rows} rows"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,160 @@
 
 """
 Module that makes use of argparse to create command line parsing class to deal with
-command line arguments.
+command line arguments. The program is run through subcommands:
+
+    ingest: annotate series matrix files and store them as datasets
+    convert: store a pre cleaned csv of infiles/ as a dataset
+    serve: start the visualizer, or the query server with --api
+    query: write the expression of genes in datasets as csv, see query.py
+    bench: run the benchmarks, see benchmark.py
+
+Options after serve are passed on to streamlit, or to queryServer.py with --api. The
+options of query.py and benchmark.py are defined here as well, so the help of query
+and bench loads neither module. The flags of older versions (-a to
+annotate, -s to see the visualizer, neither to convert, ignoring the ingest options
+as older versions did) are still understood.
+Nothing but argparse is imported here, so parsing costs nothing.
 
 Classes:
     CommandLineParse: class to parse out command line arguments provided by user
+
+Functions:
+    legacyArguments(): subcommand arguments of the flags of older versions
+    addQueryArguments(): add the options of query.py to a parser
+    addBenchArguments(): add the options of benchmark.py to a parser
 """
 
 import argparse
+import sys
+from ingestOptions import COMPRESSIONS, FLOAT_FORMAT, FORMATS, POLICIES
+
+SUBCOMMANDS = ("ingest", "convert", "serve", "query", "bench")
+# subcommands whose unknown options are passed on to the module that runs them
+FORWARDING = ("serve",)
+# defaults of the benchmarks, see benchmark.py
+STARTUP_BUDGET = 0.5
+RESULTS_PATH = "../cache/benchmark/results.json"
+REGRESSION_THRESHOLD = 0.2
+# short flags of older versions that take no value, and may be combined as in -ao
+LEGACY_SWITCHES = "asof"
+
+
+def _splitSwitches(argv):
+    """ Arguments with combined short flags split, -ao into -a -o and -ai x into -a -i x. """
+    split = []
+    for arg in argv:
+        while len(arg) > 2 and arg[0] == "-" and arg[1] in LEGACY_SWITCHES:
+            split.append(arg[:2])
+            arg = "-" + arg[2:]
+        split.append(arg)
+    return split
+
+
+def legacyArguments(argv):
+    """ Arguments of the subcommand that the -a and -s flags of older versions meant, returned unchanged when they already name a subcommand, raising ValueError when both are given. """
+    if not argv or argv[0] in SUBCOMMANDS + ("-h", "--help", "-v", "--version"):
+        return list(argv)
+    argv = _splitSwitches(argv)
+    see = "-s" in argv or "--see" in argv
+    annotate = "-a" in argv or "--annotate" in argv
+    if see and annotate:
+        raise ValueError("-a/--annotate and -s/--see cannot be used together")
+    if see:
+        return ["serve"] + [arg for arg in argv if arg not in ("-s", "--see")]
+    if annotate:
+        return ["ingest"] + [arg for arg in argv if arg not in ("-a", "--annotate")]
+    return ["convert"] + list(argv)
+
+
+def addQueryArguments(parser):
+    """ Add the options of query.py to a parser. """
+    parser.add_argument(
+        "-g", "--genes", default="", help="Gene names, separated by commas"
+    )
+    parser.add_argument(
+        "--genes-file", help="File with one gene name per line, added to --genes"
+    )
+    parser.add_argument(
+        "-d",
+        "--dataset",
+        action="append",
+        help="Name of a dataset to query, may be repeated, every dataset by default",
+    )
+    parser.add_argument(
+        "-r",
+        "--replicates",
+        default="average",
+        help="replicateN, all, average, or one of mean, median, sd, sem, n",
+    )
+    parser.add_argument(
+        "-o", "--output", help="Path of the csv to write, standard output by default"
+    )
+
+
+def addBenchArguments(parser):
+    """ Add the options of benchmark.py to a parser. """
+    parser.add_argument(
+        "-i", "--input", default="GSE460_series_matrix.txt", help="File in infiles/"
+    )
+    parser.add_argument(
+        "--scale", type=int, default=100, help="Number of times to repeat the table"
+    )
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="Check the startup time and imports of the command line instead",
+    )
+    parser.add_argument(
+        "--startup-budget",
+        type=float,
+        default=STARTUP_BUDGET,
+        help="Seconds main.py may take to start for --startup",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Benchmark every ingest stage and the data preparation of the visualizer on a synthetic series instead",
+    )
+    parser.add_argument(
+        "--genes", type=int, default=20000, help="Genes of the synthetic series"
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=12,
+        help="Samples of every sample type of the synthetic series",
+    )
+    parser.add_argument(
+        "--types", type=int, default=1, help="Sample types of the synthetic series"
+    )
+    parser.add_argument(
+        "--view-genes",
+        type=int,
+        default=100,
+        help="Genes the view and query stages ask for",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="Times every stage is run, the median is reported",
+    )
+    parser.add_argument(
+        "--results",
+        default=RESULTS_PATH,
+        help="JSON file the results of --pipeline are written to",
+    )
+    parser.add_argument(
+        "--baseline",
+        help="JSON results of an earlier --pipeline run to compare against",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="Growth over the baseline, as a fraction, reported as a regression",
+    )
 
 
 class CommandLineParse:
@@ -16,57 +163,212 @@ class CommandLineParse:
     Class to act as a wrapper for argparse and to initialize all the command line
     arguments for this program.
 
-    Initialized: argument to toggle streamlit app to start, argument to indicate
-    input file needs to annotated, argument to indicate input file should be output
-    to csv, argument to indicate what input file is, argument to display version
-    information, argument to hold sample types within dataset variable to hold
-    value of all arguments
+    Initialized: subcommand to run, argument to indicate input file needs to be
+    output to csv, arguments to choose the format, compression and float format of
+    that output, argument to indicate what input file is, arguments to ingest a
+    directory of input files in parallel with a manifest of their sample types,
+    argument to choose how probes of the same gene are collapsed, argument to redo
+    ingest stages that are up to date, argument to annotate from a local platform
+    table, arguments to batch, parallelize, retry and redirect mygene requests,
+    arguments to disable and expire the annotation cache, argument to start the
+    query server instead of the visualizer, argument to display version information,
+    argument to hold sample types within dataset variable to hold value of all
+    arguments, arguments of the subcommand (after mapping the flags of older
+    versions), and list of the arguments passed on to streamlit or the query server
     """
 
-    def __init__(self):
+    def __init__(self, argv=None):
         # initialize argparse object
         self.parser = argparse.ArgumentParser(
             description="A simple program to annotate microarray data with gene names, symbols, refseq ids, and homologene ids as well as visualize gene concentrations.",
             add_help=True,
             prefix_chars="-",
         )
-        # toggle streamlit app
+        # version information
         self.parser.add_argument(
-            "-s",
-            "--see",
-            action="store_true",
-            help="Toggle gene comparison visualizer",
+            "-v", "--version", action="version", version="gene displayer 0.1.0"
         )
-        # file needs to be annotated
-        self.parser.add_argument(
-            "-a",
-            "--annotate",
+        subparsers = self.parser.add_subparsers(
+            dest="command", metavar="{" + ",".join(SUBCOMMANDS) + "}"
+        )
+        subparsers.required = True
+        ingest = subparsers.add_parser(
+            "ingest",
+            help="Annotate series matrix files with gene symbol, gene description, homologene id, and refseq id and store them",
+        )
+        convert = subparsers.add_parser(
+            "convert", help="Store a pre cleaned csv of infiles/ as a dataset"
+        )
+        # name of the csv to store
+        convert.add_argument(
+            "-i",
+            "--input",
+            action="store",
+            required=True,
+            help="Csv in infiles/ to be stored",
+        )
+        serve = subparsers.add_parser(
+            "serve",
+            help="Start the gene comparison visualizer, other options are passed on to streamlit",
+        )
+        # start the shared query server instead
+        serve.add_argument(
+            "--api",
             action="store_true",
-            help="Annotate given file with gene symbol, gene description, homologene id, and refseq id",
+            help="Start the query server instead, other options are passed on to queryServer.py",
+        )
+        # the options of query.py and benchmark.py, whose help needs neither module
+        addQueryArguments(
+            subparsers.add_parser(
+                "query", help="Write the expression of genes in datasets as csv"
+            )
         )
+        addBenchArguments(subparsers.add_parser("bench", help="Run the benchmarks"))
         # file needs to be output as csv
-        self.parser.add_argument(
+        ingest.add_argument(
             "-o",
             "--output",
             action="store_true",
             help="Output annotated file as csv",
         )
+        # how the output files are written
+        ingest.add_argument(
+            "--format",
+            action="store",
+            choices=FORMATS,
+            default="csv",
+            help="Format of the files written to outfiles/ by --output",
+        )
+        ingest.add_argument(
+            "--compression",
+            action="store",
+            choices=COMPRESSIONS,
+            default="none",
+            help="Compression of the csv and tsv files written by --output, or codec of parquet ones",
+        )
+        ingest.add_argument(
+            "--float-format",
+            action="store",
+            default=FLOAT_FORMAT,
+            help="printf style format of the expression values written by --output",
+        )
         # name of input file
-        self.parser.add_argument(
+        ingest.add_argument(
             "-i",
             "--input",
             action="store",
-            help="Input file to be annotated or stored",
+            help="Series matrix file in infiles/ to be annotated and stored",
+        )
+        # directory or glob of series files to ingest together
+        ingest.add_argument(
+            "-b",
+            "--batch",
+            action="store",
+            default=None,
+            help="Directory or glob in infiles/ of series matrix files to annotate and store in parallel",
+        )
+        # sample types of every file of a batch
+        ingest.add_argument(
+            "-m",
+            "--manifest",
+            action="store",
+            default=None,
+            help="JSON file in infiles/ mapping file names or patterns to their sample types, for --batch",
+        )
+        ingest.add_argument(
+            "-j",
+            "--jobs",
+            action="store",
+            type=int,
+            default=None,
+            help="Number of worker processes of a batch (one per core by default)",
+        )
+        # how the probes of a gene are collapsed into one row
+        ingest.add_argument(
+            "-c",
+            "--collapse",
+            action="store",
+            choices=POLICIES,
+            default="first",
+            help="How the probes of a gene are collapsed into one row: values of the first probe, of the probe with the highest mean or variance, or the mean or median of all of them",
+        )
+        # redo every ingest stage even when nothing changed
+        ingest.add_argument(
+            "-f",
+            "--force",
+            action="store_true",
+            help="Parse, annotate, combine and store again even if the input and options did not change",
         )
         # types within sample
-        self.parser.add_argument(
+        ingest.add_argument(
             "-t",
             "--types",
             action="append",
             help="Input all the different types of samples included in data",
         )
-        # version information
-        self.parser.add_argument(
-            "-v", "--version", action="version", version="gene displayer 0.1.0"
+        # local platform annotation table to annotate with instead of mygene
+        ingest.add_argument(
+            "-p",
+            "--platform-table",
+            action="store",
+            default=None,
+            help="GPL annotation table in infiles/ to annotate from offline instead of querying mygene",
+        )
+        # how the remote annotation requests are batched
+        ingest.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            default=1000,
+            help="Number of probes sent to mygene per request",
+        )
+        ingest.add_argument(
+            "--concurrency",
+            action="store",
+            type=int,
+            default=4,
+            help="Maximum number of mygene requests in flight at once",
+        )
+        ingest.add_argument(
+            "--retries",
+            action="store",
+            type=int,
+            default=3,
+            help="Number of times a failed mygene request is retried",
+        )
+        # alternative mygene server, such as a local mirror
+        ingest.add_argument(
+            "--annotation-url",
+            action="store",
+            default=None,
+            help="Url of the mygene api to query instead of the public one",
+        )
+        # skip the on disk annotation cache
+        ingest.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Do not read or write the on disk probe annotation cache",
+        )
+        # how long cached annotations stay valid
+        ingest.add_argument(
+            "--cache-ttl",
+            action="store",
+            type=float,
+            default=None,
+            help="Number of days a cached probe annotation stays valid (never expires by default)",
         )
-        self.args = self.parser.parse_args()
+        if argv is None:
+            argv = sys.argv[1:]
+        try:
+            arguments = legacyArguments(argv)
+        except ValueError as error:
+            self.parser.error(str(error))
+        if arguments[:1] == ["convert"] and argv[:1] != ["convert"]:
+            # older versions took every ingest option without -a and ignored it
+            inputFile = ingest.parse_args(argv).input
+            arguments = ["convert"] + (["-i", inputFile] if inputFile else [])
+        self.arguments = arguments
+        self.args, self.forwarded = self.parser.parse_known_args(arguments)
+        # only the subcommands that pass options on may be given unknown ones
+        if self.forwarded and self.args.command not in FORWARDING:
+            self.parser.error("unrecognized arguments: " + " ".join(self.forwarded))
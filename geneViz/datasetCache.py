@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+
+"""
+Module that caches loaded datasets and the frames derived from them across reruns
+of the streamlit app. The cache lives at module level, so it survives reruns and is
+shared by every session of the app process; it is thread safe, and evicts the
+least recently used entries once the memory it holds goes over its budget (set in
+MB with the GENEVIZ_CACHE_MB environment variable, 512 by default).
+
+Datasets are keyed by their name and the modification time of their files, so a
+dataset rewritten by an ingest is loaded again on the next rerun. Cached values are
+shared between sessions and must not be modified in place.
+
+Classes:
+    LRUCache: thread safe least recently used cache with a memory budget
+    LoadedDataset: annotations and memory mapped expression matrix of a dataset
+
+Functions:
+    sizeOf(): number of bytes a cached value holds in memory
+    datasetVersion(): modification time of the files of a dataset
+    datasetVersions(): dataset -> version map of datasets
+    loadDataset(): cached LoadedDataset of a dataset
+    loadSearchIndex(): cached SearchIndex of a dataset
+    loadHomologs(): cached homologene id -> gene map of a dataset
+    geneRows(): cached rows of a list of genes of a dataset
+    geneSamples(): cached expression of a selection of samples of a list of genes
+    geneStatistic(): cached per timepoint replicate statistic of a list of genes
+    cachedView(): cached frame derived from a dataset
+"""
+
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from datasetStore import (
+    DATA_DIR,
+    GENE_COLUMNS,
+    LABELS_FILE,
+    MATRIX_FILE,
+    TABLE_FILE,
+    datasetPath,
+    openAggregates,
+    openMatrix,
+    readDataset,
+    readSchema,
+)
+from geneIndex import HOMOLOG_SIDECAR_FILE, GeneIndex
+from geneIndex import geneRows as rowOffsets
+from replicates import STATISTICS, aggregate, averageColumns
+from searchIndex import SEARCH_FILE, SearchIndex, buildSearchIndex
+
+CACHE_BUDGET_MB = float(os.environ.get("GENEVIZ_CACHE_MB", 512))
+
+
+def sizeOf(value):
+    """ Number of bytes a cached value holds in memory, memory maps are backed by the page cache and count as nothing. """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.memmap):
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, SearchIndex):
+        # the keys and genes are short python strings, counted at a flat rate
+        return 3 * 100 * len(value.keys)
+    if isinstance(value, LoadedDataset):
+        return sizeOf(value.annotations) + sizeOf(value.schema.samples)
+    if isinstance(value, (tuple, list)):
+        return sum(sizeOf(item) for item in value)
+    return 0
+
+
+class LRUCache:
+    """
+    Class for a thread safe least recently used cache bounded by the memory its
+    values hold.
+
+    Initialized: memory budget in bytes, ordered dictionary of key -> (value, size)
+    from least to most recently used, number of bytes currently held, lock guarding
+    the dictionary, and hit and miss counters
+
+    Methods: get(): return the cached value of a key, building and caching it with
+    a function on a miss, clear(): drop every entry
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, builder):
+        """ Return the value cached under key, calling builder() to create it on a miss. """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+        # build outside of the lock so other sessions are not blocked meanwhile
+        value = builder()
+        size = sizeOf(value)
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            # evict least recently used entries, always keeping the newest one
+            while self.size > self.budget and len(self.entries) > 1:
+                self.size -= self.entries.popitem(last=False)[1][1]
+        return value
+
+    def clear(self):
+        """ Drop every entry of the cache. """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+CACHE = LRUCache(CACHE_BUDGET_MB * 1024 ** 2)
+
+
+class LoadedDataset:
+    """
+    Class to hold a dataset loaded for the visualizer.
+
+    Initialized: schema of the samples of the dataset, dataframe of the annotation
+    columns indexed by gene name (all the columns for datasets without a matrix),
+    memory mapped expression matrix (None for datasets without one), sample names
+    of the matrix columns, gene name -> matrix row map, memory mapped statistics x
+    genes x timepoints replicate aggregates (None for datasets without them), and
+    the sorted timepoints in hours of the samples (None when the samples are not a
+    time course)
+    """
+
+    def __init__(
+        self,
+        schema,
+        annotations,
+        matrix=None,
+        samples=None,
+        rows=None,
+        aggregates=None,
+        timepoints=None,
+    ):
+        self.schema = schema
+        self.annotations = annotations
+        self.matrix = matrix
+        self.samples = samples
+        self.rows = rows
+        self.aggregates = aggregates
+        self.timepoints = timepoints
+
+
+def datasetVersion(name, dataDir=DATA_DIR):
+    """ Latest modification time of the files of a dataset, used to notice rewritten datasets. """
+    path = datasetPath(name, dataDir)
+    paths = [
+        os.path.join(path, fileName)
+        for fileName in (TABLE_FILE, MATRIX_FILE, LABELS_FILE)
+    ] + [os.path.join(dataDir, f"{name}.pkl")]
+    return max(os.path.getmtime(file) for file in paths if os.path.exists(file))
+
+
+def datasetVersions(names, dataDir=DATA_DIR):
+    """ Map every dataset to its version, see datasetVersion(). """
+    return {name: datasetVersion(name, dataDir) for name in names}
+
+
+def loadDataset(name, dataDir=DATA_DIR):
+    """ Cached LoadedDataset of a dataset, keyed by its path and version. """
+
+    def load():
+        schema = readSchema(name, dataDir)
+        timepoints = None
+        if schema.isTimeCourse():
+            timepoints = np.unique(schema.hours()).tolist()
+        opened = openMatrix(name, dataDir)
+        if opened is None:
+            annotations = readDataset(name, dataDir=dataDir)
+            return LoadedDataset(
+                schema, annotations.set_index("Gene Name"), timepoints=timepoints
+            )
+        matrix, labels = opened
+        annotations = readDataset(name, columns=GENE_COLUMNS, dataDir=dataDir)
+        annotations = annotations.set_index("Gene Name")
+        # the matrix row map keeps the first row of a duplicated gene, so do we
+        annotations = annotations[~annotations.index.duplicated()]
+        return LoadedDataset(
+            schema,
+            annotations,
+            matrix,
+            labels["samples"],
+            rowOffsets(labels["genes"]),
+            openAggregates(name, dataDir),
+            labels.get("timepoints", timepoints),
+        )
+
+    key = ("dataset", datasetPath(name, dataDir), datasetVersion(name, dataDir))
+    return CACHE.get(key, load)
+
+
+def loadSearchIndex(name, dataDir=DATA_DIR):
+    """ Cached SearchIndex of a dataset, from its precomputed search index or built from its annotations for datasets without one. """
+
+    def load():
+        searchPath = os.path.join(datasetPath(name, dataDir), SEARCH_FILE)
+        if os.path.exists(searchPath):
+            return SearchIndex(pd.read_parquet(searchPath))
+        annotations = loadDataset(name, dataDir).annotations.reset_index()
+        return SearchIndex(buildSearchIndex(annotations))
+
+    key = ("search", datasetPath(name, dataDir), datasetVersion(name, dataDir))
+    return CACHE.get(key, load)
+
+
+def loadHomologs(name, dataDir=DATA_DIR):
+    """ Cached series of the gene of every homolog group of a dataset indexed by sorted homologene id, from the gene index or from its annotations for datasets the index does not cover. """
+
+    def load():
+        homologs = None
+        sidecarPath = os.path.join(datasetPath(name, dataDir), HOMOLOG_SIDECAR_FILE)
+        if os.path.exists(sidecarPath):
+            homologs = GeneIndex(dataDir).homologsOf(name)
+        if homologs is not None:
+            return pd.Series(
+                homologs["gene"].to_numpy(),
+                index=pd.Index(homologs["hgid"].to_numpy(dtype="int64"), name="HG ID"),
+                name="Gene Name",
+            )
+        # first gene of every homolog group, as the index keeps it
+        hgIDs = loadDataset(name, dataDir).annotations["HG ID"].dropna()
+        hgIDs = hgIDs[~hgIDs.duplicated()]
+        return pd.Series(
+            hgIDs.index.to_numpy(),
+            index=pd.Index(hgIDs.to_numpy(dtype="int64"), name="HG ID"),
+            name="Gene Name",
+        ).sort_index()
+
+    key = ("homologs", datasetPath(name, dataDir), datasetVersion(name, dataDir))
+    return CACHE.get(key, load)
+
+
+def geneRows(name, genes, dataDir=DATA_DIR):
+    """ Cached dataframe of the annotations and expression of genes in a dataset, raising KeyError for unknown genes. """
+    genes = tuple(genes)
+
+    def build():
+        dataset = loadDataset(name, dataDir)
+        rows = dataset.annotations.loc[list(genes)].reset_index()
+        if dataset.matrix is not None:
+            expression = pd.DataFrame(
+                dataset.matrix[[dataset.rows[gene] for gene in genes]],
+                columns=dataset.samples,
+            )
+            rows = pd.concat([rows, expression], axis=1)
+        return rows
+
+    key = ("rows", datasetPath(name, dataDir), datasetVersion(name, dataDir), genes)
+    return CACHE.get(key, build)
+
+
+def geneSamples(
+    name, genes, sampleType=None, hours=None, replicate=None, dataDir=DATA_DIR
+):
+    """ Cached dataframe of the annotations and the expression of the samples of a type, timepoint in hours and replicate (None for any) of genes in a dataset indexed by gene name, returned with the timepoints in hours of its sample columns, raising KeyError for unknown genes. """
+    genes = tuple(genes)
+
+    def build():
+        dataset = loadDataset(name, dataDir)
+        # matrix columns of the selection, looked up in the schema
+        positions = dataset.schema.select(sampleType, hours, replicate)
+        annotations = dataset.annotations.loc[list(genes)]
+        if dataset.matrix is not None:
+            values = dataset.matrix[[dataset.rows[gene] for gene in genes]]
+        else:
+            values = annotations[dataset.schema.samples["column"]].to_numpy()
+        expression = pd.DataFrame(
+            values[:, positions],
+            index=annotations.index,
+            columns=dataset.schema.samples["column"].to_numpy()[positions],
+        )
+        annotations = annotations[["HG ID", "Gene Description", "RefSeq"]]
+        return (
+            pd.concat([annotations, expression], axis=1),
+            dataset.schema.hours(positions),
+        )
+
+    key = (
+        "samples",
+        datasetPath(name, dataDir),
+        datasetVersion(name, dataDir),
+        genes,
+        sampleType,
+        hours,
+        replicate,
+    )
+    return CACHE.get(key, build)
+
+
+def geneStatistic(name, genes, statistic="mean", dataDir=DATA_DIR):
+    """ Cached dataframe of the annotations and per timepoint replicate statistic of genes in a dataset indexed by gene name, raising KeyError for unknown genes. """
+    genes = tuple(genes)
+
+    def build():
+        dataset = loadDataset(name, dataDir)
+        annotations = dataset.annotations.loc[list(genes)]
+        annotations = annotations[["HG ID", "Gene Description", "RefSeq"]]
+        if dataset.aggregates is not None:
+            # rows of the statistics precomputed at ingest
+            values = dataset.aggregates[
+                STATISTICS.index(statistic), [dataset.rows[gene] for gene in genes]
+            ]
+            timepoints = dataset.timepoints
+        else:
+            # datasets stored before the aggregates existed, reduce them here
+            if not dataset.schema.isTimeCourse():
+                raise ValueError(f"samples of {name} are not a time course")
+            expression = geneRows(name, genes, dataDir).drop(columns=GENE_COLUMNS)
+            timepoints, results = aggregate(
+                expression.to_numpy(dtype="float64"),
+                dataset.schema.sampleIndex(),
+                (statistic,),
+            )
+            values = results[statistic]
+        # the mean is what the visualizer has always called the average
+        label = "average" if statistic == "mean" else statistic
+        statisticDf = pd.DataFrame(
+            values, index=annotations.index, columns=averageColumns(timepoints, label)
+        )
+        return pd.concat([annotations, statisticDf], axis=1)
+
+    key = (
+        "statistic",
+        datasetPath(name, dataDir),
+        datasetVersion(name, dataDir),
+        genes,
+        statistic,
+    )
+    return CACHE.get(key, build)
+
+
+def cachedView(name, key, builder, dataDir=DATA_DIR):
+    """ Cached frame derived from a dataset, keyed by the dataset version and key. """
+    fullKey = ("view", datasetPath(name, dataDir), datasetVersion(name, dataDir), key)
+    return CACHE.get(fullKey, builder)
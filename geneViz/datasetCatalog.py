@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+Module that maintains the catalog of the datasets in data/, a small sqlite database
+(data/catalog.sqlite) with one row per dataset holding its number of genes and
+samples, sample types, timepoints in hours, number of replicates, size on disk and
+the date it was ingested. A dataset's row is written along with the dataset
+itself, so listing and describing every dataset is a single query that never opens
+a data file, however many datasets data/ holds. The catalog also keeps the
+modification time data/ had when it was last compared with the datasets in it, so
+readers only scan data/ again once something was added to or removed from it.
+
+Classes:
+    DatasetCatalog: catalog of the datasets stored in data/catalog.sqlite
+"""
+
+import json
+import os
+import sqlite3
+import pandas as pd
+
+CATALOG_FILE = "catalog.sqlite"
+CATALOG_FIELDS = ["name", "genes", "samples", "sampleTypes", "timepoints"]
+CATALOG_FIELDS += ["replicates", "bytes", "ingested"]
+# fields holding lists, stored as json
+LIST_FIELDS = ("sampleTypes", "timepoints")
+
+
+class DatasetCatalog:
+    """
+    Class to wrap the catalog of all the datasets in data/.
+
+    Initialized: data directory the catalog belongs to, path of the sqlite database
+    in it, and open connection to the database
+
+    Methods: addDataset(): catalog (or recatalog) a dataset, removeDataset(): drop a
+    dataset from the catalog, clear(): drop every dataset, names(): names of the
+    cataloged datasets, entries(): dataframe of the catalog, syncedStamp():
+    modification time of data/ at the last sync, setSyncedStamp(): record it
+    """
+
+    def __init__(self, dataDir):
+        self.dataDir = dataDir
+        self.path = os.path.join(dataDir, CATALOG_FILE)
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        # keep the rollback journal between writes rather than creating and
+        # deleting it in data/, which would change the modification time of data/
+        # that tells when the catalog needs syncing
+        self.connection.execute("PRAGMA journal_mode=PERSIST")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS datasets (
+                name TEXT PRIMARY KEY,
+                genes INTEGER,
+                samples INTEGER,
+                sampleTypes TEXT,
+                timepoints TEXT,
+                replicates INTEGER,
+                bytes INTEGER,
+                ingested TEXT
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS synced (id INTEGER PRIMARY KEY, stamp INTEGER)"
+        )
+
+    def addDataset(self, entry):
+        """ Catalog a dataset from a dictionary of the catalog fields, replacing what was cataloged for it before. """
+        values = [
+            json.dumps(entry[field]) if field in LIST_FIELDS else entry[field]
+            for field in CATALOG_FIELDS
+        ]
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                values,
+            )
+
+    def removeDataset(self, name):
+        """ Drop a dataset from the catalog. """
+        with self.connection:
+            self.connection.execute("DELETE FROM datasets WHERE name = ?", (name,))
+
+    def clear(self):
+        """ Drop every dataset from the catalog. """
+        with self.connection:
+            self.connection.execute("DELETE FROM datasets")
+
+    def names(self):
+        """ Sorted names of the cataloged datasets. """
+        cursor = self.connection.execute("SELECT name FROM datasets ORDER BY name")
+        return [name for (name,) in cursor]
+
+    def entries(self):
+        """ Dataframe of the catalog, one row per dataset sorted by name, with the sample types and timepoints as lists. """
+        entries = pd.read_sql_query(
+            "SELECT * FROM datasets ORDER BY name", self.connection
+        )
+        for field in LIST_FIELDS:
+            entries[field] = [json.loads(value) for value in entries[field]]
+        return entries
+
+    def syncedStamp(self):
+        """ Modification time in nanoseconds data/ had when the catalog was last synced with it, None if it never was. """
+        row = self.connection.execute("SELECT stamp FROM synced").fetchone()
+        return None if row is None else row[0]
+
+    def setSyncedStamp(self, stamp):
+        """ Record the modification time of data/ the catalog was synced with. """
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO synced VALUES (0, ?)", (stamp,)
+            )
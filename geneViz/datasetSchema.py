@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+"""
+Module that describes the samples of a dataset. The schema is built once when a
+dataset is written, from the sample titles (of the form Xhrs_replicateY, older GEO
+titles such as "3 days, repeat 1" are understood too) and the series header, and is
+stored with the dataset as schema.json. It holds, for every column of the
+expression matrix, its sample type, timepoint with its unit and in hours, replicate
+number and GSM id, along with the names of the annotation columns.
+
+Selections of samples by type, timepoint and replicate are answered with the
+integer positions of their matrix columns, so nothing downstream ever looks at
+column names again.
+
+Classes:
+    DatasetSchema: samples and annotation columns of a dataset
+
+Functions:
+    parseSample(): timepoint, unit and replicate of a sample title
+"""
+
+import json
+import re
+import numpy as np
+import pandas as pd
+
+SCHEMA_FILE = "schema.json"
+SAMPLE_PATTERN = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(hours|hour|hrs|hr|h|days|day|d)(?![a-z])\D*?"
+    r"(?:replicate|repeat|rep)\D*(\d+)",
+    re.IGNORECASE,
+)
+# canonical name of every way of writing a timepoint unit, and its length in hours
+UNITS = {"h": "hours", "hr": "hours", "hrs": "hours", "hour": "hours"}
+UNITS.update({"hours": "hours", "d": "days", "day": "days", "days": "days"})
+UNIT_HOURS = {"hours": 1, "days": 24}
+SAMPLE_FIELDS = ["column", "sampleType", "timepoint", "unit", "hours", "replicate"]
+SAMPLE_FIELDS += ["gsm"]
+
+
+def parseSample(title):
+    """ Timepoint, unit and replicate number of a sample title, None when the title does not follow the schema. """
+    match = SAMPLE_PATTERN.search(title)
+    if match is None:
+        return None
+    value, unit, replicate = match.groups()
+    return float(value), UNITS[unit.lower()], int(replicate)
+
+
+class DatasetSchema:
+    """
+    Class to describe the samples and annotation columns of a dataset.
+
+    Initialized: dataframe with one row per matrix column, in matrix order, holding
+    its column name, sample type, timepoint, unit, timepoint in hours, replicate
+    number and GSM id (missing values for what is not known), and list of the
+    annotation columns
+
+    Methods: build(): build the schema of a dataset from its column names,
+    load(): read a stored schema, save(): store the schema, isTimeCourse(): whether
+    every sample has a timepoint and replicate, select(): integer matrix column
+    positions of a selection of samples, sampleIndex(): (hours, replicate) index of
+    the samples, replicates(): replicate numbers of the dataset, hours(): timepoint
+    in hours of every sample
+    """
+
+    def __init__(self, samples, annotationColumns):
+        self.samples = samples.reset_index(drop=True)
+        self.annotationColumns = list(annotationColumns)
+
+    @classmethod
+    def build(cls, columns, annotationColumns, sampleType=None, gsmIDs=None):
+        """ Build the schema of the sample columns of a dataset, with the sample type of all of them and a column -> GSM id map when they are known. """
+        gsmIDs = gsmIDs or {}
+        rows = []
+        for column in columns:
+            timepoint, unit, replicate = parseSample(column) or (np.nan, None, np.nan)
+            rows.append(
+                (
+                    column,
+                    sampleType,
+                    timepoint,
+                    unit,
+                    timepoint * UNIT_HOURS[unit] if unit else np.nan,
+                    replicate,
+                    gsmIDs.get(column),
+                )
+            )
+        return cls(pd.DataFrame(rows, columns=SAMPLE_FIELDS), annotationColumns)
+
+    @classmethod
+    def load(cls, path):
+        """ Read a schema stored with save(). """
+        with open(path, "r") as f:
+            stored = json.load(f)
+        samples = pd.DataFrame(stored["samples"], columns=SAMPLE_FIELDS)
+        for field in ("timepoint", "hours", "replicate"):
+            samples[field] = samples[field].astype(float)
+        return cls(samples, stored["annotationColumns"])
+
+    def save(self, path):
+        """ Store the schema as json. """
+        samples = self.samples.astype(object).where(self.samples.notna(), None)
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "annotationColumns": self.annotationColumns,
+                    "samples": samples.to_dict(orient="records"),
+                },
+                f,
+            )
+
+    def isTimeCourse(self):
+        """ Whether every sample has a timepoint and a replicate number. """
+        return len(self.samples) > 0 and bool(
+            self.samples[["hours", "replicate"]].notna().all(axis=None)
+        )
+
+    def select(self, sampleType=None, hours=None, replicate=None):
+        """ Integer positions of the matrix columns of the samples of a type, timepoint in hours and replicate number (None for any), ordered by time then replicate. """
+        mask = np.ones(len(self.samples), dtype=bool)
+        if sampleType is not None:
+            mask &= (self.samples["sampleType"] == sampleType).to_numpy()
+        if hours is not None:
+            mask &= (self.samples["hours"] == hours).to_numpy()
+        if replicate is not None:
+            mask &= (self.samples["replicate"] == replicate).to_numpy()
+        positions = np.flatnonzero(mask)
+        order = np.lexsort(
+            (
+                self.samples["replicate"].to_numpy()[positions],
+                self.samples["hours"].to_numpy()[positions],
+            )
+        )
+        return positions[order]
+
+    def sampleIndex(self):
+        """ (timepoint in hours, replicate) MultiIndex of the samples in matrix order. """
+        return pd.MultiIndex.from_arrays(
+            [self.samples["hours"], self.samples["replicate"].astype(int)],
+            names=["timepoint", "replicate"],
+        )
+
+    def replicates(self):
+        """ Sorted replicate numbers of the samples. """
+        return sorted(int(r) for r in self.samples["replicate"].dropna().unique())
+
+    def hours(self, positions=None):
+        """ Timepoint in hours of the samples at positions, of all samples when None. """
+        hours = self.samples["hours"].to_numpy()
+        return hours if positions is None else hours[positions]
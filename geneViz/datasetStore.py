@@ -0,0 +1,600 @@
+#!/usr/bin/env python3
+
+"""
+Module that stores annotated datasets as columnar parquet files in data/ and reads
+back only the genes and columns that are asked for.
+
+Every dataset lives in its own directory data/<dataset>/ that holds table.parquet
+and the genes.json and homologs.json row offset sidecars of the gene index. Rows are
+sorted by gene name and written in small row groups. Reading a few genes looks their
+row offsets up in the gene index and decodes only the row groups holding them;
+datasets that are not indexed fall back to the min/max statistics of each row group
+to skip those that cannot hold the genes. Only the projected columns are decoded.
+Expression columns are stored as float32 and the annotation columns as dictionary
+encoded strings. A rewritten table is written aside and swapped in right before the
+gene index is updated, so a failed write leaves the old table and its offsets.
+Every write has a version, kept in the footer of the table, in labels.json and in
+the gene index, and offsets the index holds for another version than the one on
+disk are not used: reads fall back to the statistics of the row groups, or to the
+gene labels of the matrix.
+
+Next to the table, the expression values are also stored as one contiguous genes x
+samples float32 matrix in matrix.npy, with its row and column labels in labels.json.
+The matrix is opened memory mapped, so slicing the rows of a few genes neither
+parses nor converts anything and only touches the pages of those rows. The sample
+type, timepoint, replicate and GSM id of every sample column are kept in schema.json
+(see datasetSchema). When every sample has a timepoint and replicate, the mean,
+median, SD, SEM and number of replicates of every gene and timepoint are precomputed
+into aggregates.npy, with the timepoints listed in labels.json. A per gene summary
+(minimum, maximum, and mean, SD and number of replicates per timepoint) and the
+quantiles of every sample are kept in summary.parquet and quantiles.parquet, and the
+sorted search keys of every gene in search.parquet (see searchIndex).
+
+Every dataset written is also described in data/catalog.sqlite (see datasetCatalog)
+with its number of genes and samples, sample types, timepoints, replicates, size and
+ingest date, so datasets can be listed without opening any of them. Reading the
+catalog compares its names with the datasets in data/ whenever the modification
+time of data/ changed since it last did, so datasets copied in or deleted by hand
+are cataloged or dropped then, while reading an unchanged data/ scans nothing.
+Partitions changed by hand inside a dataset are picked up by rebuilding the
+catalog (see main()).
+
+Series holding several sample types are stored partitioned: data/<dataset>/ holds
+partitions.json, mapping every sample type to its sample columns, and one dataset
+per sample type in data/<dataset>/<sample type>/, named <dataset>/<sample type>.
+
+Datasets written by older versions as data/<dataset>.pkl are still readable, and
+can be converted with the migration tool in this module:
+
+    $python3 datasetStore.py
+
+Functions:
+    datasetPath(): directory of a dataset in data/
+    cleanColumns(): normalize column names and types of an annotated dataframe
+    writeDataset(): write an annotated dataframe as a dataset
+    writePartitions(): write the sample type partitions of a dataframe as datasets
+    readPartitions(): partition -> sample columns map of a partitioned dataset
+    readSchema(): schema of the samples of a dataset
+    describeDataset(): catalog entry of a dataset
+    openCatalog(): catalog of data/, built when it does not exist yet
+    syncCatalog(): catalog and drop the datasets that changed in data/ by hand
+    readCatalog(): dataframe of the catalog of the datasets in data/
+    catalogNames(): names of the datasets of the catalog of data/
+    rebuildCatalog(): recreate the catalog of data/ from the datasets in it
+    readDataset(): read the given genes and columns of a dataset
+    openMatrix(): memory map the expression matrix of a dataset
+    openAggregates(): memory map the precomputed replicate statistics of a dataset
+    readSummary(): precomputed summary statistics of the given genes of a dataset
+    readQuantiles(): precomputed quantiles of every sample of a dataset
+    readExpression(): expression values of the given genes of a dataset
+    listDatasets(): names of all datasets in data/
+    migratePickles(): convert every legacy pickle in data/ to a dataset
+    main(): command line entry point for migrating legacy pickles, rebuilding the
+    gene index and catalog and exporting datasets
+"""
+
+import argparse
+import bisect
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datasetCatalog import CATALOG_FILE, DatasetCatalog
+from exportEngine import COMPRESSIONS, FORMATS, exportDataset
+from geneIndex import (
+    HOMOLOG_SIDECAR_FILE,
+    SIDECAR_FILE,
+    GeneIndex,
+    geneRows,
+    homologRows,
+    writeSidecar,
+)
+from datasetSchema import SCHEMA_FILE, DatasetSchema
+from datasetSummary import QUANTILES_FILE, SUMMARY_FILE, writeSummary
+from replicates import AGGREGATES_FILE, STATISTICS, writeAggregates
+from searchIndex import writeSearchIndex
+
+DATA_DIR = "../data"
+TABLE_FILE = "table.parquet"
+MATRIX_FILE = "matrix.npy"
+LABELS_FILE = "labels.json"
+PARTITIONS_FILE = "partitions.json"
+ROW_GROUP_SIZE = 1000
+# key of the version of a dataset in the metadata of its table
+VERSION_KEY = b"geneviz.version"
+# columns that hold annotations, every other column holds expression values
+GENE_COLUMNS = ["HG ID", "Gene Name", "Gene Description", "RefSeq"]
+# annotation columns with few distinct values that are stored as dictionaries
+DICTIONARY_COLUMNS = ["Gene Description", "RefSeq"]
+
+
+def datasetPath(name, dataDir=DATA_DIR):
+    """ Directory a dataset is stored in. """
+    return os.path.join(dataDir, name)
+
+
+def cleanColumns(df):
+    """ Strip quotes and whitespace from column names and give every column its storage type. """
+    df = df.copy()
+    df.columns = [str(column).strip().strip('"').strip() for column in df.columns]
+    for column in df.columns:
+        if column == "HG ID":
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+        elif column in DICTIONARY_COLUMNS:
+            # older pickles hold lists when mygene returned several refseqs
+            df[column] = (
+                df[column]
+                .map(lambda x: ",".join(x) if isinstance(x, list) else x)
+                .astype("category")
+            )
+        elif column == "Gene Name":
+            df[column] = df[column].astype(str)
+        elif column not in GENE_COLUMNS:
+            # expression values from older pickles are strings
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("float32")
+    return df
+
+
+def writeDataset(
+    df,
+    name,
+    dataDir=DATA_DIR,
+    rowGroupSize=ROW_GROUP_SIZE,
+    sampleType=None,
+    gsmIDs=None,
+):
+    """ Write an annotated dataframe as a parquet dataset sorted by gene name, with the sample type of its samples and a sample column -> GSM id map in its schema when they are known. """
+    df = cleanColumns(df)
+    df = df.sort_values("Gene Name", kind="mergesort").reset_index(drop=True)
+    path = datasetPath(name, dataDir)
+    # version of this write, which the row offsets of the gene index must match
+    version = uuid.uuid4().hex
+    # a series stored partitioned before is now stored as one dataset
+    _removePartitions(name, dataDir)
+    os.makedirs(path, exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata(
+        {**table.schema.metadata, VERSION_KEY: version.encode()}
+    )
+    # written aside and only swapped in with the gene index below, so readers
+    # never seek with the offsets of one table into another
+    tablePath = os.path.join(path, TABLE_FILE)
+    pq.write_table(
+        table,
+        f"{tablePath}.tmp",
+        row_group_size=rowGroupSize,
+        use_dictionary=True,
+        compression="snappy",
+    )
+    # contiguous expression matrix in the same row order as the table, replaced
+    # atomically so that viewers mapping the old matrix keep a consistent copy
+    samples = [column for column in df.columns if column not in GENE_COLUMNS]
+    matrix = np.ascontiguousarray(df[samples].to_numpy(dtype="float32"))
+    matrixPath = os.path.join(path, MATRIX_FILE)
+    with open(f"{matrixPath}.tmp", "wb") as f:
+        np.save(f, matrix)
+    os.replace(f"{matrixPath}.tmp", matrixPath)
+    labels = {"genes": df["Gene Name"].to_list(), "samples": samples}
+    labels["version"] = version
+    # sample titles are parsed once here, readers only use the schema
+    schema = DatasetSchema.build(
+        samples,
+        [column for column in df.columns if column in GENE_COLUMNS],
+        sampleType,
+        gsmIDs,
+    )
+    schema.save(os.path.join(path, SCHEMA_FILE))
+    # per timepoint replicate statistics of every gene, precomputed once here
+    aggregated = writeAggregates(path, matrix, schema)
+    if aggregated is not None:
+        labels["timepoints"] = aggregated[0].tolist()
+        labels["statistics"] = list(STATISTICS)
+    labelsPath = os.path.join(path, LABELS_FILE)
+    with open(f"{labelsPath}.tmp", "w") as f:
+        json.dump(labels, f)
+    os.replace(f"{labelsPath}.tmp", labelsPath)
+    # small per gene and per sample summary tables
+    writeSummary(path, labels["genes"], matrix, samples, aggregated)
+    # sorted symbol, homologene and refseq keys for searching genes
+    writeSearchIndex(path, df[schema.annotationColumns])
+    # keep the gene index of this dataset and of data/ up to date
+    rows = geneRows(df["Gene Name"])
+    writeSidecar(os.path.join(path, SIDECAR_FILE), rows, version)
+    # and of its homolog groups, which join datasets of different species
+    homologs = homologRows(df["HG ID"]) if "HG ID" in df.columns else {}
+    writeSidecar(os.path.join(path, HOMOLOG_SIDECAR_FILE), homologs, version)
+    os.replace(f"{tablePath}.tmp", tablePath)
+    GeneIndex(dataDir).addDataset(name, rows, homologs, version)
+    # and describe it in the catalog last, once every file of it is written
+    ingested = datetime.now(timezone.utc)
+    openCatalog(dataDir).addDataset(describeDataset(name, dataDir, ingested))
+
+
+def writePartitions(
+    df, name, partitions, dataDir=DATA_DIR, workers=None, gsmIDs=None
+):
+    """ Write the sample columns of every partition of an annotated dataframe as its own dataset <name>/<partition>, all from one sorted matrix and concurrently, and list them in data/<name>/partitions.json. The partition is the sample type of the schema of its dataset, gsmIDs maps sample columns to their GSM ids. """
+    df = cleanColumns(df)
+    df = df.sort_values("Gene Name", kind="mergesort").reset_index(drop=True)
+    annotations = df[[column for column in df.columns if column in GENE_COLUMNS]]
+    samples = [column for column in df.columns if column not in GENE_COLUMNS]
+    # one matrix that every partition takes its columns from
+    matrix = df[samples].to_numpy(dtype="float32")
+    positions = pd.Index(samples)
+    path = datasetPath(name, dataDir)
+    partitionsPath = os.path.join(path, PARTITIONS_FILE)
+    # catalog what data/ already holds before the partitions are written together
+    catalog = openCatalog(dataDir)
+    # a series stored as one dataset before is now stored partitioned
+    _removeFlatDataset(name, dataDir, catalog)
+    # drop partitions an earlier export wrote that are gone now
+    _removePartitions(name, dataDir, catalog, keep=partitions)
+
+    def write(partition):
+        columns = partitions[partition]
+        partitionDf = pd.concat(
+            [
+                annotations,
+                pd.DataFrame(
+                    matrix[:, positions.get_indexer(columns)], columns=columns
+                ),
+            ],
+            axis=1,
+        )
+        writeDataset(
+            partitionDf,
+            f"{name}/{partition}",
+            dataDir,
+            sampleType=partition,
+            gsmIDs=gsmIDs,
+        )
+
+    # writing is mostly parquet, numpy and sqlite io that releases the gil
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(write, partitions))
+    with open(partitionsPath, "w") as f:
+        json.dump({"partitions": partitions}, f)
+
+
+def _removeFlatDataset(name, dataDir, catalog):
+    """ Remove the files of a dataset stored unpartitioned in data/<name>/, leaving its subdirectories, and drop it from the gene index and the catalog. """
+    path = datasetPath(name, dataDir)
+    if not os.path.exists(os.path.join(path, TABLE_FILE)):
+        return
+    for entry in os.scandir(path):
+        if entry.is_file() and entry.name != PARTITIONS_FILE:
+            os.remove(entry.path)
+    GeneIndex(dataDir).removeDataset(name)
+    catalog.removeDataset(name)
+
+
+def _removePartitions(name, dataDir, catalog=None, keep=()):
+    """ Remove the partitions of a partitioned dataset other than those in keep, with their rows in the gene index and the catalog, and its partitions.json when none is kept. """
+    partitions = readPartitions(name, dataDir)
+    if partitions is None:
+        return
+    path = datasetPath(name, dataDir)
+    catalog = catalog or openCatalog(dataDir)
+    for partition in partitions:
+        if partition not in keep:
+            shutil.rmtree(os.path.join(path, partition), ignore_errors=True)
+            GeneIndex(dataDir).removeDataset(f"{name}/{partition}")
+            catalog.removeDataset(f"{name}/{partition}")
+    if not keep:
+        os.remove(os.path.join(path, PARTITIONS_FILE))
+
+
+def readPartitions(name, dataDir=DATA_DIR):
+    """ Partition -> sample columns map of a partitioned dataset, None if it is not partitioned. """
+    partitionsPath = os.path.join(datasetPath(name, dataDir), PARTITIONS_FILE)
+    if not os.path.exists(partitionsPath):
+        return None
+    with open(partitionsPath, "r") as f:
+        return json.load(f)["partitions"]
+
+
+def readSchema(name, dataDir=DATA_DIR):
+    """ Schema of the samples of a dataset, built from its sample columns for datasets written before schemas were stored. """
+    path = datasetPath(name, dataDir)
+    schemaPath = os.path.join(path, SCHEMA_FILE)
+    if os.path.exists(schemaPath):
+        return DatasetSchema.load(schemaPath)
+    labelsPath = os.path.join(path, LABELS_FILE)
+    if os.path.exists(labelsPath):
+        with open(labelsPath, "r") as f:
+            samples = json.load(f)["samples"]
+    elif os.path.exists(os.path.join(path, TABLE_FILE)):
+        samples = pq.read_schema(os.path.join(path, TABLE_FILE)).names
+    else:
+        samples = cleanColumns(pd.read_pickle(f"{path}.pkl")).columns
+    annotationColumns = [column for column in samples if column in GENE_COLUMNS]
+    samples = [column for column in samples if column not in GENE_COLUMNS]
+    partitioned = name.split("/")
+    sampleType = partitioned[1] if len(partitioned) == 2 else None
+    return DatasetSchema.build(samples, annotationColumns or GENE_COLUMNS, sampleType)
+
+
+def describeDataset(name, dataDir=DATA_DIR, ingested=None):
+    """ Catalog entry of a dataset: its number of genes and samples, sample types, timepoints in hours, number of replicates, bytes on disk and ingest date, the last time its files were written when not given. """
+    path = datasetPath(name, dataDir)
+    schema = readSchema(name, dataDir)
+    tablePath = os.path.join(path, TABLE_FILE)
+    if os.path.exists(tablePath):
+        genes = pq.read_metadata(tablePath).num_rows
+        files = [entry.stat() for entry in os.scandir(path) if entry.is_file()]
+        size = sum(stat.st_size for stat in files)
+        modified = max(stat.st_mtime for stat in files)
+    else:
+        picklePath = f"{path}.pkl"
+        genes = len(pd.read_pickle(picklePath))
+        size = os.path.getsize(picklePath)
+        modified = os.path.getmtime(picklePath)
+    if ingested is None:
+        ingested = datetime.fromtimestamp(modified, timezone.utc)
+    samples = schema.samples
+    return {
+        "name": name,
+        "genes": int(genes),
+        "samples": len(samples),
+        "sampleTypes": sorted(samples["sampleType"].dropna().unique().tolist()),
+        "timepoints": np.unique(samples["hours"].dropna()).tolist(),
+        "replicates": len(schema.replicates()),
+        "bytes": int(size),
+        "ingested": ingested.isoformat(timespec="seconds"),
+    }
+
+
+def openCatalog(dataDir=DATA_DIR, sync=False):
+    """ DatasetCatalog of data/, built from the datasets already in it when data/ has no catalog yet. With sync, the datasets added to or removed from data/ without being written through this module since, such as pickles copied in by hand, are cataloged or dropped first, when data/ changed since the last sync. """
+    if not os.path.exists(os.path.join(dataDir, CATALOG_FILE)):
+        rebuildCatalog(dataDir)
+        return DatasetCatalog(dataDir)
+    catalog = DatasetCatalog(dataDir)
+    if sync:
+        syncCatalog(catalog, dataDir)
+    return catalog
+
+
+def syncCatalog(catalog, dataDir=DATA_DIR, force=False):
+    """ Bring a catalog in line with the names of the datasets in data/, describing the datasets it misses and dropping those that are gone, unless data/ was not modified since the last sync and force is not set. A dataset that cannot be described yet, because it is still being written, is cataloged by a later sync. """
+    # taken before listing, so changes made while listing are seen by the next sync
+    stamp = os.stat(dataDir).st_mtime_ns
+    if not force and catalog.syncedStamp() == stamp:
+        return
+    names = set(listDatasets(dataDir))
+    cataloged = set(catalog.names())
+    for name in sorted(names - cataloged):
+        try:
+            catalog.addDataset(describeDataset(name, dataDir))
+        except (OSError, ValueError, EOFError):
+            continue
+    for name in cataloged - names:
+        catalog.removeDataset(name)
+    catalog.setSyncedStamp(stamp)
+
+
+def readCatalog(dataDir=DATA_DIR):
+    """ Dataframe of the catalog of the datasets in data/, one row per dataset sorted by name, synced with data/ first. """
+    return openCatalog(dataDir, sync=True).entries()
+
+
+def catalogNames(dataDir=DATA_DIR):
+    """ Sorted names of the datasets of the catalog of data/, synced with data/ first, the datasets the visualizer and the query server offer. """
+    return openCatalog(dataDir, sync=True).names()
+
+
+def rebuildCatalog(dataDir=DATA_DIR):
+    """ Recreate the catalog of data/ by describing every dataset in it. """
+    catalog = DatasetCatalog(dataDir)
+    stamp = os.stat(dataDir).st_mtime_ns
+    entries = [describeDataset(name, dataDir) for name in listDatasets(dataDir)]
+    catalog.clear()
+    for entry in entries:
+        catalog.addDataset(entry)
+    catalog.setSyncedStamp(stamp)
+
+
+def _tableVersion(parquetFile):
+    """ Version of the dataset of an opened table, None for tables of older versions. """
+    version = (parquetFile.schema_arrow.metadata or {}).get(VERSION_KEY)
+    return None if version is None else version.decode()
+
+
+def _readRows(parquetFile, rows, columns):
+    """ Read the given row offsets of an opened parquet table, decoding only the row groups that hold them. """
+    # first row offset of every row group, and the row group of every row
+    starts = [0]
+    for group in range(parquetFile.num_row_groups):
+        starts.append(starts[-1] + parquetFile.metadata.row_group(group).num_rows)
+    groupOf = {row: bisect.bisect_right(starts, row) - 1 for row in rows}
+    groups = sorted(set(groupOf.values()))
+    if not groups:
+        df = parquetFile.schema_arrow.empty_table().to_pandas()
+        return df if columns is None else df[columns]
+    df = parquetFile.read_row_groups(groups, columns=columns).to_pandas()
+    # where every row group that was read starts within df
+    readStarts = {}
+    position = 0
+    for group in groups:
+        readStarts[group] = position
+        position += starts[group + 1] - starts[group]
+    positions = sorted(
+        readStarts[groupOf[row]] + row - starts[groupOf[row]] for row in rows
+    )
+    return df.iloc[positions]
+
+
+def readDataset(name, genes=None, columns=None, dataDir=DATA_DIR):
+    """ Read a dataset, only decoding the row groups that can hold genes and the given columns. """
+    tablePath = os.path.join(datasetPath(name, dataDir), TABLE_FILE)
+    if os.path.exists(tablePath):
+        if columns is not None and "Gene Name" not in columns:
+            columns = ["Gene Name"] + list(columns)
+        # seek straight to the rows of the genes when the dataset is indexed, from
+        # this version of its table
+        rows = None
+        if genes is not None:
+            parquetFile = pq.ParquetFile(tablePath)
+            version = _tableVersion(parquetFile)
+            rows = GeneIndex(dataDir).rowsOf(name, genes, version)
+        if rows is not None:
+            found = _readRows(parquetFile, rows.values(), columns)
+            return found.reset_index(drop=True)
+        filters = None if genes is None else [("Gene Name", "in", list(genes))]
+        df = pd.read_parquet(tablePath, columns=columns, filters=filters)
+        # the filter only skips row groups, drop the other genes of a row group
+        if genes is not None:
+            df = df[df["Gene Name"].isin(genes)]
+        return df.reset_index(drop=True)
+
+    # datasets written before the parquet store are whole pickles
+    df = cleanColumns(pd.read_pickle(os.path.join(dataDir, f"{name}.pkl")))
+    if genes is not None:
+        df = df[df["Gene Name"].isin(genes)]
+    if columns is not None:
+        df = df[[column for column in df.columns if column in columns]]
+    return df.reset_index(drop=True)
+
+
+def openMatrix(name, dataDir=DATA_DIR):
+    """ Memory map the expression matrix of a dataset and return it with its labels, None if it has no matrix. """
+    path = datasetPath(name, dataDir)
+    matrixPath = os.path.join(path, MATRIX_FILE)
+    if not os.path.exists(matrixPath):
+        return None
+    with open(os.path.join(path, LABELS_FILE), "r") as f:
+        labels = json.load(f)
+    return np.load(matrixPath, mmap_mode="r"), labels
+
+
+def openAggregates(name, dataDir=DATA_DIR):
+    """ Memory map the precomputed statistics x genes x timepoints replicate aggregates of a dataset, None if it has none. """
+    aggregatesPath = os.path.join(datasetPath(name, dataDir), AGGREGATES_FILE)
+    if not os.path.exists(aggregatesPath):
+        return None
+    return np.load(aggregatesPath, mmap_mode="r")
+
+
+def readSummary(name, genes=None, dataDir=DATA_DIR):
+    """ Precomputed minimum, maximum and per timepoint statistics of genes (all genes when None) of a dataset, None if it has no summary. """
+    summaryPath = os.path.join(datasetPath(name, dataDir), SUMMARY_FILE)
+    if not os.path.exists(summaryPath):
+        return None
+    filters = None if genes is None else [("Gene Name", "in", list(genes))]
+    return pd.read_parquet(summaryPath, filters=filters)
+
+
+def readQuantiles(name, dataDir=DATA_DIR):
+    """ Precomputed quantiles of every sample of a dataset, None if it has none. """
+    quantilesPath = os.path.join(datasetPath(name, dataDir), QUANTILES_FILE)
+    if not os.path.exists(quantilesPath):
+        return None
+    return pd.read_parquet(quantilesPath)
+
+
+def readExpression(name, genes=None, dataDir=DATA_DIR):
+    """ Dataframe of the expression values of genes (all genes when None) indexed by gene name, None if the dataset has no matrix. """
+    opened = openMatrix(name, dataDir)
+    if opened is None:
+        return None
+    matrix, labels = opened
+    if genes is None:
+        # wraps the memory map itself, nothing is read until it is used
+        return pd.DataFrame(
+            matrix, index=labels["genes"], columns=labels["samples"], copy=False
+        )
+    rows = GeneIndex(dataDir).rowsOf(name, genes, labels.get("version"))
+    if rows is None:
+        rows = geneRows(labels["genes"])
+    found = [gene for gene in genes if gene in rows]
+    return pd.DataFrame(
+        matrix[[rows[gene] for gene in found]],
+        index=found,
+        columns=labels["samples"],
+    )
+
+
+def listDatasets(dataDir=DATA_DIR):
+    """ Sorted names of all the datasets in data/, including the <dataset>/<partition> partitions of partitioned datasets and legacy pickles. """
+    names = set()
+    for entry in os.listdir(dataDir):
+        if os.path.exists(os.path.join(dataDir, entry, TABLE_FILE)):
+            names.add(entry)
+        elif os.path.exists(os.path.join(dataDir, entry, PARTITIONS_FILE)):
+            partitions = readPartitions(entry, dataDir)
+            names.update(f"{entry}/{partition}" for partition in partitions)
+        elif entry.endswith(".pkl"):
+            names.add(entry[:-4])
+    return sorted(names)
+
+
+def migratePickles(dataDir=DATA_DIR, remove=False):
+    """ Convert every legacy pickle in data/ to a parquet dataset, optionally deleting the pickle. """
+    migrated = []
+    for entry in sorted(os.listdir(dataDir)):
+        if not entry.endswith(".pkl"):
+            continue
+        name = entry[:-4]
+        picklePath = os.path.join(dataDir, entry)
+        writeDataset(pd.read_pickle(picklePath), name, dataDir)
+        if remove:
+            os.remove(picklePath)
+        migrated.append(name)
+    return migrated
+
+
+def main():
+    """ Migrate the legacy pickles in data/ to parquet datasets, and optionally rebuild the gene index and export datasets. """
+    parser = argparse.ArgumentParser(
+        description="Convert legacy pickled datasets in data/ to parquet datasets"
+    )
+    parser.add_argument(
+        "--remove",
+        action="store_true",
+        help="Delete each pickle once it has been converted",
+    )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="Recreate the gene index and catalog of data/ from the sidecar and files of every dataset",
+    )
+    # stream stored datasets out to outfiles/ without loading them whole
+    parser.add_argument(
+        "--export",
+        action="append",
+        default=[],
+        help="Name of a dataset to export to outfiles/, may be repeated",
+    )
+    parser.add_argument(
+        "--format", choices=FORMATS, default="csv", help="Format of the exports"
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        default="none",
+        help="Compression of the exports",
+    )
+    args = parser.parse_args()
+    for name in migratePickles(remove=args.remove):
+        print(f"migrated {name}")
+    if args.rebuild_index:
+        GeneIndex(DATA_DIR).rebuild()
+        rebuildCatalog(DATA_DIR)
+    for name in args.export:
+        path = exportDataset(
+            os.path.join(datasetPath(name), TABLE_FILE),
+            f"../outfiles/{name.replace('/', '_')}",
+            fileFormat=args.format,
+            compression=args.compression,
+        )
+        print(f"exported {name} to {path}")
+
+
+if __name__ == "__main__":
+    main()
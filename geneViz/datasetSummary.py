@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+Module that precomputes the summary statistics of a dataset when it is written, so
+that summary questions are answered from two small tables rather than from the
+full expression matrix:
+
+    summary.parquet: one row per gene with its minimum and maximum over every
+    sample and, when the samples follow the Xhrs_replicateY schema, the mean, SD
+    and number of replicates of every timepoint
+    quantiles.parquet: one row per sample with the quantiles of its values
+
+Genes or samples without any value, and datasets without samples or genes, get nan
+statistics.
+
+Functions:
+    geneSummary(): per gene minimum, maximum and per timepoint statistics
+    sampleQuantiles(): quantiles of the values of every sample
+    writeSummary(): compute and store the summary tables of a dataset
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from replicates import averageColumns
+
+SUMMARY_FILE = "summary.parquet"
+QUANTILES_FILE = "quantiles.parquet"
+QUANTILES = (0.0, 0.05, 0.25, 0.5, 0.75, 0.95, 1.0)
+# replicate statistics of every timepoint kept in the gene summary
+SUMMARY_STATISTICS = ("mean", "sd", "n")
+
+
+def geneSummary(genes, matrix, aggregated=None):
+    """ Dataframe of the minimum and maximum of every gene, nan for genes without values, followed by its per timepoint replicate statistics when aggregated (timepoints, statistics) is given. """
+    # fmin and fmax skip nan without warning about genes that only have nan,
+    # unlike nanmin and nanmax, and a warnings filter is not thread safe
+    minimum = np.full(len(matrix), np.nan, dtype=matrix.dtype)
+    maximum = minimum.copy()
+    if matrix.shape[1]:
+        minimum = np.fmin.reduce(matrix, axis=1)
+        maximum = np.fmax.reduce(matrix, axis=1)
+    summaryDf = pd.DataFrame({"Gene Name": list(genes), "min": minimum, "max": maximum})
+    if aggregated is not None:
+        timepoints, results = aggregated
+        for statistic in SUMMARY_STATISTICS:
+            columns = averageColumns(timepoints, statistic)
+            summaryDf[columns] = results[statistic].astype("float32")
+    return summaryDf
+
+
+def sampleQuantiles(matrix, samples, quantiles=QUANTILES):
+    """ Dataframe indexed by sample of the quantiles of its values, one column per quantile, nan for samples without values. """
+    values = np.full((len(quantiles), matrix.shape[1]), np.nan)
+    # only samples with values, so that nanquantile has no all nan slice to warn of
+    observed = (~np.isnan(matrix)).any(axis=0)
+    if observed.size and observed.all():
+        values = np.nanquantile(matrix, quantiles, axis=0)
+    elif observed.any():
+        values[:, observed] = np.nanquantile(matrix[:, observed], quantiles, axis=0)
+    return pd.DataFrame(
+        values.T,
+        index=pd.Index(samples, name="sample"),
+        columns=[f"q{quantile:g}" for quantile in quantiles],
+    )
+
+
+def writeSummary(path, genes, matrix, samples, aggregated=None):
+    """ Compute the gene summary and sample quantiles of a dataset and store them in its directory. """
+    geneSummary(genes, matrix, aggregated).to_parquet(
+        os.path.join(path, SUMMARY_FILE), index=False
+    )
+    sampleQuantiles(matrix, samples).to_parquet(os.path.join(path, QUANTILES_FILE))
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+"""
+Module that exports annotated dataframes to outfiles/ as csv, tsv or parquet,
+optionally compressed with gzip or zstd.
+
+Text formats are written in chunks of rows. Every chunk is formatted (expression
+values with one printf style float format, seven significant digits by default
+which is the precision they are stored with, homologene ids as integers) and
+compressed by a pool of worker processes, and the chunks are appended to the file
+in order as they come back, so formatting, which is what takes the time, runs on
+every core while only a bounded number of chunks is held in memory. Compressed
+chunks are written as consecutive gzip members or zstd frames, which decompress as
+one stream. Parquet is written one row group per chunk. Exports can be fed an
+iterator of chunks rather than a dataframe, so datasets bigger than memory are
+streamed from their parquet table with exportDataset(). Exports are written to a
+temporary file that replaces the export once complete, and is removed if the export
+fails.
+
+Functions:
+    exportPath(): path of an export with the extensions of its format and compression
+    formatChunk(): format and compress one chunk of rows of a text export
+    exportFrame(): export a dataframe, or an iterator of chunks of one
+    exportDataset(): stream a stored dataset into an export
+"""
+
+import gzip
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import pyarrow.parquet as pq
+from ingestOptions import COMPRESSIONS, FLOAT_FORMAT, FORMATS
+
+SEPARATORS = {"csv": ",", "tsv": "\t"}
+COMPRESSION_EXTENSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+CHUNK_SIZE = 100000
+
+
+def exportPath(basePath, fileFormat="csv", compression="none"):
+    """ Path of an export, the base path followed by the extension of the format and, for text formats, of the compression. """
+    if fileFormat == "parquet":
+        return f"{basePath}.parquet"
+    return f"{basePath}.{fileFormat}{COMPRESSION_EXTENSIONS[compression]}"
+
+
+def _chunks(df, chunkSize):
+    """ Split a dataframe into chunks of chunkSize rows, each a slice of it. """
+    # an empty frame is still one chunk, so that its header is written
+    for start in range(0, max(len(df), 1), chunkSize):
+        yield df.iloc[start : start + chunkSize]
+
+
+def formatChunk(chunk, separator, floatFormat, header, compression):
+    """ Format a chunk of rows as text, with the header row when header is set, and compress it into bytes. """
+    # homologene ids are stored as floats to allow missing ones, write integers
+    if "HG ID" in chunk.columns:
+        chunk = chunk.assign(**{"HG ID": chunk["HG ID"].round().astype("Int64")})
+    text = chunk.to_csv(
+        None, sep=separator, float_format=floatFormat, header=header, index=False
+    )
+    data = text.encode()
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if compression == "zstd":
+        return pa.compress(data, codec="zstd", asbytes=True)
+    return data
+
+
+def _writeText(chunks, path, separator, floatFormat, compression, workers):
+    """ Format and compress chunks on a process pool and append them to path in order. """
+    with open(f"{path}.tmp", "wb") as f:
+        if workers == 1:
+            for number, chunk in enumerate(chunks):
+                f.write(
+                    formatChunk(chunk, separator, floatFormat, number == 0, compression)
+                )
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # keep a couple of chunks per worker in flight, written in order
+                limit = 2 * workers
+                pending = deque()
+                for number, chunk in enumerate(chunks):
+                    pending.append(
+                        executor.submit(
+                            formatChunk,
+                            chunk,
+                            separator,
+                            floatFormat,
+                            number == 0,
+                            compression,
+                        )
+                    )
+                    if len(pending) >= limit:
+                        f.write(pending.popleft().result())
+                while pending:
+                    f.write(pending.popleft().result())
+    os.replace(f"{path}.tmp", path)
+
+
+def _writeParquet(chunks, path, compression):
+    """ Write chunks to a parquet file, one row group per chunk. """
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(
+                    f"{path}.tmp",
+                    table.schema,
+                    compression=None if compression == "none" else compression,
+                )
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(f"{path}.tmp", path)
+
+
+def exportFrame(
+    df,
+    basePath,
+    fileFormat="csv",
+    compression="none",
+    floatFormat=FLOAT_FORMAT,
+    chunkSize=CHUNK_SIZE,
+    workers=None,
+):
+    """ Export a dataframe, or an iterator of dataframe chunks, to basePath plus the extensions of the format and compression, and return the path written. Text formats are formatted by workers processes (one per core by default), frames smaller than a chunk by this process. """
+    if fileFormat not in FORMATS:
+        raise ValueError(f"unknown export format {fileFormat!r}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"unknown export compression {compression!r}")
+    path = exportPath(basePath, fileFormat, compression)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if hasattr(df, "iloc"):
+        # a pool is not worth starting for a single chunk
+        if len(df) <= chunkSize:
+            workers = 1
+        chunks = _chunks(df, chunkSize)
+    else:
+        chunks = df
+    try:
+        if fileFormat == "parquet":
+            _writeParquet(chunks, path, compression)
+        else:
+            _writeText(
+                chunks, path, SEPARATORS[fileFormat], floatFormat, compression, workers
+            )
+    except BaseException:
+        # a failed export leaves no partial file behind in outfiles/
+        if os.path.exists(f"{path}.tmp"):
+            os.remove(f"{path}.tmp")
+        raise
+    return path
+
+
+def exportDataset(tablePath, basePath, chunkSize=CHUNK_SIZE, **options):
+    """ Stream the parquet table of a stored dataset into an export batch by batch, so it never has to fit in memory, and return the path written. Other keyword arguments are passed on to exportFrame(). """
+    parquetFile = pq.ParquetFile(tablePath)
+    chunks = (
+        batch.to_pandas() for batch in parquetFile.iter_batches(batch_size=chunkSize)
+    )
+    return exportFrame(chunks, basePath, chunkSize=chunkSize, **options)
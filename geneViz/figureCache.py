@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+Module that caches the rendered figures of the visualizer, so a graph that was
+already drawn for the same datasets, genes, replicate mode, page and view is served
+as image bytes instead of being drawn by matplotlib again, by any session.
+
+Figures are keyed by a hash of a canonical description of what they show along with
+the versions of their datasets (see datasetCache), so rewriting a dataset retires
+its figures. Rendered PNG or SVG bytes are kept in memory, shared by every session
+of the app process and bounded by GENEVIZ_FIGURE_CACHE_MB (64 by default), and
+written to cache/figures (or GENEVIZ_FIGURE_DIR, none when set to an empty string),
+bounded by GENEVIZ_FIGURE_DIR_MB (256 by default), so other app processes and
+restarts reuse them too; the oldest files are removed beyond that.
+
+Functions:
+    figureKey(): canonical hash of what a figure shows
+    renderFigure(): PNG or SVG bytes of a figure
+    cachedFigure(): cached rendered bytes of a figure
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+from datasetCache import LRUCache
+
+FIGURE_CACHE_MB = float(os.environ.get("GENEVIZ_FIGURE_CACHE_MB", 64))
+FIGURE_DIR = os.environ.get("GENEVIZ_FIGURE_DIR", "../cache/figures")
+FIGURE_DIR_MB = float(os.environ.get("GENEVIZ_FIGURE_DIR_MB", 256))
+FORMATS = ("png", "svg")
+DPI = 100
+FIGURES = LRUCache(FIGURE_CACHE_MB * 1024 ** 2)
+# serializes the pruning of the figure directory between sessions
+_pruneLock = threading.Lock()
+
+
+def figureKey(page, datasets, genes, replicateMode, view, versions, **extra):
+    """ Hex digest of a canonical description of a figure: its page, datasets, genes, replicate mode, view, dataset -> version map and any extra settings it depends on. """
+    description = {
+        "page": page,
+        "datasets": list(datasets),
+        "genes": list(genes),
+        "replicates": replicateMode,
+        "view": view,
+        "versions": {name: versions[name] for name in datasets},
+        "extra": extra,
+    }
+    canonical = json.dumps(description, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def renderFigure(fig, fileFormat="png"):
+    """ PNG or SVG bytes of a matplotlib figure, with the legend outside its axes kept in. """
+    if fileFormat not in FORMATS:
+        raise ValueError(f"unknown figure format {fileFormat!r}")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fileFormat, dpi=DPI, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+def _prune(figureDir, budget):
+    """ Remove the least recently written figures of a directory until it holds no more than budget bytes. """
+    with _pruneLock:
+        files = []
+        for entry in os.scandir(figureDir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= budget:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # removed by another process meanwhile
+                pass
+            total -= size
+
+
+def cachedFigure(key, draw, fileFormat="png", figureDir=FIGURE_DIR):
+    """ Rendered bytes of the figure of a key, from memory, then the figure directory, calling draw() to build the figure only when neither holds it. """
+
+    def load():
+        path = None
+        if figureDir:
+            path = os.path.join(figureDir, f"{key}.{fileFormat}")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return f.read()
+        data = renderFigure(draw(), fileFormat)
+        if path is not None:
+            # written under a temporary name first so readers never see half a file
+            os.makedirs(figureDir, exist_ok=True)
+            temporary = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+            _prune(figureDir, FIGURE_DIR_MB * 1024 ** 2)
+        return data
+
+    return FIGURES.get(("figure", fileFormat, key), load)
@@ -5,159 +5,200 @@ Module that handles the file cleaning of GEO series data. Specifically GSE23006,
 
 Classes:
     SeriesData: class that will contain the parsed out data file as well as methods to clean the data file
-    ExistingData: class that is used to serialized already annotated data into pickle objects
+    ExistingData: class that is used to store already annotated data as parquet datasets
 """
-import re
+import numpy as np
 import pandas as pd
-import mygene
+from annotationBackend import MyGeneBackend
+from datasetStore import cleanColumns, datasetPath, writeDataset, writePartitions
+from exportEngine import exportFrame
+from probeCollapse import collapseProbes
+from seriesParser import parseSeriesMatrix, seriesName
+
+# columns a pre cleaned csv must have to be stored as a dataset
+REQUIRED_COLUMNS = ["Gene Name"]
 
 
 class SeriesData:
     """
     Class to contain all methods relating to parsing out raw data as well as calling
-    mygene api to annotate with extra information.
-
-    Initialized: boolean variable to hold whether data will be output as csv as well,
-    name of file, types of samples contained in the file, pandas dataframe to hold
-    filtered data, list of all affymetrix probe ids, pandas dataframe to hold new
-    information from mygene api, and finally pandas dataframe for the combination of
-    filtered data and new information from mygene api
-
-    Methods: myGeneCall(): query mygene api with affymetrix probe ids and store
-    resulting information in pandas dataframe, dataframeOutputter(): serialize
-    pandas dataframe into pickle object and export annotated data if output is
-    true, combineDataFrame(): outer merge both filtered data and new information
-    obtained from mygene api into a single pandas dataframe while dropping duplicates
+    an annotation backend (mygene api or a local platform table) to annotate with
+    extra information.
+
+    Initialized: boolean variable to hold whether data will be output as csv (or
+    another export format) as well, options of that export, name of file, types
+    of samples contained in the file, parsed series matrix with its header
+    metadata (parsed from the file unless one is given), pandas dataframe to hold
+    typed expression data, platform id, list of all affymetrix probe ids, pandas
+    dataframe to hold new information from the annotation backend, pandas
+    dataframe for the combination of filtered data and new information from the
+    annotation backend, and finally the number of probes that were collapsed into
+    every gene
+
+    Methods: annotate(): annotate affymetrix probe ids with an annotation backend,
+    mygene api by default, and store resulting information in pandas dataframe,
+    dataframeOutputter(): store pandas dataframe as a parquet dataset, partitioned
+    by sample type when there are several, and export annotated data if output is
+    true, sampleTypeColumns(): map every sample type to its sample columns,
+    sampleGsmIDs(): map every sample column to its GSM id,
+    combineDataFrame(): join filtered data and new information obtained from the
+    annotation backend into a single pandas dataframe while collapsing the probes
+    of every gene into one row
     """
 
-    def __init__(self, output, fileName, sampleTypes):
-        self.output = output  # determines whether file is output as csv
+    def __init__(self, output, fileName, sampleTypes, series=None, exportOptions=None):
+        self.output = output  # determines whether file is output to outfiles/
+        # format, compression and float format of the output, see exportEngine
+        self.exportOptions = exportOptions or {}
         self.filename = fileName
         self.sampleTypes = sampleTypes
         filenamePath = f"../infiles/{fileName}"  # relative path of file
-        # regex for matching sample title and rows in data table
-        regex = r"^!Sample(?=_title).*|^[^!I].*"
-        reCompiled = re.compile(regex)  # compile regex for speed
-        # open the file and filter out lines that match regex
-        with open(filenamePath, "r") as f:
-            tableData = f.readlines()
-            filterData = list(filter(reCompiled.match, tableData))
-        # split the data on the tab character to get each row as element in list
-        cleanedData = list(map(lambda x: x.split("\t"), filterData))
-        self.df = pd.DataFrame(cleanedData[3:], columns=cleanedData[1])
-        # rename column with affy probe ID
-        self.df.rename(columns={"!Sample_title": "affy_gene_probe_id"}, inplace=True)
-        self.df["affy_gene_probe_id"] = self.df["affy_gene_probe_id"].str.replace(
-            '"', ""
-        )
-        # take out quotes from affy probe ids and convert it to list
-        self.affyProbeIDs = self.df["affy_gene_probe_id"].str.replace('"', "").to_list()
+        # stream the series matrix straight into typed expression columns, unless
+        # it was already parsed by an earlier ingest
+        if series is None:
+            series = parseSeriesMatrix(filenamePath)
+        self.series = series
+        self.df = self.series.df
+        self.platform = self.series.platform
+        # list of all the affy probe ids
+        self.affyProbeIDs = self.df["affy_gene_probe_id"].to_list()
         # initialize empty object parameters here for clarity
         self.geneAnnotateDf = None
         self.combinedDf = None
+        self.probeCounts = None
 
-    def myGeneCall(self):
-        """ Query MyGene API with all the affymetrix probe IDs and for each, get: gene symbol, gene name, refseq id, and homologene id. """
-        mg = mygene.MyGeneInfo()
-        # query with affy probe ids
-        self.geneAnnotateDf = mg.querymany(
-            self.affyProbeIDs,
-            scopes="reporter",
-            fields="symbol, name, refseq, homologene, acession",
-            as_dataframe=True,
-            df_index=False,
-            verbose=False,
-        )
-        # drop these columns
-        self.geneAnnotateDf.drop(
-            [
-                "_id",
-                "_score",
-                "homologene.genes",
-                "refseq.protein",
-                "refseq.rna",
-                "refseq.translation",
-                "refseq.translation.protein",
-                "refseq.translation.rna",
-                "notfound",
-            ],
-            axis=1,
-            inplace=True,
-        )
-        self.geneAnnotateDf.dropna(axis=0, inplace=True)
-        # reorder columns
-        self.geneAnnotateDf = self.geneAnnotateDf.reindex(
-            columns=[
-                "query",
-                "homologene.id",
-                "symbol",
-                "name",
-                "refseq.genomic",
-            ],
-        )
-        # rename to more human readable form
-        self.geneAnnotateDf.rename(
-            columns={
-                "query": "affy_gene_probe_id",
-                "homologene.id": "HG ID",
-                "symbol": "Gene Name",
-                "name": "Gene Description",
-                "refseq.genomic": "RefSeq",
-            },
-            inplace=True,
-        )
+    def annotate(self, backend=None):
+        """ Annotate all the affymetrix probe IDs with gene symbol, gene name, refseq id, and homologene id using the given annotation backend, mygene api by default. """
+        if backend is None:
+            backend = MyGeneBackend()
+        self.geneAnnotateDf = backend.annotate(self.platform, self.affyProbeIDs)
 
     def dataframeOutputter(self):
-        """ Serialize combinded dataframe as pickle object located in data/ directory and output as csv if output is selected. """
+        """ Store combinded dataframe as a parquet dataset located in data/ directory and export it to outfiles/ if output is selected. Return the paths of everything written. """
+        outputs = []
         # if there are more than one type of sample in a given dataset
         if len(self.sampleTypes) > 1:
-            for sample in self.sampleTypes:
-                # filter out columns that have the sample that we are looking for
-                sampleColumns = self.combinedDf.columns[
-                    ~self.combinedDf.columns.str.contains(sample)
-                ].to_list()
-                # output to csv file located in outfiles/
-                if self.output is True:
-                    self.combinedDf[sampleColumns].to_csv(
-                        f"../outfiles/{self.filename[:-4]}_{sample}.csv", index=False
+            name = seriesName(self.filename)
+            # columns of every sample type, found once from the header
+            partitions = self.sampleTypeColumns()
+            annotationColumns = [
+                column
+                for column in self.combinedDf.columns
+                if column not in self.df.columns
+            ]
+            # output to csv (or other export format) files located in outfiles/
+            if self.output is True:
+                for sample, sampleColumns in partitions.items():
+                    outputs.append(
+                        exportFrame(
+                            self.combinedDf[annotationColumns + sampleColumns],
+                            f"../outfiles/{name}_{sample}",
+                            **self.exportOptions,
+                        )
                     )
-                # serialize dataframe to pickle object located in data/
-                self.combinedDf[sampleColumns].to_pickle(
-                    f"../data/{self.filename[:-4]}_{sample}.pkl"
-                )
+            # store every sample type as a partition of one dataset in data/
+            writePartitions(
+                self.combinedDf, name, partitions, gsmIDs=self.sampleGsmIDs()
+            )
+            outputs.append(datasetPath(name))
 
         # same as above if there is only one sample type in given dataset
         else:
             if self.output is True:
-                self.combinedDf.to_csv(
-                    f"../outfiles/{self.filename[:-4]}.csv", index=False
+                outputs.append(
+                    exportFrame(
+                        self.combinedDf,
+                        f"../outfiles/{seriesName(self.filename)}",
+                        **self.exportOptions,
+                    )
                 )
-            self.combinedDf.to_pickle(f"../data/{self.filename[:-4]}.pkl")
-
-    def combineDataFrame(self):
-        """ Combine filtered data and new annotations from my gene api into one file. Also drop duplicated gene names. """
-        # merge on probe ids and unionize keys of both dataframes
-        self.combinedDf = pd.merge(
-            self.geneAnnotateDf, self.df, on="affy_gene_probe_id", how="outer"
+            writeDataset(
+                self.combinedDf,
+                seriesName(self.filename),
+                sampleType=self.sampleTypes[0] if self.sampleTypes else None,
+                gsmIDs=self.sampleGsmIDs(),
+            )
+            outputs.append(datasetPath(seriesName(self.filename)))
+        return outputs
+
+    def sampleTypeColumns(self):
+        """ Map every sample type that has samples to its sample columns. A sample belongs to the type named in its title, or else in its source or characteristics in the header, the longest name winning when several match. """
+        titles = self.df.columns[1:]
+        # header fields that describe what every sample is, title first
+        fields = [list(titles)] + [
+            self.series.sampleInfo[key]
+            for key in ("source_name_ch1", "characteristics_ch1")
+            if len(self.series.sampleInfo.get(key, [])) == len(titles)
+        ]
+        # longest names first so "liver tumor" is not taken for "liver"
+        sampleTypes = sorted(self.sampleTypes, key=len, reverse=True)
+        partitions = {sample: [] for sample in self.sampleTypes}
+        for position, title in enumerate(titles):
+            for field in fields:
+                value = field[position].lower()
+                matches = [sample for sample in sampleTypes if sample.lower() in value]
+                if matches:
+                    partitions[matches[0]].append(title)
+                    break
+        # sample types that name no sample have nothing to store
+        return {sample: columns for sample, columns in partitions.items() if columns}
+
+    def sampleGsmIDs(self):
+        """ Map every sample column to the GSM id of its sample. """
+        return dict(zip(self.df.columns[1:], self.series.sampleIDs))
+
+    def combineDataFrame(self, policy="first"):
+        """ Combine filtered data and new annotations from the annotation backend into one dataframe with one row per gene, collapsing the probes of a gene with policy (see probeCollapse). """
+        probeColumn = self.df.columns[0]
+        # annotated probes with a gene name, one annotation per probe
+        annotations = self.geneAnnotateDf.dropna(subset=["Gene Name"])
+        annotations = annotations.drop_duplicates(subset=probeColumn)
+        # expression row of every annotated probe, -1 when it has none
+        rows = pd.Index(self.df[probeColumn]).get_indexer(annotations[probeColumn])
+        # numeric block of the series, taken once and collapsed in place
+        matrix = self.df.iloc[:, 1:].to_numpy()
+        found = rows >= 0
+        # drop probes with missing expression values
+        found[found] = ~np.isnan(matrix).any(axis=1)[rows[found]]
+        # probes in the order of the series, whatever order the backend returned
+        # them in, so the probe kept for every gene does not depend on it
+        order = np.argsort(rows[found], kind="stable")
+        annotations = annotations[found].iloc[order]
+        genes, representatives, collapsed, counts = collapseProbes(
+            annotations["Gene Name"].to_numpy(), matrix, policy, rows[found][order]
+        )
+        self.probeCounts = pd.Series(counts, index=genes, name="probes")
+        self.probeCounts.index.name = "Gene Name"
+        # annotations of the probe representing every gene next to its values
+        self.combinedDf = pd.concat(
+            [
+                annotations.iloc[representatives]
+                .drop(columns=probeColumn)
+                .reset_index(drop=True),
+                pd.DataFrame(collapsed, columns=self.df.columns[1:]),
+            ],
+            axis=1,
         )
-
-        # drop all nan
-        self.combinedDf.dropna(axis=0, inplace=True)
-        # drop the column containing affymetrix probe ids, not needed anymore
-        self.combinedDf.drop(["affy_gene_probe_id"], axis=1, inplace=True)
-        # drop duplicated gene names
-        self.combinedDf.drop_duplicates(subset="Gene Name", inplace=True)
 
 
 class ExistingData:
     """
-    Class to serialize pre cleaned data into pickle objects located in data/
+    Class to store pre cleaned data as parquet datasets located in data/
 
-    Initialized: pandas dataframe that reads in csv of pre cleaned data
+    Initialized: pandas dataframe that reads in csv of pre cleaned data, raising
+    ValueError when it lacks one of REQUIRED_COLUMNS
     """
 
     def __init__(self, filename):
         # read in csv
         self.existDf = pd.read_csv(f"../infiles/{filename}")
-        # serialize as pickle object located in data/
-        self.existDf.to_pickle(f"../data/{filename[:-4]}.pkl")
+        # column names are compared the way writeDataset() cleans them
+        columns = cleanColumns(self.existDf.head(0)).columns
+        missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise ValueError(
+                f"{filename} has no {', '.join(missing)} column, the header of a"
+                " pre cleaned csv is described in the README"
+            )
+        # store as a parquet dataset located in data/
+        writeDataset(self.existDf, filename[:-4])
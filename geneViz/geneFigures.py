@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+"""
+Module that draws the figures of the visualizer. Every series of a figure is drawn
+by one vectorized call, a line collection of all genes or a single scatter of all
+points, rather than one plot call per gene, and figures of more genes than a
+threshold (set with the GENEVIZ_PLOT_GENES environment variable, 30 by default)
+switch to an aggregate view: the median of the genes at every timepoint with the
+bands between their 25th and 75th and their 5th and 95th percentiles, or a heatmap.
+Thousands of genes draw in well under a second either way.
+
+Figures are built without pyplot, so they can be drawn from any thread and are
+freed as soon as they are no longer referenced.
+
+Views:
+    auto: series up to the threshold, band above it
+    series: every gene as its own line, or its own points in a comparison
+    band: median and quantile bands of the genes at every timepoint
+    heatmap: genes by samples, genes ordered by the sample of their maximum
+
+Functions:
+    chooseView(): view a figure of a number of genes is drawn with
+    drawSeries(): draw every gene of a genes x samples matrix as a line
+    drawBand(): draw the median and quantile bands of a genes x samples matrix
+    drawHeatmap(): draw a genes x samples matrix as a heatmap
+    individualFigure(): figure of the genes of one dataset
+    comparisonFigure(): figure of the genes of several datasets
+"""
+
+import os
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba_array
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+
+PLOT_THRESHOLD = int(os.environ.get("GENEVIZ_PLOT_GENES", 30))
+VIEWS = ("auto", "series", "band", "heatmap")
+# percentiles of the inner and outer bands of the band view
+BANDS = ((25, 75, 0.35), (5, 95, 0.15))
+# colors of the series, cycled through as matplotlib does
+COLORS = to_rgba_array([f"C{i}" for i in range(10)])
+
+
+def chooseView(genes, view="auto", threshold=PLOT_THRESHOLD):
+    """ View a figure of a number of genes is drawn with, the series of every gene up to the threshold and the median and quantile bands above it unless a view is chosen, raising ValueError for unknown views. """
+    if view not in VIEWS:
+        raise ValueError(f"unknown view {view!r}")
+    if view != "auto":
+        return view
+    return "series" if genes <= threshold else "band"
+
+
+def _legend(ax, handles):
+    """ Put a legend of handles outside the right of the axes. """
+    ax.legend(handles=handles, bbox_to_anchor=(1.05, 1.0), loc="upper left")
+
+
+def drawSeries(ax, hours, values, labels=None):
+    """ Draw every row of a genes x samples matrix as a line over the timepoints in hours of its samples, all in one line collection, with a legend of labels when given. """
+    values = np.asarray(values, dtype="float64")
+    hours = np.asarray(hours, dtype="float64")
+    colors = COLORS[np.arange(len(values)) % len(COLORS)]
+    # genes x samples x (hours, value) vertices of every line at once
+    segments = np.stack([np.broadcast_to(hours, values.shape), values], axis=-1)
+    ax.add_collection(LineCollection(segments, colors=colors, alpha=0.5))
+    ax.autoscale_view()
+    if labels is not None:
+        handles = [
+            Line2D([], [], color=color, label=label)
+            for color, label in zip(colors, labels)
+        ]
+        _legend(ax, handles)
+
+
+def _quantiles(hours, values, percentiles):
+    """ Sorted unique timepoints of the samples and the percentiles of the values of all genes and samples at every one of them, a timepoints x percentiles matrix. """
+    timepoints = np.unique(hours[~np.isnan(hours)])
+    quantiles = np.full((len(timepoints), len(percentiles)), np.nan)
+    for i, timepoint in enumerate(timepoints):
+        atTimepoint = values[:, hours == timepoint].ravel()
+        atTimepoint = atTimepoint[~np.isnan(atTimepoint)]
+        if len(atTimepoint):
+            quantiles[i] = np.percentile(atTimepoint, percentiles)
+    return timepoints, quantiles
+
+
+def drawBand(ax, hours, values, color="C0", label=None):
+    """ Draw the median of the rows of a genes x samples matrix at every timepoint in hours, between the bands of their 25th to 75th and 5th to 95th percentiles. """
+    values = np.asarray(values, dtype="float64")
+    hours = np.asarray(hours, dtype="float64")
+    percentiles = [50] + [p for low, high, _ in BANDS for p in (low, high)]
+    timepoints, quantiles = _quantiles(hours, values, percentiles)
+    for i, (low, high, alpha) in enumerate(BANDS):
+        ax.fill_between(
+            timepoints,
+            quantiles[:, 1 + 2 * i],
+            quantiles[:, 2 + 2 * i],
+            color=color,
+            alpha=alpha,
+            linewidth=0,
+        )
+    ax.plot(timepoints, quantiles[:, 0], color=color, label=label)
+
+
+def drawHeatmap(ax, hours, values, labels=None):
+    """ Draw a genes x samples matrix as a heatmap, the genes ordered by the sample of their maximum and labelled when labels are given, the samples by their timepoint in hours. """
+    values = np.asarray(values, dtype="float64")
+    ax.set_ylabel(f"{len(values)} genes")
+    if not values.size:
+        return
+    filled = np.where(np.isnan(values), -np.inf, values)
+    order = np.argsort(filled.argmax(axis=1), kind="stable")
+    image = ax.imshow(values[order], aspect="auto", interpolation="nearest")
+    ax.figure.colorbar(image, ax=ax, label="Intensity")
+    ax.set_xticks(np.arange(len(hours)))
+    ax.set_xticklabels([f"{h:g}" for h in hours], rotation=90)
+    if labels is not None:
+        ax.set_yticks(np.arange(len(order)))
+        ax.set_yticklabels(np.asarray(labels)[order])
+    else:
+        ax.set_yticks([])
+
+
+def _figure(title, xlabel="Time (hours)", ylabel="Intensity"):
+    """ New figure and axes with a title and axis labels. """
+    fig = Figure()
+    ax = fig.subplots()
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    return fig, ax
+
+
+def individualFigure(
+    values, hours, genes, title, view="auto", threshold=PLOT_THRESHOLD
+):
+    """ Figure of a genes x samples matrix of one dataset over the timepoints in hours of its samples, drawn with the chosen view, genes are only named in the legend up to the threshold. """
+    view = chooseView(len(genes), view, threshold)
+    fig, ax = _figure(title)
+    labels = list(genes) if len(genes) <= threshold else None
+    if view == "series":
+        drawSeries(ax, hours, values, labels)
+    elif view == "band":
+        drawBand(ax, hours, values, label=f"median of {len(genes)} genes")
+        _legend(ax, None)
+    else:
+        drawHeatmap(ax, hours, values, labels)
+    return fig
+
+
+def comparisonFigure(frame, title, view="auto", threshold=PLOT_THRESHOLD):
+    """ Figure of a tidy frame of the expression of genes in several datasets, as query.query() and homologJoin.homologQuery() return, drawn with the chosen view. Series are the genes of every homolog group and dataset, drawn as one scatter of all their points, or one band or block of heatmap rows per dataset. Genes without a HG ID are matched across datasets by their symbol. """
+    # what matches genes across datasets: their homolog group, else their symbol
+    hgIDs = frame["HG ID"].astype("float64")
+    frame = frame.assign(
+        match=np.where(
+            hgIDs.isna(),
+            frame["Gene Name"].astype(str),
+            "HG " + hgIDs.fillna(0).astype("int64").astype(str),
+        )
+    )
+    keys = ["match", "dataset", "Gene Name"]
+    groups = frame.groupby(keys, sort=True, observed=True).ngroup().to_numpy()
+    series = groups.max() + 1 if len(groups) else 0
+    view = chooseView(series, view, threshold)
+    fig, ax = _figure(title)
+    if view == "series":
+        # every point of every series in a single scatter, colored by its series
+        colors = COLORS[groups % len(COLORS)]
+        ax.scatter(frame["timepoint"], frame["value"], c=colors, alpha=0.3)
+        if series <= threshold:
+            names = frame[keys].drop_duplicates().sort_values(keys).to_numpy()
+            handles = [
+                Line2D(
+                    [],
+                    [],
+                    marker="o",
+                    linestyle="",
+                    color=COLORS[i % len(COLORS)],
+                    label=f"{gene}_{dataset}"
+                    + (f" ({match})" if match.startswith("HG ") else ""),
+                )
+                for i, (match, dataset, gene) in enumerate(names)
+            ]
+            _legend(ax, handles)
+    elif view == "band":
+        for i, (dataset, values) in enumerate(frame.groupby("dataset", sort=True)):
+            drawBand(
+                ax,
+                values["timepoint"].to_numpy(),
+                values["value"].to_numpy()[np.newaxis],
+                color=COLORS[i % len(COLORS)],
+                label=f"{dataset} ({values['Gene Name'].nunique()} genes)",
+            )
+        _legend(ax, None)
+    else:
+        # one row per homolog group (or symbol) and dataset, one column per timepoint
+        matrix = frame.pivot_table(
+            index=["dataset", "match"], columns="timepoint", values="value"
+        )
+        labels = None
+        if len(matrix) <= threshold:
+            labels = [f"{dataset} {match}" for dataset, match in matrix.index]
+        drawHeatmap(ax, matrix.columns.to_numpy(dtype="float64"), matrix, labels)
+    return fig
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+"""
+Module that maintains the gene index of the datasets in data/: for every dataset a
+gene name -> row offset sidecar and a homologene id -> row offset sidecar stored
+next to its table, and a global sqlite index of (gene, dataset, row) and of
+(homologene id, dataset, row, gene) across every dataset. The index is updated
+whenever a dataset is written, so finding the rows of a few genes, or of the genes
+of a homolog group, across many datasets, or the datasets that contain a gene,
+never needs to open a data file. Every write of a dataset has a version, stored with
+its table, its sidecars and its entry of the index, so offsets indexed for another
+write of the dataset than the one on disk, after a failed or concurrent write, are
+never used (see rowsOf()).
+
+Classes:
+    GeneIndex: global cross dataset gene index stored in data/geneIndex.sqlite
+
+Functions:
+    geneRows(): gene -> row offset map of the gene column of a dataset
+    homologRows(): homologene id -> row offset map of the HG ID column of a dataset
+    writeSidecar(): write the gene -> row offset map of a single dataset
+    readSidecar(): read the gene -> row offset map of a single dataset
+"""
+
+import json
+import os
+import sqlite3
+import pandas as pd
+
+INDEX_FILE = "geneIndex.sqlite"
+SIDECAR_FILE = "genes.json"
+HOMOLOG_SIDECAR_FILE = "homologs.json"
+
+
+def geneRows(genes):
+    """ Gene -> row offset map of the gene column of a dataset, keeping the first row of duplicated genes. """
+    rows = {}
+    for row, gene in enumerate(genes):
+        rows.setdefault(gene, row)
+    return rows
+
+
+def homologRows(hgIDs):
+    """ Homologene id -> row offset map of the HG ID column of a dataset, keeping the first row of every id and skipping missing ones. """
+    rows = {}
+    for row, hgID in enumerate(hgIDs):
+        if hgID == hgID and hgID is not None:
+            rows.setdefault(int(hgID), row)
+    return rows
+
+
+def writeSidecar(path, rows, version=None):
+    """ Write the gene -> row offset map of a dataset, or its homologene id -> row offset map, along with the version of the dataset they were taken from, replacing the old one atomically. """
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"version": version, "rows": rows}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def readSidecar(path):
+    """ Read the gene -> row offset map of a dataset, or its homologene id -> row offset map, and the version of the dataset they were taken from, None for sidecars of older versions. """
+    with open(path, "r") as f:
+        sidecar = json.load(f)
+    version = None
+    # older sidecars are the bare map
+    if set(sidecar) == {"version", "rows"} and isinstance(sidecar["rows"], dict):
+        sidecar, version = sidecar["rows"], sidecar["version"]
+    # json keys are strings, homologene ids are numbers
+    if os.path.basename(path) == HOMOLOG_SIDECAR_FILE:
+        sidecar = {int(hgID): row for hgID, row in sidecar.items()}
+    return sidecar, version
+
+
+class GeneIndex:
+    """
+    Class to wrap the global gene index of all the datasets in data/.
+
+    Initialized: data directory the index belongs to, path of the sqlite database
+    in it, and open connection to the database
+
+    Methods: addDataset(): index (or reindex) the genes and homolog groups of a
+    dataset, removeDataset(): drop a dataset from the index, datasets(): names of
+    the indexed datasets, versionOf(): version of a dataset that was indexed,
+    datasetsWithGene(): datasets that contain a gene, datasetsWithHomolog():
+    datasets that contain a homolog group, lookup(): rows of a list of genes in a
+    list of datasets, rowsOf(): gene -> row map of some genes in one dataset when
+    indexed from the version on disk, homologsOf(): homolog groups of one dataset
+    with their rows and genes, rebuild(): recreate the index from the sidecars in
+    data/
+    """
+
+    def __init__(self, dataDir):
+        self.dataDir = dataDir
+        self.path = os.path.join(dataDir, INDEX_FILE)
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS genes (
+                gene TEXT NOT NULL,
+                dataset TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                PRIMARY KEY (gene, dataset)
+            );
+            CREATE INDEX IF NOT EXISTS genes_dataset ON genes (dataset);
+            CREATE TABLE IF NOT EXISTS homologs (
+                hgid INTEGER NOT NULL,
+                dataset TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                gene TEXT NOT NULL,
+                PRIMARY KEY (hgid, dataset)
+            );
+            CREATE INDEX IF NOT EXISTS homologs_dataset ON homologs (dataset);
+            CREATE TABLE IF NOT EXISTS versions (
+                dataset TEXT PRIMARY KEY,
+                version TEXT
+            );
+            """
+        )
+
+    def addDataset(self, name, rows, homologs=None, version=None):
+        """ Index the gene -> row offset map of a dataset, and its homologene id -> row offset map when given, taken from the given version of the dataset, replacing what was indexed for it before. """
+        # gene of every row a homolog group points to
+        genes = {row: gene for gene, row in rows.items()}
+        with self.connection:
+            self.connection.execute("DELETE FROM genes WHERE dataset = ?", (name,))
+            self.connection.executemany(
+                "INSERT INTO genes VALUES (?, ?, ?)",
+                ((gene, name, row) for gene, row in rows.items()),
+            )
+            self.connection.execute("DELETE FROM homologs WHERE dataset = ?", (name,))
+            self.connection.executemany(
+                "INSERT INTO homologs VALUES (?, ?, ?, ?)",
+                (
+                    (hgID, name, row, genes[row])
+                    for hgID, row in (homologs or {}).items()
+                    if row in genes
+                ),
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO versions VALUES (?, ?)", (name, version)
+            )
+
+    def removeDataset(self, name):
+        """ Drop a dataset from the index. """
+        with self.connection:
+            self.connection.execute("DELETE FROM genes WHERE dataset = ?", (name,))
+            self.connection.execute("DELETE FROM homologs WHERE dataset = ?", (name,))
+            self.connection.execute("DELETE FROM versions WHERE dataset = ?", (name,))
+
+    def datasets(self):
+        """ Sorted names of every indexed dataset. """
+        cursor = self.connection.execute(
+            "SELECT DISTINCT dataset FROM genes ORDER BY dataset"
+        )
+        return [dataset for (dataset,) in cursor]
+
+    def versionOf(self, name):
+        """ Version of a dataset its rows were indexed from, None when it is unknown. """
+        row = self.connection.execute(
+            "SELECT version FROM versions WHERE dataset = ?", (name,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def datasetsWithGene(self, gene):
+        """ Sorted names of the datasets that contain gene. """
+        cursor = self.connection.execute(
+            "SELECT dataset FROM genes WHERE gene = ? ORDER BY dataset", (gene,)
+        )
+        return [dataset for (dataset,) in cursor]
+
+    def datasetsWithHomolog(self, hgID):
+        """ Sorted names of the datasets that contain a gene of the homolog group hgID. """
+        cursor = self.connection.execute(
+            "SELECT dataset FROM homologs WHERE hgid = ? ORDER BY dataset", (hgID,)
+        )
+        return [dataset for (dataset,) in cursor]
+
+    def lookup(self, genes, datasets=None):
+        """ Dataframe of (gene, dataset, row) for genes, restricted to datasets when given. """
+        query = "SELECT genes.gene, dataset, row FROM genes JOIN wanted USING (gene)"
+        params = []
+        if datasets is not None:
+            datasets = list(datasets)
+            query += f" WHERE dataset IN ({','.join('?' * len(datasets))})"
+            params = datasets
+        # join against a temporary table so that any number of genes can be asked
+        # for, inside a transaction that ends before returning so no lock is held
+        with self.connection:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS wanted (gene TEXT)"
+            )
+            self.connection.execute("DELETE FROM wanted")
+            self.connection.executemany(
+                "INSERT INTO wanted VALUES (?)", ((gene,) for gene in set(genes))
+            )
+            return pd.read_sql_query(query, self.connection, params=params)
+
+    def rowsOf(self, name, genes, version=None):
+        """ Gene -> row map of the genes found in a dataset, None if the dataset is not indexed or was indexed from another version of it than the one on disk, version. """
+        if (
+            self.connection.execute(
+                "SELECT 1 FROM genes WHERE dataset = ? LIMIT 1", (name,)
+            ).fetchone()
+            is None
+        ):
+            return None
+        if self.versionOf(name) != version:
+            return None
+        found = self.lookup(genes, [name])
+        return dict(zip(found["gene"], found["row"]))
+
+    def homologsOf(self, name):
+        """ Dataframe of the (hgid, row, gene) of every homolog group of a dataset sorted by hgid, None if the dataset is not indexed. """
+        if (
+            self.connection.execute(
+                "SELECT 1 FROM genes WHERE dataset = ? LIMIT 1", (name,)
+            ).fetchone()
+            is None
+        ):
+            return None
+        return pd.read_sql_query(
+            "SELECT hgid, row, gene FROM homologs WHERE dataset = ? ORDER BY hgid",
+            self.connection,
+            params=(name,),
+        )
+
+    def rebuild(self):
+        """ Recreate the index from the sidecar of every dataset in data/, including the partitions of partitioned datasets. """
+        with self.connection:
+            self.connection.execute("DELETE FROM genes")
+            self.connection.execute("DELETE FROM homologs")
+            self.connection.execute("DELETE FROM versions")
+        for entry in sorted(os.listdir(self.dataDir)):
+            entryPath = os.path.join(self.dataDir, entry)
+            if not os.path.isdir(entryPath):
+                continue
+            if os.path.exists(os.path.join(entryPath, SIDECAR_FILE)):
+                self._addFromSidecars(entry, entryPath)
+                continue
+            for partition in sorted(os.listdir(entryPath)):
+                partitionPath = os.path.join(entryPath, partition)
+                if os.path.exists(os.path.join(partitionPath, SIDECAR_FILE)):
+                    self._addFromSidecars(f"{entry}/{partition}", partitionPath)
+
+    def _addFromSidecars(self, name, path):
+        """ Index a dataset from the sidecars in its directory. """
+        homologs = None
+        rows, version = readSidecar(os.path.join(path, SIDECAR_FILE))
+        if os.path.exists(os.path.join(path, HOMOLOG_SIDECAR_FILE)):
+            homologs, homologVersion = readSidecar(
+                os.path.join(path, HOMOLOG_SIDECAR_FILE)
+            )
+            # homolog groups of another write than the genes are left out
+            if homologVersion != version:
+                homologs = None
+        self.addDataset(name, rows, homologs, version)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+"""
+Module that searches the genes of datasets by symbol, HomoloGene id and RefSeq id,
+through the search index every dataset keeps (see searchIndex), so resolving a list
+of thousands of genes takes milliseconds. Datasets written before search indexes
+existed get one built when they are first searched.
+
+Searches are case insensitive. A pattern without wildcards matches every key it
+is a prefix of, * matches any characters and ? a single one.
+
+Functions:
+    searchGenes(): page of the genes of datasets matching a pattern
+    resolveGenes(): genes of datasets named by a list of symbols, ids and patterns
+    parseGeneList(): gene names of a pasted list
+    parseGmt(): gene sets of a GMT file
+"""
+
+import re
+from datasetStore import DATA_DIR
+from datasetCache import loadSearchIndex
+from searchIndex import FIELDS
+
+PAGE_SIZE = 50
+# characters that separate the names of a pasted gene list
+SEPARATORS = re.compile(r"[\s,;]+")
+
+
+def searchGenes(
+    pattern, datasets, page=1, pageSize=PAGE_SIZE, fields=FIELDS, dataDir=DATA_DIR
+):
+    """ Page (counted from 1) of the sorted genes of datasets that match a pattern, with the total number of matches. Genes whose symbol is the pattern come first, then shorter symbols. """
+    matches = set()
+    for name in datasets:
+        matches.update(loadSearchIndex(name, dataDir).match(pattern, fields))
+    lowered = pattern.lower()
+    ranked = sorted(
+        matches, key=lambda gene: (gene.lower() != lowered, len(gene), gene)
+    )
+    start = (max(page, 1) - 1) * pageSize
+    return ranked[start : start + pageSize], len(ranked)
+
+
+def resolveGenes(names, datasets, dataDir=DATA_DIR):
+    """ Resolve a list of gene symbols, homologene ids, RefSeq ids and wildcard patterns, all case insensitive, into the genes of datasets they name, in order and without duplicates, and the names that matched nothing. """
+    indexes = [loadSearchIndex(name, dataDir) for name in datasets]
+    resolved = {}
+    misses = []
+    for name in names:
+        name = name.strip()
+        if not name:
+            continue
+        if any(character in name for character in "*?["):
+            found = [gene for index in indexes for gene in index.match(name)]
+            found.sort()
+        else:
+            key = name.lower()
+            found = [gene for index in indexes for gene in index.exact(key)]
+            # a symbol spelled exactly as given wins over other spellings and ids
+            if name in found:
+                found = [name]
+        if not found:
+            misses.append(name)
+        resolved.update(dict.fromkeys(found))
+    return list(resolved), misses
+
+
+def parseGeneList(text):
+    """ Gene names of a pasted list separated by commas, semicolons, spaces or lines. """
+    return [name for name in SEPARATORS.split(text) if name]
+
+
+def parseGmt(text):
+    """ Gene set name -> gene names of a GMT file, one set per line as its name, description and genes separated by tabs. """
+    geneSets = {}
+    for line in text.splitlines():
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) >= 3 and fields[0]:
+            genes = [gene.strip() for gene in fields[2:]]
+            geneSets[fields[0]] = [gene for gene in genes if gene]
+    return geneSets
@@ -1,8 +1,26 @@
 import streamlit as st  # using this package for the front end interface
-import pandas as pd  # using dataframes to read files and be able to plot them onto the front end
-import matplotlib.pyplot as plt  # helps to plot the dataframes
 import os
-import re  # regex
+from geneFigures import PLOT_THRESHOLD, comparisonFigure, individualFigure
+from figureCache import cachedFigure, figureKey
+
+if os.environ.get("GENEVIZ_SERVER"):  # ask the shared query server when there is one
+    from queryServer import connect
+
+    queryClient = connect(os.environ["GENEVIZ_SERVER"])
+    readCatalog = queryClient.readCatalog
+    geneView = queryClient.geneView
+    homologQuery = queryClient.homologQuery
+    datasetVersions = queryClient.datasetVersions
+    missingGenes = queryClient.missingGenes
+    resolveGenes = queryClient.resolveGenes
+    searchGenes = queryClient.searchGenes
+else:  # otherwise query the datasets in this process
+    from datasetStore import readCatalog
+    from query import geneView, missingGenes
+    from homologJoin import homologQuery
+    from datasetCache import datasetVersions
+    from geneSearch import resolveGenes, searchGenes
+from geneSearch import parseGeneList, parseGmt
 
 
 class streamlit:
@@ -11,31 +29,43 @@ class streamlit:
 
     Class Parameters
     ----------------
+    catalog : DataFrame
+        Catalog of the datasets in the database indexed by name, one row per dataset with its genes, samples, sample types, timepoints, replicates, size and ingest date.
     dataframes : list
         List of dataframes in database.
     inputGenes : list
-        List of gene names that the user has inputted.
+        List of genes that the user has inputted, resolved in the datasets that the user has chosen.
     datasets : list
         List of datasets that the user has chosen.
-    geneDataframes : dict
-        Dictionary with keys as the dataset names, and values as the dataset specified by the user's inputs of the genes.
+    missingGenes : dict
+        Dictionary with keys as the dataset names, and values as the genes the user inputted that the dataset does not hold.
     userDataframes : dict
         Dictionary with keys as the dataset names, and values as the dataset specified by the user's inputs of the replicates.
+    timepoints : dict
+        Dictionary with keys as the dataset names, and values as the timepoints in hours of the columns of their user dataframe.
+    versions : dict
+        Dictionary with keys as the dataset names, and values as their versions, which change when they are written again.
     graphButton : boolean
         Boolean value of the sidebar checkbox.
     selectReplicates : str
         A string of the specified replicate that the user chose.
     selectNavigation : str
         A str of the location that the user chose.
+    selectView : str
+        A str of the view the graphs are drawn with, chosen by the number of genes when 'auto'.
 
     Methods
     -------
     createSidebar()
         Create the sidebar of the website and title of the website.
+    describe()
+        Describe a dataset by its catalog entry.
+    createSearch()
+        Create the gene search of the sidebar, one page of matching genes at a time.
     navBar()
         Create the navigation bar when the user clicks the graph button.
     collectDataframes()
-        Create a dictionary of the datasets that the user selected for plotting.
+        Create a dictionary of the genes that the datasets the user selected do not hold.
     specifyDataframes()
         Create dictionary of the datasets specified by the user's selected options for plotting.
     createDataframes()
@@ -43,24 +73,38 @@ class streamlit:
     createIndividuals()
         Plot a line graph for each dataset.
     createComparison()
-        Plot a line graph of both datasets.
+        Plot a graph of the datasets, with their genes matched on HomoloGene id.
+    cachedGraph()
+        Return the image of a graph of a page, drawing it only when it is not cached.
+    individualGraph()
+        Draw the genes of a dataset.
+    comparisonGraph()
+        Draw the genes of the datasets, matched on HomoloGene id, or on symbol for genes without one.
     """
 
     # Class Parameters
-    dataframes = list(
-        map(lambda x: x[:-4], os.listdir("../data"))
-    )  # List of dataframes in database.
+    catalog = readCatalog().set_index(
+        "name"
+    )  # Catalog of the datasets in the database, read without opening any of them.
+    dataframes = catalog.index.tolist()  # List of dataframes in database.
     inputGenes = []  # List of gene names that the user has inputted.
     datasets = []  # List of datasets that the user has chosen.
-    geneDataframes = (
+    missingGenes = (
         dict()
-    )  # Dictionary with keys as the dataset names, and values as the dataset specified by the user's inputs of the genes.
+    )  # Dictionary with keys as the dataset names, and values as the genes the user inputted that the dataset does not hold.
     userDataframes = (
         dict()
     )  # Dictionary with keys as the dataset names, and values as the dataset specified by the user's inputs of the replicates.
+    timepoints = (
+        dict()
+    )  # Dictionary with keys as the dataset names, and values as the timepoints in hours of the columns of their user dataframe.
+    versions = (
+        dict()
+    )  # Dictionary with keys as the dataset names, and values as their versions, which change when they are written again.
     graphButton = False  # Boolean value of the sidebar checkbox.
     selectReplicates = ""  # A string of the specified replicate that the user chose.
     selectNavigation = ""  # A str of the location that the user chose.
+    selectView = "auto"  # A str of the view the graphs are drawn with.
     organizedCol = []
 
     def createSidebar():
@@ -73,18 +117,38 @@ class streamlit:
             "Select Datasets to Compare"
         )  # set markdown title telling user to choose datasets
         streamlit.datasets = st.sidebar.multiselect(
-            "Select Datasets", streamlit.dataframes
-        )  # create multiselect option of the datasets
+            "Select Datasets", streamlit.dataframes, format_func=streamlit.describe
+        )  # create multiselect option of the datasets, described from the catalog
         st.sidebar.markdown(
-            "Input Gene Names (separate by commas if more than one gene)"
+            "Input Gene Names (separate by commas if more than one gene, HomoloGene and RefSeq ids and patterns such as Hox* work too)"
         )  # set markdown title telling user to input genes
         userInput = st.sidebar.text_input(
             "Gene names: "
         )  # create a text box for user to input genes
-        newString = userInput.replace(
-            " ", ""
-        )  # delete the whitespace within the user's input
-        streamlit.inputGenes = newString.split(",")  # split the string by commas
+        names = parseGeneList(
+            userInput
+        )  # split the input by commas, semicolons or whitespace
+        uploadedFile = st.sidebar.file_uploader(
+            "Or upload a gene list or GMT gene set file", type=["txt", "csv", "gmt"]
+        )  # create a file uploader for long lists of genes
+        if uploadedFile is not None:  # check if the user uploaded a file
+            text = uploadedFile.getvalue().decode()  # read the uploaded file
+            geneSets = parseGmt(text) if uploadedFile.name.endswith(".gmt") else {}
+            if geneSets:  # let the user pick one of the gene sets of a GMT file
+                geneSet = st.sidebar.selectbox("Gene set", list(geneSets))
+                names += geneSets[geneSet]
+            else:  # otherwise the file is a plain list of genes
+                names += parseGeneList(text)
+        streamlit.inputGenes = names
+        if streamlit.datasets:  # resolve the names into the genes of the datasets
+            streamlit.inputGenes, misses = resolveGenes(names, streamlit.datasets)
+            if misses:  # report the names that matched no gene
+                st.sidebar.warning(
+                    str(len(misses))
+                    + " names matched no gene: "
+                    + ", ".join(misses[:20])
+                    + (" ..." if len(misses) > 20 else "")
+                )
         st.sidebar.markdown(
             "Choose Replicates to be Graphed"
         )  # set markdown title telling user to choose the replicates
@@ -96,6 +160,43 @@ class streamlit:
             "Click to Graph"
         )  # create a checkbox the user can click on to graph
 
+    def describe(name):
+        """
+        Describe a dataset by its catalog entry.
+        """
+        entry = streamlit.catalog.loc[name]  # get the catalog entry
+        timepoints = ", ".join(
+            "%g" % hours for hours in entry["timepoints"]
+        )  # list the timepoints in hours
+        return (
+            name
+            + " ("
+            + str(entry["genes"])
+            + " genes, "
+            + str(entry["samples"])
+            + " samples, "
+            + (timepoints + " hours, " if timepoints else "")
+            + str(entry["replicates"])
+            + " replicates)"
+        )
+
+    def createSearch():
+        """
+        Create the gene search of the sidebar, one page of matching genes at a time.
+        """
+        pattern = st.sidebar.text_input(
+            "Search genes: "
+        )  # create a text box for a prefix, wildcard pattern or id to search for
+        if pattern and streamlit.datasets:  # check if there is something to search
+            page = st.sidebar.number_input(
+                "Page", min_value=1, value=1, step=1
+            )  # create a selection of the page of results
+            genes, total = searchGenes(pattern, streamlit.datasets, int(page))
+            st.sidebar.markdown(
+                str(total) + " genes found"
+            )  # set markdown title of the number of matches
+            st.sidebar.write(", ".join(genes))  # write out the genes of the page
+
     def navBar():
         """
         Create the navigation bar when the user clicks the graph button.
@@ -105,108 +206,53 @@ class streamlit:
             streamlit.selectNavigation = st.sidebar.radio(
                 "Go to", ("Comparison", "Individual", "Dataframe")
             )  # create a selection of the different pages
+            views = {
+                "Automatic": "auto",
+                "Every gene": "series",
+                "Median and quantiles": "band",
+                "Heatmap": "heatmap",
+            }  # views of the graphs, many genes are drawn as a median and quantiles automatically
+            streamlit.selectView = views[
+                st.sidebar.selectbox("Draw genes as", list(views))
+            ]  # create a selection of the views of the graphs
 
     def collectDataframes():
         """
-        Create a dictionary of the datasets that the user selected for plotting.
+        Create a dictionary of the genes that the datasets the user selected do not hold.
         """
+        streamlit.missingGenes = dict()  # start from nothing on every rerun
         if streamlit.graphButton:  # check if the graph button is selected
-            for (
-                dataset
-            ) in streamlit.datasets:  # iterate over the datasets that the user selected
-                newRead = pd.read_pickle(f"../data/{dataset}.pkl")  # Read the file
-                newRead.set_index("Gene Name", inplace=True)
-                rows = newRead.loc[
-                    streamlit.inputGenes
-                ]  # create a new dataframe of only the genes that the user specified
-                rows = rows.reset_index()  # reset the indexing
-                filterCol = []
-                for col in rows.columns:
-                    newCol = col.replace('"', "")
-                    filterCol.append(newCol)
-                rows.columns = filterCol
-                streamlit.geneDataframes[
-                    dataset
-                ] = rows  # set the key of the geneDataframes dictionary to the dataset name and the value to the dataframe
+            # genes that the user specified that every dataset does not hold, loaded
+            # datasets are cached across reruns so this only reads disk once
+            streamlit.missingGenes = missingGenes(
+                streamlit.inputGenes, streamlit.datasets
+            )
+            for dataset in streamlit.missingGenes:  # iterate over the datasets
+                if streamlit.missingGenes[dataset]:  # warn about genes not found
+                    st.sidebar.warning(
+                        dataset
+                        + " does not hold "
+                        + ", ".join(streamlit.missingGenes[dataset])
+                    )
 
     def specifyDataframes():
         """
         Create dictionary of the datasets specified by the user's selected options for plotting.
         """
+        streamlit.userDataframes = dict()  # start from nothing on every rerun
+        streamlit.timepoints = dict()
+        streamlit.versions = datasetVersions(
+            list(streamlit.missingGenes)
+        )  # the versions of the datasets the graphs are cached with
         for (
             i
         ) in (
-            streamlit.geneDataframes
-        ):  # iterate over the specified dataframes with the genes that the user selected
-            df = streamlit.geneDataframes[i]  # get the dataframe
-            if (
-                streamlit.selectReplicates != "average"
-            ):  # check if the selected replicate is not average
-                colDrop = []  # create list of the columns to be dropped
-                for (
-                    column
-                ) in df.columns:  # iterate over all the columns of the dataframe
-                    # if the replicate name (replicate1, replicate2, or replicate 3) is not in the columns after columns, Gene Description, Gene Name, HG ID, and RefSeq
-                    if (
-                        streamlit.selectReplicates not in column
-                        and column != "Gene Description"
-                        and column != "Gene Name"
-                        and column != "HG ID"
-                        and column != "RefSeq"
-                    ):
-                        colDrop.append(
-                            column
-                        )  # append the column to the list of colDrop
-                cleanedDF = df.drop(
-                    columns=colDrop
-                )  # drop all the columns in the list colDrop
-                cleanedDF = cleanedDF.set_index(
-                    "Gene Name"
-                )  # set the index to Gene name
-                # add the filtered out dataframe to the dictionary userdataframes with the key being the dataset name and the value being the filtered out dataframe
-                streamlit.userDataframes[i] = cleanedDF
-            else:
-                columns = []  # create a column list of the new columns
-                geneID = df[
-                    "HG ID"
-                ].tolist()  # set variable gene ID to the values within the column HD ID
-                refSeq = df[
-                    "RefSeq"
-                ].tolist()  # set variable refSeq to the values within the column RefSeq
-                geneDescription = df[
-                    "Gene Description"
-                ].tolist()  # set variable geneDescription to the values within the column Gene Description
-                geneName = df[
-                    "Gene Name"
-                ].tolist()  # set variable geneName to the values within the column Gene Name
-                df = df.drop(
-                    columns=["Gene Description", "Gene Name", "RefSeq", "HG ID"]
-                )  # drop columns Gene Description, Gene Name, RefSeq, and HG ID
-                for column in df.columns:  # iterate over all the columns
-                    newString = column[
-                        0 : column.index("_") + 1
-                    ]  # create a string with just the time
-                    newString = newString.replace(" ", "") #get rid of any whitespace in the column name
-                    finalString = (
-                        newString + "average"
-                    )  # then concatenate '_average' to the string that has the time
-                    columns.append(finalString)  # then append into the list columns
-                df.columns = columns  # set these as the new column names
-                df = df.T.astype(float)  # transpose the dataframe
-                newDF = df.reset_index()  # reset the index
-                df = (
-                    newDF.groupby("index", sort=False).mean().T
-                )  # group the dataframe by the column 'index' and find the mean and then transpose
-                # insert back all the columns that were dropped
-                df.insert(0, "Gene Name", geneName)
-                df.insert(1, "HG ID", geneID)
-                df.insert(2, "Gene Description", geneDescription)
-                df.insert(3, "RefSeq", refSeq)
-                cleanedDF = df.set_index(
-                    "Gene Name"
-                )  # set the index of the dataframe to the column Gene Name
-                # add the dataframe of averages to the dictionary userdataframes with the key being the dataset name and the value being the filtered out dataframe
-                streamlit.userDataframes[i] = cleanedDF
+            streamlit.missingGenes
+        ):  # iterate over the datasets that the user selected
+            # add the dataframe of the selected replicate to the dictionary userdataframes with the key being the dataset name, and the timepoints of its columns to timepoints, the query module reuses the ones built on an earlier rerun for the same genes and replicate
+            streamlit.userDataframes[i], streamlit.timepoints[i] = geneView(
+                i, streamlit.inputGenes, streamlit.selectReplicates
+            )
 
     def createDataframes():
         """
@@ -234,111 +280,92 @@ class streamlit:
             ) in (
                 streamlit.userDataframes
             ):  # iterate over the filtered dataframes dictionary
-                df = streamlit.userDataframes[i]  # get the dataframe
-                xAxis = [] #create a list to have the xAxis scale
-                newDF = df.drop(
-                    columns=["HG ID", "Gene Description", "RefSeq"]
-                )  # drop columns 'HG ID', 'Gene Description', 'RefSeq'
-                for column in newDF.columns.tolist():
-                    if column != "Gene Name": #making sure the column isn't gene name
-                        matchEx = re.findall(r"(\d+)hrs?", column) #finding the number of hours
-                        xAxis.append(matchEx[0]) #append to the list of numbers xAxis
-                newDF.columns = xAxis
-                transposedDF = newDF.T.astype(float)  # transpose the dataframe
                 st.subheader(i)  # create a subheader, which is the dataset name
-                fig, ax = plt.subplots()  # create subplots
-                for column in set(
-                    transposedDF.columns.tolist()
-                ):  # iterate over the columns in the transposed dataframe
-                    transposedDF.plot(
-                        kind="line", y=column, ax=ax, alpha=0.5
-                    )  # plot that column
-                # set the title name, x-axis name, y-axis name, and put the legend outside
-                plt.title(i + " " + streamlit.selectReplicates)
-                plt.xlabel("Time (hours)")
-                plt.ylabel("Intensity")
-                plt.legend(bbox_to_anchor=(1.05, 1.0), loc="upper left")
-                # write the plot out onto the webpage
-                st.write(fig)
+                # write the plot out onto the webpage, drawn only if no session drew the same one before
+                st.image(
+                    streamlit.cachedGraph(
+                        "Individual",
+                        [i],
+                        lambda: streamlit.individualGraph(
+                            i, i + " " + streamlit.selectReplicates
+                        ),
+                    )
+                )
 
     def createComparison():
         # check if the graph button is clicked and if the user chose 'Comparison' in the navbar
         if streamlit.graphButton and streamlit.selectNavigation == "Comparison":
             st.header("Comparing Datasets")  # set header name
-            dataframes = []  # create a list of dataframes
-            xAxis = set()
-            for (
-                i
-            ) in (
-                streamlit.userDataframes
-            ):  # iterate over the filtered dataframes dictionary
-                columns = []  # create a column list
-                newCol = []
-                df = streamlit.userDataframes[i]  # get the dataframe
-                newDF = df.drop(
-                    columns=["HG ID", "Gene Description", "RefSeq"]
-                )  # drop the columns 'HG ID', 'Gene Description', 'RefSeq'
-                for column in newDF.columns.tolist(): #iterate over the columns
-                    if column != "Gene Name": #make sure the column isn't gene name
-                        matchEx = re.findall(r"(\d+?)hrs?", column) #find the number of hours
-                        newCol.append(int(matchEx[0])) #append that number to the list newCol
-                        xAxis.add(int(matchEx[0]))
-                newDF.columns = sorted(newCol)
-                transposedDF = newDF.T.astype(float)  # transpose the dataframe
-                for column in transposedDF.columns:  # iterate over the columns
-                    newString = (
-                        column + "_" + i
-                    )  # rename the columns to contain the dataset name
-                    columns.append(
-                        newString
-                    )  # append the new column name into the columns list
-                transposedDF.columns = columns  # set the transposed dataframe columns to the columns list created
-                dataframes.append(
-                    transposedDF.T
-                )  # transpose dataframe again and append into the dataframes list
-            if (
-                len(dataframes) > 1
-            ):  # if the length of datframes is list is more than one
-                combinedDF = pd.concat(
-                    dataframes
-                )  # concatenate all the dataframes together
-                newList = sorted(list(xAxis))
-                fig, ax = plt.subplots()# plot subplots
-                newData = combinedDF.T.reset_index() #reset the index of the dataframe
-                iterateCol = newData.columns.tolist() # create a list of the dataframe columns
-                iterateCol.remove('index')#remove the column 'index'
-                for column in set(
-                    iterateCol
-                ):  # iterate over the combined dataframe columns
-                    plt.scatter(
-                        x=newData['index'], y=newData[column], alpha=0.3, label = column
-                    )  # plot scatter for the datasets
-                # set the title name, x-axis name, y-axis name, and put the legend outside
-                plt.title("Comparing Datasets")
-                plt.xlabel("Time (hours)")
-                plt.ylabel("Intensity")
-                plt.legend(bbox_to_anchor=(1.05, 1.0), loc="upper left")
-                # write the plot out onto the webpage
-                st.write(fig)
+            datasets = list(streamlit.userDataframes)  # the datasets the user chose
+            if len(datasets) > 1:  # if the user chose more than one dataset
+                # write the plot out onto the webpage, drawn only if no session drew the same one before
+                st.image(
+                    streamlit.cachedGraph(
+                        "Comparison", datasets, streamlit.comparisonGraph
+                    )
+                )
             else:
-                for data in dataframes:
-                    fig, ax = plt.subplots()  # plot subplots
-                    for column in set(
-                        data.T.columns.tolist()
-                    ):  # iterate over the transposed dataframe columns
-                        data.T.plot(
-                            kind="line", y=column, ax=ax, alpha=0.5
-                        )  # plot each column into the graph of the transposed DataFrame
-                    # set the title name, x-axis name, y-axis name, and put the legend outside
-                    plt.title("Comparing Datasets")
-                    plt.xlabel("Time (hours)")
-                    plt.ylabel("Intensity")
-                    plt.legend(bbox_to_anchor=(1.05, 1.0), loc="upper left")
+                for i in datasets:  # iterate over the dataset
                     # write the plot out onto the webpage
-                    st.write(fig)
+                    st.image(
+                        streamlit.cachedGraph(
+                            "Comparison",
+                            [i],
+                            lambda: streamlit.individualGraph(
+                                i, "Comparing Datasets", "_" + i
+                            ),
+                        )
+                    )
+
+    def cachedGraph(page, datasets, draw):
+        """
+        Return the image of a graph of a page, drawing it with draw only when it is not cached.
+        """
+        # the graph is identified by everything it shows and the versions of its datasets
+        key = figureKey(
+            page,
+            datasets,
+            streamlit.inputGenes,
+            streamlit.selectReplicates,
+            streamlit.selectView,
+            streamlit.versions,
+            threshold=PLOT_THRESHOLD,
+        )
+        return cachedFigure(key, draw)
+
+    def individualGraph(i, title, suffix=""):
+        """
+        Draw the genes of a dataset, named with a suffix.
+        """
+        df = streamlit.userDataframes[i]  # get the dataframe
+        newDF = df.drop(
+            columns=["HG ID", "Gene Description", "RefSeq"]
+        )  # drop columns 'HG ID', 'Gene Description', 'RefSeq'
+        # draw every gene in one call over the hours of every column, which come from the schema
+        return individualFigure(
+            newDF.to_numpy(),
+            streamlit.timepoints[i],
+            [gene + suffix for gene in newDF.index],
+            title,
+            streamlit.selectView,
+        )
+
+    def comparisonGraph():
+        """
+        Draw the genes of the datasets, matched on HomoloGene id, or on symbol for genes without one.
+        """
+        # join the datasets on the HomoloGene id of the genes, so the same gene of different species lines up even when their symbols differ
+        homologs = homologQuery(
+            streamlit.inputGenes,
+            list(streamlit.userDataframes),
+            streamlit.selectReplicates,
+        )
+        # draw every point of every gene in one call
+        return comparisonFigure(homologs, "Comparing Datasets", streamlit.selectView)
 
 
 streamlit.createSidebar()
+streamlit.createSearch()
 streamlit.navBar()
 streamlit.collectDataframes()
 streamlit.specifyDataframes()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+Module that joins datasets on the HomoloGene id of their genes, so a mouse series
+can be compared with a human one gene for gene even where the symbols of the two
+species differ (Ryr1 and RYR1, or entirely different names). Every dataset keeps a
+homologene id -> row index next to its gene index (see geneIndex), so the join
+merges the sorted ids of the datasets, looks the genes of the joined groups up in
+those indexes and gathers their rows through the query module and its caches,
+without ever matching symbol strings:
+
+    >>> from homologJoin import joinHomologs
+    >>> joinHomologs(["GSE460_series_matrix", "GSE7404"], how="inner")
+
+A homolog group is represented in a dataset by its first gene, as in the gene
+index. Genes a dataset holds without a homologene id, as platform tables often
+annotate them, are matched across datasets by their symbol instead (see
+homologQuery), rather than being left out.
+
+Functions:
+    homologsOf(): homologene ids of genes of datasets
+    joinHomologs(): wide frame of datasets joined on homologene id
+    homologQuery(): tidy frame of the homologs of genes across datasets
+"""
+
+import numpy as np
+import pandas as pd
+from datasetStore import DATA_DIR
+from datasetCache import loadDataset, loadHomologs
+from query import ANNOTATION_COLUMNS, QUERY_COLUMNS, _knownGenes, geneView, query
+
+HOWS = ("inner", "outer")
+
+
+def homologsOf(genes, datasets, dataDir=DATA_DIR):
+    """ Sorted homologene ids of the genes that any of the datasets holds. """
+    hgIDs = []
+    for name in datasets:
+        dataset = loadDataset(name, dataDir)
+        known = _knownGenes(dataset, genes)
+        hgIDs.append(dataset.annotations.loc[known, "HG ID"].dropna().to_numpy())
+    if not hgIDs:
+        return np.array([], dtype="int64")
+    return np.unique(np.concatenate(hgIDs).astype("int64"))
+
+
+def _joinKeys(homologs, hgIDs, how):
+    """ Sorted homologene ids of an inner or outer join of the homolog groups of datasets, restricted to hgIDs when given. """
+    if how not in HOWS:
+        raise ValueError(f"unknown join {how!r}")
+    if hgIDs is not None:
+        keys = np.unique(np.asarray(hgIDs, dtype="int64"))
+        if how == "outer":
+            return keys
+        for groups in homologs:
+            keys = np.intersect1d(keys, groups.index.to_numpy(), assume_unique=True)
+        return keys
+    if not homologs:
+        return np.array([], dtype="int64")
+    if how == "outer":
+        return np.unique(np.concatenate([groups.index for groups in homologs]))
+    keys = homologs[0].index.to_numpy()
+    for groups in homologs[1:]:
+        keys = np.intersect1d(keys, groups.index.to_numpy(), assume_unique=True)
+    return keys
+
+
+def joinHomologs(
+    datasets, hgIDs=None, how="inner", replicateMode="average", dataDir=DATA_DIR
+):
+    """ Dataframe of datasets joined on homologene id, one row per homolog group indexed by HG ID and, for every dataset, its gene name and the columns of the replicate mode (missing where the dataset has no gene of the group), with (dataset, column) columns. Returned with the dataset -> timepoints in hours of its columns map. An inner join keeps the groups every dataset holds, an outer one those any dataset holds, hgIDs restricts both. """
+    homologs = [loadHomologs(name, dataDir) for name in datasets]
+    keys = _joinKeys(homologs, hgIDs, how)
+    frames = {}
+    timepoints = {}
+    for name, groups in zip(datasets, homologs):
+        # gene of every joined group this dataset holds, missing for the others
+        members = groups.reindex(keys)
+        present = members.notna().to_numpy()
+        genes = members[present].to_list()
+        wide, hours = geneView(name, genes, replicateMode, dataDir)
+        wide = wide.drop(columns=ANNOTATION_COLUMNS)
+        wide = wide[~wide.index.duplicated()].reindex(genes)
+        wide.insert(0, "Gene Name", genes)
+        wide.index = pd.Index(keys[present], name="HG ID")
+        frames[name] = wide.reindex(pd.Index(keys, name="HG ID"))
+        timepoints[name] = list(hours)
+    if not frames:
+        return pd.DataFrame(index=pd.Index(keys, name="HG ID")), timepoints
+    return pd.concat(frames, axis=1, names=["dataset", None]), timepoints
+
+
+def homologQuery(
+    genes, datasets, replicateMode="average", hgIDs=None, dataDir=DATA_DIR
+):
+    """ Tidy dataframe, as query.query() returns, of the expression of the homologs of genes (or of the homolog groups hgIDs when given) in datasets, so rows of different datasets with the same HG ID are the same gene across species. The genes a dataset holds without a homologene id are included too, with a missing HG ID, to be matched across datasets by their symbol. """
+    if hgIDs is None:
+        hgIDs = homologsOf(genes, datasets, dataDir)
+    keys = np.unique(np.asarray(hgIDs, dtype="int64"))
+    frames = []
+    for name in datasets:
+        groups = loadHomologs(name, dataDir)
+        members = groups[groups.index.isin(keys)].to_list()
+        # genes without a homologene id in this dataset can only match by symbol
+        dataset = loadDataset(name, dataDir)
+        hgOf = dataset.annotations["HG ID"]
+        hgOf = hgOf[~hgOf.index.duplicated()]
+        known = _knownGenes(dataset, genes)
+        members += [gene for gene in known if pd.isna(hgOf[gene])]
+        frames.append(query(members, [name], replicateMode, dataDir))
+    if not frames:
+        return pd.DataFrame(columns=QUERY_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
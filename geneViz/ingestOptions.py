@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+
+"""
+Module that holds the choices of the ingest and export options. It imports nothing,
+so the command line can be parsed and checked before any of the modules that do
+the work, and their numerical libraries, are loaded.
+"""
+
+# formats, compressions and float format of the files written to outfiles/
+FORMATS = ("csv", "tsv", "parquet")
+COMPRESSIONS = ("none", "gzip", "zstd")
+FLOAT_FORMAT = "%.7g"
+# how the probes of the same gene are collapsed, see probeCollapse
+POLICIES = ("first", "max-mean", "max-variance", "mean", "median")
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+"""
+Module that ingests a series file incrementally. Ingesting is split in four stages,
+parse, annotate, combine and export, and the result of every stage is kept under
+cache/ingest/<series>/ along with a manifest recording the hash of the input file,
+the key every stage was run with and the outputs the export wrote.
+
+The key of a stage is a hash of the key of the stage before it and of what the
+stage itself depends on: the content of the input file for parse, the version of
+the annotation backend for annotate, the probe collapsing policy for combine, and
+the sample types and export options for export. The number of probes collapsed into
+every gene is kept next to the combined table.
+A stage whose key and results are unchanged is skipped, and when the export is up to
+date nothing is loaded at all, so ingesting an unchanged file again costs a stat of
+the file. The input is only hashed again when its size or modification time changed.
+
+Classes:
+    IngestManifest: input hash, stage keys and outputs of the last ingest of a series
+
+Functions:
+    fileHash(): sha256 of the content of a file
+    stageKey(): key of a stage from what it depends on
+    ingestSeries(): run the stale stages of the ingest of a series file
+"""
+
+import hashlib
+import json
+import os
+import pandas as pd
+import fileCleaner as fc
+from probeCollapse import collapseSummary
+from seriesParser import SeriesMatrix, parseSeriesMatrix, seriesName
+
+INGEST_DIR = "../cache/ingest"
+# bump when a stage changes what it produces so that every series is redone
+PIPELINE_VERSION = "1"
+STAGES = ("parse", "annotate", "combine", "export")
+
+
+def fileHash(path, blockSize=1 << 20):
+    """ Hex sha256 of the content of a file, read in blocks. """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(blockSize), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stageKey(*parts):
+    """ Hex sha256 of the json of everything a stage depends on. """
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+class IngestManifest:
+    """
+    Class to hold what the last ingest of a series did.
+
+    Initialized: directory the stage results of the series are kept in, path of the
+    manifest file in it, and the manifest itself: size, modification time and hash
+    of the input file, key of every stage that ran, and outputs of the export
+
+    Methods: inputHash(): hash of the input file, reusing the recorded one when the
+    file looks unchanged, isFresh(): whether a stage already ran with a key,
+    artifact(): path of a result of a stage, record(): record that a stage ran and
+    save the manifest, save(): write the manifest
+    """
+
+    def __init__(self, name, ingestDir=INGEST_DIR):
+        self.path = os.path.join(ingestDir, name)
+        self.manifestPath = os.path.join(self.path, "manifest.json")
+        if os.path.exists(self.manifestPath):
+            with open(self.manifestPath, "r") as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {"input": {}, "stages": {}, "outputs": []}
+
+    def inputHash(self, inputPath):
+        """ Hash of the input file, only read again when its size or modification time changed. """
+        inputStat = os.stat(inputPath)
+        recorded = self.manifest["input"]
+        if (
+            recorded.get("size") == inputStat.st_size
+            and recorded.get("mtime") == inputStat.st_mtime_ns
+        ):
+            return recorded["hash"]
+        self.manifest["input"] = {
+            "size": inputStat.st_size,
+            "mtime": inputStat.st_mtime_ns,
+            "hash": fileHash(inputPath),
+        }
+        return self.manifest["input"]["hash"]
+
+    def isFresh(self, stage, key):
+        """ Whether stage already ran with key and everything it wrote is still there. """
+        if self.manifest["stages"].get(stage, {}).get("key") != key:
+            return False
+        if stage == "export":
+            paths = self.manifest["outputs"]
+        else:
+            paths = [self.artifact(stage)]
+        return all(os.path.exists(path) for path in paths)
+
+    def artifact(self, stage, extension="parquet"):
+        """ Path of the result of a stage. """
+        return os.path.join(self.path, f"{stage}.{extension}")
+
+    def record(self, stage, key):
+        """ Record that stage ran with key and save the manifest, so a later failure does not lose it. """
+        self.manifest["stages"][stage] = {"key": key}
+        self.save()
+
+    def save(self):
+        """ Write the manifest, replacing the previous one atomically. """
+        os.makedirs(self.path, exist_ok=True)
+        with open(f"{self.manifestPath}.tmp", "w") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(f"{self.manifestPath}.tmp", self.manifestPath)
+
+
+def ingestSeries(
+    fileName,
+    sampleTypes,
+    output,
+    backend,
+    policy="first",
+    exportOptions=None,
+    force=False,
+    ingestDir=INGEST_DIR,
+):
+    """ Ingest a series file in infiles/, collapsing the probes of a gene with policy, exporting with exportOptions (see exportEngine) when output is set, and running only the stages that are stale (all of them when force is set). Return a dictionary of stage -> "ran" or "skipped", with a summary of the collapsed probes under "probes" when combine ran. """
+    manifest = IngestManifest(seriesName(fileName), ingestDir)
+    inputHash = manifest.inputHash(f"../infiles/{fileName}")
+    keys = {"parse": stageKey(PIPELINE_VERSION, inputHash)}
+    keys["annotate"] = stageKey(keys["parse"], backend.version)
+    keys["combine"] = stageKey(keys["annotate"], policy)
+    keys["export"] = stageKey(
+        keys["combine"], sorted(sampleTypes), output, exportOptions or {}
+    )
+    fresh = {
+        stage: not force and manifest.isFresh(stage, keys[stage]) for stage in STAGES
+    }
+    status = {stage: "skipped" for stage in STAGES}
+    if fresh["export"]:
+        manifest.save()
+        return status
+    os.makedirs(manifest.path, exist_ok=True)
+
+    # parse, or load the table parsed by an earlier ingest
+    if fresh["parse"]:
+        with open(manifest.artifact("parse", "json"), "r") as f:
+            header = json.load(f)
+        series = SeriesMatrix(
+            pd.read_parquet(manifest.artifact("parse")),
+            header["seriesInfo"],
+            header["sampleInfo"],
+            header["sampleIDs"],
+        )
+    else:
+        series = parseSeriesMatrix(f"../infiles/{fileName}")
+        series.df.to_parquet(manifest.artifact("parse"), index=False)
+        with open(manifest.artifact("parse", "json"), "w") as f:
+            json.dump(
+                {
+                    "seriesInfo": series.seriesInfo,
+                    "sampleInfo": series.sampleInfo,
+                    "sampleIDs": series.sampleIDs,
+                },
+                f,
+            )
+        manifest.record("parse", keys["parse"])
+        status["parse"] = "ran"
+    fileClean = fc.SeriesData(output, fileName, sampleTypes, series, exportOptions)
+
+    if fresh["combine"]:
+        fileClean.combinedDf = pd.read_parquet(manifest.artifact("combine"))
+    else:
+        # annotate, or reuse the annotations of an earlier ingest
+        if fresh["annotate"]:
+            fileClean.geneAnnotateDf = pd.read_parquet(manifest.artifact("annotate"))
+        else:
+            fileClean.annotate(backend)
+            fileClean.geneAnnotateDf.to_parquet(
+                manifest.artifact("annotate"), index=False
+            )
+            manifest.record("annotate", keys["annotate"])
+            status["annotate"] = "ran"
+        fileClean.combineDataFrame(policy)
+        fileClean.combinedDf.to_parquet(manifest.artifact("combine"), index=False)
+        fileClean.probeCounts.to_frame().to_parquet(manifest.artifact("probes"))
+        manifest.record("combine", keys["combine"])
+        status["combine"] = "ran"
+        status["probes"] = collapseSummary(fileClean.probeCounts)
+
+    manifest.manifest["outputs"] = fileClean.dataframeOutputter()
+    manifest.record("export", keys["export"])
+    status["export"] = "ran"
+    return status
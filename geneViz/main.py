@@ -2,35 +2,131 @@
 
 """
 Main program to run this tool. Contains main function.
+
+Every subcommand imports the modules it needs when it runs, so that parsing the
+command line, printing the version or help, and subcommands that need little cost
+no more than starting python.
 """
 
 import sys
-from streamlit import cli as stcli
+import time
 from commandLineParse import CommandLineParse
-import fileCleaner as fc
+
+
+def ingest(args):
+    """ Annotate and store one series file, or a batch of them across a process pool. """
+    from annotationBackend import makeBackend
+
+    backendOptions = dict(
+        platformTable=args.platform_table,
+        useCache=args.no_cache is False,
+        cacheTtl=args.cache_ttl,
+        batchSize=args.batch_size,
+        concurrency=args.concurrency,
+        retries=args.retries,
+        url=args.annotation_url,
+    )
+    # how annotated data is written to outfiles/
+    exportOptions = dict(
+        fileFormat=args.format,
+        compression=args.compression,
+        floatFormat=args.float_format,
+    )
+    # ingest every series of a directory or glob across a process pool
+    if args.batch is not None:
+        import batchIngest as bi
+
+        manifest = {}
+        if args.manifest is not None:
+            manifest = bi.readManifest(f"../infiles/{args.manifest}")
+        start = time.perf_counter()
+        results = bi.ingestBatch(
+            bi.findSeriesFiles(args.batch),
+            manifest,
+            args.output,
+            defaultTypes=args.types,
+            jobs=args.jobs,
+            policy=args.collapse,
+            exportOptions=exportOptions,
+            force=args.force,
+            **backendOptions,
+        )
+        bi.printSummary(results, time.perf_counter() - start)
+        return
+    from ingestPipeline import STAGES, ingestSeries
+
+    backend = makeBackend(**backendOptions)
+    # only redo the stages whose inputs changed since the last ingest
+    stages = ingestSeries(
+        args.input,
+        args.types,
+        args.output,
+        backend,
+        policy=args.collapse,
+        exportOptions=exportOptions,
+        force=args.force,
+    )
+    print(", ".join(f"{stage} {stages[stage]}" for stage in STAGES))
+    if "probes" in stages:
+        print(stages["probes"])
+    cache = getattr(backend, "cache", None)
+    if cache is not None and stages["annotate"] == "ran":
+        print(f"annotation cache: {cache.hits} hits, {cache.misses} misses")
+
+
+def convert(args):
+    """ Store a pre cleaned csv of infiles/ as a dataset. """
+    import fileCleaner as fc
+
+    fc.ExistingData(args.input)
+
+
+def serve(args, forwarded):
+    """ Start the visualizer, or the query server, with the options passed on to it. """
+    if args.api:
+        import queryServer
+
+        sys.argv = ["queryServer.py"] + forwarded
+        queryServer.main()
+        return
+    try:
+        from streamlit.web import cli as stcli
+    except ImportError:  # streamlit before 1.12
+        from streamlit import cli as stcli
+
+    sys.argv = ["streamlit", "run", "graphVisualization.py"] + forwarded
+    sys.exit(stcli.main())
 
 
 def main():
-    """ Run different modules based on the appropriate command line flags that are selected by the user."""
+    """ Run the subcommand selected on the command line. """
     # create object to access actual arguments
     clArgs = CommandLineParse()
-    # run file clean module if annotate is selected and see is not
-    if clArgs.args.annotate is True and clArgs.args.see is False:
-        fileClean = fc.SeriesData(
-            clArgs.args.output,
-            clArgs.args.input,
-            clArgs.args.types,
-        )
-        fileClean.myGeneCall()
-        fileClean.combineDataFrame()
-        fileClean.dataframeOutputter()
-    # run existing data if both annotate and see are false
-    elif clArgs.args.annotate is False and clArgs.args.see is False:
-        fc.ExistingData(clArgs.args.input)
-    # run visualization module if see is selected and annotate is not
-    elif clArgs.args.see is True and clArgs.args.annotate is False:
-        sys.argv = ["streamlit", "run", "graphVisualization.py"]
-        sys.exit(stcli.main())
+    args, forwarded = clArgs.args, clArgs.forwarded
+    if args.command == "ingest":
+        if args.input is None and args.batch is None:
+            clArgs.parser.error("ingest needs an input file (-i) or a batch (-b)")
+        # a batch takes the sample types of every file from its manifest instead
+        if args.batch is None and not args.types:
+            clArgs.parser.error("ingest of an input file needs its sample types (-t)")
+        ingest(args)
+    elif args.command == "convert":
+        # a csv without the columns of a dataset is a usage error
+        try:
+            convert(args)
+        except ValueError as error:
+            clArgs.parser.error(str(error))
+    elif args.command == "serve":
+        serve(args, forwarded)
+    # the other subcommands are the command lines of their own modules
+    elif args.command == "query":
+        import query
+
+        query.main(clArgs.arguments[1:])
+    elif args.command == "bench":
+        import benchmark
+
+        benchmark.main(clArgs.arguments[1:])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+Module that collapses the probes of a series that measure the same gene into a
+single row per gene. The expression values stay one genes x samples numeric matrix
+throughout: genes are factorized into integer codes once and every policy is a
+single grouped reduction over those codes. The probes may be any rows of a larger
+matrix, such as the numeric block of a whole series, which is read in place rather
+than copied: only the collapsed genes x samples matrix is allocated.
+
+Policies:
+    first: values of the first probe of the gene
+    max-mean: values of the probe with the highest mean expression
+    max-variance: values of the probe with the highest variance across samples
+    mean: mean of every probe of the gene, sample by sample
+    median: median of every probe of the gene, sample by sample
+
+Functions:
+    collapseProbes(): collapse the rows of a matrix that belong to the same gene
+    collapseSummary(): one line summary of the number of probes per gene
+"""
+
+import numpy as np
+import pandas as pd
+from ingestOptions import POLICIES
+
+
+def collapseProbes(genes, matrix, policy="first", rows=None):
+    """ Collapse the probes of a probes x samples matrix that belong to the same gene, the probes being the rows of the matrix given by rows (every row by default), returning the genes in order of first appearance, the probe representing every gene (its first probe for mean and median), the collapsed genes x samples matrix, and the number of probes of every gene. """
+    if policy not in POLICIES:
+        raise ValueError(f"unknown probe collapsing policy {policy!r}")
+    if rows is None:
+        rows = np.arange(len(matrix))
+    codes, uniqueGenes = pd.factorize(genes)
+    counts = np.bincount(codes, minlength=len(uniqueGenes))
+    if len(uniqueGenes) == 0:
+        return uniqueGenes, np.zeros(0, dtype=int), matrix[:0], counts
+    if policy in ("first", "mean", "median"):
+        # stable sort keeps the probes of every gene in their original order
+        order = np.argsort(codes, kind="stable")
+    else:
+        if policy == "max-mean":
+            score = matrix.mean(axis=1)[rows]
+        else:
+            score = matrix.var(axis=1)[rows]
+        # probes of every gene from the highest to the lowest score
+        order = np.lexsort((-score, codes))
+    # first probe of every gene in the sorted order
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    representatives = order[starts]
+    if policy == "mean":
+        # sum the probes of every gene column by column, without gathering their rows
+        collapsed = np.empty((len(uniqueGenes), matrix.shape[1]), dtype=matrix.dtype)
+        for column in range(matrix.shape[1]):
+            sums = np.bincount(codes, weights=matrix[rows, column])
+            collapsed[:, column] = sums / counts
+    elif policy == "median":
+        collapsed = pd.DataFrame(matrix[rows]).groupby(codes).median().to_numpy()
+        collapsed = collapsed.astype(matrix.dtype, copy=False)
+    else:
+        collapsed = matrix[rows[representatives]]
+    return uniqueGenes, representatives, collapsed, counts
+
+
+def collapseSummary(counts):
+    """ One line summary of how many probes were collapsed into how many genes. """
+    counts = np.asarray(counts)
+    if len(counts) == 0:
+        return "no probes to collapse"
+    return (
+        f"{counts.sum()} probes collapsed into {len(counts)} genes, "
+        f"{(counts > 1).sum()} genes had several probes (at most {counts.max()})"
+    )
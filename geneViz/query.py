@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+"""
+Module that looks up the expression of genes in datasets without the visualizer.
+Queries read the same datasets and go through the same caches as the visualizer
+(see datasetCache), which is itself a thin client of this module, so batch jobs and
+notebooks can pull thousands of genes at once:
+
+    >>> from query import query
+    >>> query(["Ryr1", "Ints7"], ["GSE460_series_matrix"], "average")
+
+Replicate modes:
+    replicateN (or the number N): every timepoint of replicate N
+    all: every sample
+    average: mean of the replicates of every timepoint
+    mean, median, sd, sem, n: that statistic of the replicates of every timepoint
+
+Genes a dataset does not hold are left out of its results, missingGenes() lists
+them. Expression can also be queried from the command line and written as csv:
+
+    $python3 query.py -g Ryr1,Ints7 -d GSE460_series_matrix -r replicate1
+
+Functions:
+    parseReplicateMode(): replicate number or statistic a replicate mode selects
+    missingGenes(): genes that datasets do not hold
+    geneView(): wide frame of a replicate mode of genes in a dataset
+    query(): tidy frame of a replicate mode of genes across datasets
+    main(): command line entry point for querying datasets
+"""
+
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from commandLineParse import addQueryArguments
+from datasetStore import DATA_DIR, listDatasets
+from datasetCache import cachedView, geneSamples, geneStatistic, loadDataset
+from exportEngine import FLOAT_FORMAT
+from replicates import STATISTICS
+
+REPLICATE_MODES = ("all", "average") + STATISTICS
+# annotation columns of the frames returned by geneView()
+ANNOTATION_COLUMNS = ["HG ID", "Gene Description", "RefSeq"]
+# columns of the frames returned by query()
+QUERY_COLUMNS = ["dataset", "Gene Name", "HG ID", "sample", "sampleType"]
+QUERY_COLUMNS += ["timepoint", "replicate", "value"]
+
+
+def parseReplicateMode(replicateMode):
+    """ Replicate number and statistic selected by a replicate mode, either of them None, raising ValueError for unknown modes. """
+    if isinstance(replicateMode, (int, np.integer)):
+        return int(replicateMode), None
+    if replicateMode == "all":
+        return None, None
+    if replicateMode == "average":
+        return None, "mean"
+    if replicateMode in STATISTICS:
+        return None, replicateMode
+    if replicateMode.startswith("replicate") and replicateMode[9:].isdigit():
+        return int(replicateMode[9:]), None
+    raise ValueError(f"unknown replicate mode {replicateMode!r}")
+
+
+def _knownGenes(dataset, genes):
+    """ Genes, without duplicates and in their order, that a loaded dataset holds. """
+    if dataset.rows is not None:
+        rows = dataset.rows
+    else:
+        rows = dataset.annotations.index
+    return [gene for gene in dict.fromkeys(genes) if gene in rows]
+
+
+def missingGenes(genes, datasets, dataDir=DATA_DIR):
+    """ Map every dataset to the genes it does not hold. """
+    missing = {}
+    for name in datasets:
+        known = set(_knownGenes(loadDataset(name, dataDir), genes))
+        missing[name] = [gene for gene in dict.fromkeys(genes) if gene not in known]
+    return missing
+
+
+def geneView(name, genes, replicateMode="average", dataDir=DATA_DIR):
+    """ Cached dataframe of the annotations and selected columns of the genes of a dataset indexed by gene name, returned with the timepoints in hours of the columns. Genes the dataset does not hold are left out. """
+    genes = tuple(_knownGenes(loadDataset(name, dataDir), genes))
+    replicate, statistic = parseReplicateMode(replicateMode)
+
+    def build():
+        if statistic is not None:
+            # per timepoint statistics precomputed when the dataset was stored
+            return (
+                geneStatistic(name, genes, statistic, dataDir),
+                loadDataset(name, dataDir).timepoints,
+            )
+        return geneSamples(name, genes, replicate=replicate, dataDir=dataDir)
+
+    return cachedView(name, ("view", genes, replicateMode), build, dataDir)
+
+
+def query(genes, datasets=None, replicateMode="average", dataDir=DATA_DIR):
+    """ Tidy dataframe of the expression of genes in datasets (all of them when None), one row per dataset, gene and column of the replicate mode, with its sample name (or statistic column), sample type, timepoint in hours, replicate number (missing for statistics) and value. """
+    if datasets is None:
+        datasets = listDatasets(dataDir)
+    elif isinstance(datasets, str):
+        datasets = [datasets]
+    replicate, statistic = parseReplicateMode(replicateMode)
+    frames = []
+    for name in datasets:
+        schema = loadDataset(name, dataDir).schema
+        wide, hours = geneView(name, genes, replicateMode, dataDir)
+        columns = wide.columns.drop(ANNOTATION_COLUMNS)
+        if statistic is None:
+            positions = schema.select(replicate=replicate)
+            sampleTypes = schema.samples["sampleType"].to_numpy()[positions]
+            replicates = schema.samples["replicate"].to_numpy()[positions]
+        else:
+            # a dataset holds one sample type, if any
+            sampleTypes = schema.samples["sampleType"].to_numpy()[:1]
+            sampleTypes = np.repeat(
+                sampleTypes if len(sampleTypes) else None, len(columns)
+            )
+            replicates = np.full(len(columns), np.nan)
+        values = wide[columns].to_numpy(dtype="float64")
+        # genes x columns values unrolled gene by gene
+        frames.append(
+            pd.DataFrame(
+                {
+                    "dataset": name,
+                    "Gene Name": np.repeat(wide.index.to_numpy(), len(columns)),
+                    "HG ID": np.repeat(wide["HG ID"].to_numpy(), len(columns)),
+                    "sample": np.tile(columns.to_numpy(), len(wide)),
+                    "sampleType": np.tile(sampleTypes, len(wide)),
+                    "timepoint": np.tile(np.asarray(hours, dtype=float), len(wide)),
+                    "replicate": np.tile(replicates, len(wide)),
+                    "value": values.ravel(),
+                },
+                columns=QUERY_COLUMNS,
+            )
+        )
+    if not frames:
+        return pd.DataFrame(columns=QUERY_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(argv=None):
+    """ Query the expression of genes in datasets and write it as a tidy csv, with the arguments of argv (those of the command line by default). """
+    parser = argparse.ArgumentParser(
+        description="Write the expression of genes in datasets of data/ as csv"
+    )
+    addQueryArguments(parser)
+    args = parser.parse_args(argv)
+    genes = [gene for gene in args.genes.replace(" ", "").split(",") if gene]
+    if args.genes_file:
+        with open(args.genes_file, "r") as f:
+            genes += [line.strip() for line in f if line.strip()]
+    try:
+        parseReplicateMode(args.replicates)
+    except ValueError as error:
+        parser.error(str(error))
+    datasets = args.dataset or listDatasets()
+    for name, missing in missingGenes(genes, datasets).items():
+        if missing:
+            print(f"{name}: {len(missing)} genes not found", file=sys.stderr)
+    result = query(genes, datasets, args.replicates)
+    result.to_csv(args.output or sys.stdout, index=False, float_format=FLOAT_FORMAT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,649 @@
+#!/usr/bin/env python3
+
+"""
+Module that serves gene queries over HTTP on the local machine, so that every
+viewer of the visualizer shares one process holding each dataset once, memory
+mapped, instead of every session loading its own copy.
+
+The server is a single asyncio event loop speaking just enough HTTP/1.1 for
+persistent connections; queries run on a thread pool through the query module and
+its caches (see query and datasetCache), and serialized responses are cached too,
+keyed by the query and the version of its datasets. Identical queries that arrive
+while one is being answered are coalesced: they wait for that answer instead of
+computing it again.
+
+Endpoints (genes and datasets are comma separated, every dataset when none is
+given, and a POST may instead send the same fields as a JSON body):
+    GET /datasets: names of the datasets
+    GET /catalog: catalog of the datasets, see datasetCatalog
+    GET /query?genes=&datasets=&replicates=&format=: tidy query() frame
+    GET /view?genes=&dataset=&replicates=&format=: geneView() frame and its
+    timepoints
+    GET /join?genes=&datasets=&replicates=&format=: tidy homologQuery() frame of
+    the homologs of the genes, joined on HomoloGene id
+    GET /missing?genes=&datasets=: genes every dataset does not hold
+    GET /versions?datasets=: version of every dataset, which changes when it is
+    written again
+    GET /search?pattern=&datasets=&page=&pageSize=: page of the matching genes
+    GET /resolve?genes=&datasets=: genes named by symbols, ids and patterns
+    GET /stats: request, coalescing and cache counters
+
+The format is json (default) or arrow, an Arrow IPC stream. The server and a load
+test against it run entirely on localhost:
+
+    $python3 queryServer.py --port 8765
+    $python3 queryServer.py --load-test 2000 --clients 32
+
+The visualizer uses the server at GENEVIZ_SERVER (such as http://127.0.0.1:8765)
+when that environment variable is set.
+
+Classes:
+    QueryServer: asyncio HTTP server answering gene queries
+    QueryClient: client of a query server with the interface of the query module
+
+Functions:
+    connect(): shared client of the query server at an address
+    frameBytes(): serialize a dataframe as json or an Arrow stream
+    readFrame(): deserialize a dataframe serialized by frameBytes()
+    loadTest(): measure a query server under concurrent load on localhost
+    main(): command line entry point for serving and load testing
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlsplit
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from datasetCatalog import CATALOG_FIELDS
+from datasetStore import DATA_DIR, catalogNames, readCatalog
+from datasetCache import CACHE, datasetVersion, datasetVersions, loadDataset
+from geneSearch import PAGE_SIZE, resolveGenes, searchGenes
+from homologJoin import homologQuery
+from query import geneView, missingGenes, parseReplicateMode, query
+
+HOST = "127.0.0.1"
+PORT = 8765
+CONTENT_TYPES = {"json": "application/json"}
+CONTENT_TYPES["arrow"] = "application/vnd.apache.arrow.stream"
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Server Error"}
+
+
+def frameBytes(df, fileFormat="json", timepoints=None):
+    """ Serialize a dataframe, along with the timepoints of its columns when given, as json or as an Arrow IPC stream. """
+    if timepoints is not None:
+        # nan timepoints of samples outside of a time course become null
+        timepoints = [None if np.isnan(hour) else float(hour) for hour in timepoints]
+    if fileFormat == "arrow":
+        # categories of the whole dataset would otherwise be sent every time
+        categorical = df.select_dtypes("category").columns
+        df = df.assign(
+            **{
+                column: df[column].cat.remove_unused_categories()
+                for column in categorical
+            }
+        )
+        table = pa.Table.from_pandas(df, preserve_index=df.index.name is not None)
+        if timepoints is not None:
+            metadata = dict(table.schema.metadata or {})
+            metadata[b"timepoints"] = json.dumps(timepoints).encode()
+            table = table.replace_schema_metadata(metadata)
+        sink = pa.BufferOutputStream()
+        writer = pa.ipc.new_stream(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+        return sink.getvalue().to_pybytes()
+    if timepoints is None:
+        return df.to_json(orient="records").encode()
+    # the split orientation keeps the column order and the gene name index
+    frame = df.to_json(orient="split")
+    return f'{{"timepoints": {json.dumps(timepoints)}, "frame": {frame}}}'.encode()
+
+
+def readFrame(data, fileFormat="json", indexName="Gene Name"):
+    """ Deserialize a dataframe serialized by frameBytes(), returned with its timepoints when it was serialized with them. """
+    if fileFormat == "arrow":
+        table = pa.ipc.open_stream(data).read_all()
+        df = table.to_pandas()
+        timepoints = (table.schema.metadata or {}).get(b"timepoints")
+        if timepoints is None:
+            return df
+        return df, [np.nan if h is None else h for h in json.loads(timepoints)]
+    parsed = json.loads(data)
+    if isinstance(parsed, list):
+        return pd.DataFrame(parsed)
+    frame = parsed["frame"]
+    df = pd.DataFrame(
+        frame["data"],
+        index=pd.Index(frame["index"], name=indexName),
+        columns=frame["columns"],
+    )
+    timepoints = [np.nan if h is None else h for h in parsed["timepoints"]]
+    return df, timepoints
+
+
+def _names(params, name):
+    """ List of the names of a parameter, a comma separated string or a list of strings from a JSON body, raising HTTPError 400 when it is neither. """
+    value = params.get(name)
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise HTTPError(400, f"{name} must be a string or a list of strings")
+    return [item.strip() for item in value if item.strip()]
+
+
+def _text(params, name, default):
+    """ Value of a parameter that must be a string, raising HTTPError 400 when a JSON body gives it another type. """
+    value = params.get(name, default)
+    if not isinstance(value, str):
+        raise HTTPError(400, f"{name} must be a string, not {value!r}")
+    return value
+
+
+class HTTPError(Exception):
+    """ Error answered to the client with an HTTP status. """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _positive(params, name, default):
+    """ Value of a parameter that must be an integer of at least 1, raising HTTPError 400 when it is not. """
+    value = params.get(name, default)
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{name} must be an integer, not {value!r}")
+    if number < 1:
+        raise HTTPError(400, f"{name} must be at least 1, not {number}")
+    return number
+
+
+class QueryServer:
+    """
+    Class for an asyncio HTTP server answering gene queries from the datasets of a
+    data directory.
+
+    Initialized: data directory, thread pool queries are run on, in flight queries
+    by key for coalescing, and counters of requests, coalesced requests and errors
+
+    Methods: answer(): answer a request, coalescing identical ones in flight,
+    handle(): serve the requests of one connection, start(): start listening,
+    serve(): listen until cancelled
+    """
+
+    def __init__(self, dataDir=DATA_DIR, workers=None):
+        self.dataDir = dataDir
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.inflight = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def _build(self, route, params):
+        """ Serialized response body and content type of a request, run on the thread pool. """
+        fileFormat = _text(params, "format", "json")
+        if fileFormat not in CONTENT_TYPES:
+            raise HTTPError(400, f"unknown format {fileFormat!r}")
+        if route == "/datasets":
+            return json.dumps(catalogNames(self.dataDir)).encode(), "json"
+        if route == "/catalog":
+            catalog = readCatalog(self.dataDir)
+            return catalog.to_json(orient="records").encode(), "json"
+        if route == "/stats":
+            stats = {
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "inflight": len(self.inflight),
+                "cacheHits": CACHE.hits,
+                "cacheMisses": CACHE.misses,
+                "cacheBytes": CACHE.size,
+            }
+            return json.dumps(stats).encode(), "json"
+        if route not in (
+            "/query",
+            "/view",
+            "/join",
+            "/missing",
+            "/search",
+            "/resolve",
+            "/versions",
+        ):
+            raise HTTPError(404, f"unknown endpoint {route!r}")
+        genes = _names(params, "genes")
+        datasets = _names(params, "datasets" if "datasets" in params else "dataset")
+        replicateMode = _text(params, "replicates", "average")
+        try:
+            parseReplicateMode(replicateMode)
+        except ValueError as error:
+            raise HTTPError(400, str(error))
+        # the datasets of the catalog, as /datasets and the visualizer list them
+        known = catalogNames(self.dataDir)
+        if not datasets and route != "/view":
+            datasets = known
+        for name in datasets:
+            if name not in known:
+                raise HTTPError(404, f"unknown dataset {name!r}")
+        if route == "/view" and len(datasets) != 1:
+            raise HTTPError(400, "a view is of exactly one dataset")
+        if route == "/versions":
+            return json.dumps(datasetVersions(datasets, self.dataDir)).encode(), "json"
+        # responses are cached until one of their datasets is written again
+        versions = tuple(datasetVersion(name, self.dataDir) for name in datasets)
+        key = (route, tuple(genes), tuple(datasets), replicateMode, fileFormat)
+        if route == "/search":
+            pattern = _text(params, "pattern", "")
+            page = _positive(params, "page", 1)
+            pageSize = _positive(params, "pageSize", PAGE_SIZE)
+            key += (pattern, page, pageSize)
+
+        def serialize():
+            if route == "/search":
+                found, total = searchGenes(
+                    pattern, datasets, page, pageSize, dataDir=self.dataDir
+                )
+                return json.dumps({"genes": found, "total": total}).encode()
+            if route == "/resolve":
+                found, misses = resolveGenes(genes, datasets, self.dataDir)
+                return json.dumps({"genes": found, "misses": misses}).encode()
+            if route == "/missing":
+                missing = missingGenes(genes, datasets, self.dataDir)
+                return json.dumps(missing).encode()
+            if route == "/view":
+                frame, timepoints = geneView(
+                    datasets[0], genes, replicateMode, self.dataDir
+                )
+                return frameBytes(frame, fileFormat, timepoints)
+            if route == "/join":
+                result = homologQuery(
+                    genes, datasets, replicateMode, dataDir=self.dataDir
+                )
+                return frameBytes(result, fileFormat)
+            result = query(genes, datasets, replicateMode, self.dataDir)
+            return frameBytes(result, fileFormat)
+
+        body = CACHE.get(("response",) + key + (versions,), serialize)
+        if route in ("/missing", "/search", "/resolve"):
+            return body, "json"
+        return body, fileFormat
+
+    async def answer(self, route, params):
+        """ Serialized response of a request, computed once for identical requests that are in flight together. """
+        key = (route, json.dumps(params, sort_keys=True))
+        task = self.inflight.get(key)
+        if task is None:
+            loop = asyncio.get_running_loop()
+            task = loop.run_in_executor(self.executor, self._build, route, params)
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shielded so a client hanging up does not cancel the others' answer
+        return await asyncio.shield(task)
+
+    async def handle(self, reader, writer):
+        """ Serve the requests of a connection until the client closes it. """
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                request = lines[0].split(" ")
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                length = headers.get("content-length", "0")
+                self.requests += 1
+                # a request that cannot be read is answered and the connection
+                # closed, as where its body ends is unknown
+                if len(request) < 2 or not length.isdigit():
+                    self.errors += 1
+                    message = {"error": "malformed request line or content length"}
+                    status, content = 400, json.dumps(message).encode()
+                    contentType, keepAlive = CONTENT_TYPES["json"], False
+                else:
+                    body = await reader.readexactly(int(length))
+                    status, content, contentType = await self._respond(
+                        request[0], request[1], body
+                    )
+                    keepAlive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                        f"Content-Type: {contentType}\r\n"
+                        f"Content-Length: {len(content)}\r\n"
+                        f"Connection: {'keep-alive' if keepAlive else 'close'}\r\n"
+                        "\r\n"
+                    ).encode()
+                    + content
+                )
+                await writer.drain()
+                if not keepAlive:
+                    break
+        finally:
+            writer.close()
+
+    async def _respond(self, method, target, body):
+        """ Status, body and content type of the response to a request. """
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if method == "POST" and body:
+                try:
+                    fields = json.loads(body)
+                except ValueError:
+                    raise HTTPError(400, "the body is not valid JSON")
+                if not isinstance(fields, dict):
+                    raise HTTPError(400, "the body must be a JSON object")
+                params.update(fields)
+            elif method not in ("GET", "POST"):
+                raise HTTPError(400, f"unsupported method {method}")
+            content, fileFormat = await self.answer(url.path, params)
+            return 200, content, CONTENT_TYPES[fileFormat]
+        except HTTPError as error:
+            self.errors += 1
+            message = json.dumps({"error": str(error)}).encode()
+            return error.status, message, CONTENT_TYPES["json"]
+        except Exception as error:
+            self.errors += 1
+            message = json.dumps({"error": repr(error)}).encode()
+            return 500, message, CONTENT_TYPES["json"]
+
+    async def start(self, host=HOST, port=PORT):
+        """ Start listening on host and port (any free port when 0) and return the asyncio server. """
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def serve(self, host=HOST, port=PORT):
+        """ Listen on host and port until cancelled. """
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+
+class QueryClient:
+    """
+    Class for a client of a query server, with the interface of the query module.
+
+    Initialized: address of the server, format responses are asked in, and one
+    persistent connection per thread
+
+    Methods: request(): body of the response to a request, listDatasets(): names
+    of the datasets, readCatalog(): catalog of the datasets, query(): tidy query
+    frame, geneView(): frame of a replicate mode of genes in a dataset with its
+    timepoints, homologQuery(): tidy query frame of the homologs of genes,
+    missingGenes(): genes that datasets do not hold, datasetVersions(): version of
+    every dataset, searchGenes(): page of the genes matching a pattern,
+    resolveGenes(): genes named by symbols, ids and patterns
+    """
+
+    def __init__(self, url, fileFormat="arrow", timeout=60):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.fileFormat = fileFormat
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def request(self, route, **params):
+        """ Body of the response of the server to a request, raising RuntimeError when it fails. Genes are sent as a JSON body. """
+        body = json.dumps(params)
+        for attempt in range(2):
+            connection = getattr(self.local, "connection", None)
+            if connection is None:
+                connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout
+                )
+                self.local.connection = connection
+            try:
+                connection.request(
+                    "POST", route, body, {"Content-Type": "application/json"}
+                )
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # the server closed the connection, reconnect once
+                connection.close()
+                self.local.connection = None
+                if attempt == 1:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(json.loads(data)["error"])
+        return data
+
+    def listDatasets(self):
+        """ Names of the datasets of the server. """
+        return json.loads(self.request("/datasets"))
+
+    def readCatalog(self):
+        """ Dataframe of the catalog of the datasets of the server, see datasetStore.readCatalog(). """
+        entries = json.loads(self.request("/catalog"))
+        return pd.DataFrame(entries, columns=CATALOG_FIELDS)
+
+    def query(self, genes, datasets, replicateMode="average"):
+        """ Tidy dataframe of the expression of genes in datasets, see query.query(). """
+        data = self.request(
+            "/query",
+            genes=list(genes),
+            datasets=list(datasets),
+            replicates=replicateMode,
+            format=self.fileFormat,
+        )
+        return readFrame(data, self.fileFormat)
+
+    def geneView(self, name, genes, replicateMode="average"):
+        """ Dataframe of a replicate mode of genes in a dataset with the timepoints of its columns, see query.geneView(). """
+        data = self.request(
+            "/view",
+            genes=list(genes),
+            dataset=[name],
+            replicates=replicateMode,
+            format=self.fileFormat,
+        )
+        return readFrame(data, self.fileFormat)
+
+    def homologQuery(self, genes, datasets, replicateMode="average"):
+        """ Tidy dataframe of the expression of the homologs of genes in datasets, see homologJoin.homologQuery(). """
+        data = self.request(
+            "/join",
+            genes=list(genes),
+            datasets=list(datasets),
+            replicates=replicateMode,
+            format=self.fileFormat,
+        )
+        return readFrame(data, self.fileFormat)
+
+    def missingGenes(self, genes, datasets):
+        """ Map every dataset to the genes it does not hold, see query.missingGenes(). """
+        return json.loads(
+            self.request("/missing", genes=list(genes), datasets=list(datasets))
+        )
+
+    def datasetVersions(self, datasets):
+        """ Map every dataset to its version, see datasetCache.datasetVersions(). """
+        return json.loads(self.request("/versions", datasets=list(datasets)))
+
+    def searchGenes(self, pattern, datasets, page=1, pageSize=PAGE_SIZE):
+        """ Page of the genes of datasets matching a pattern with the total number of matches, see geneSearch.searchGenes(). """
+        found = json.loads(
+            self.request(
+                "/search",
+                pattern=pattern,
+                datasets=list(datasets),
+                page=page,
+                pageSize=pageSize,
+            )
+        )
+        return found["genes"], found["total"]
+
+    def resolveGenes(self, names, datasets):
+        """ Genes of datasets named by symbols, ids and patterns, and the names that matched nothing, see geneSearch.resolveGenes(). """
+        resolved = json.loads(
+            self.request("/resolve", genes=list(names), datasets=list(datasets))
+        )
+        return resolved["genes"], resolved["misses"]
+
+
+# clients by server address, kept across reruns of the visualizer so that their
+# connections are too
+_clients = {}
+
+
+def connect(url):
+    """ Client of the query server at url, the same one for every call in this process. """
+    if url not in _clients:
+        _clients[url] = QueryClient(url)
+    return _clients[url]
+
+
+async def _loadClient(host, port, targets, latencies):
+    """ Send requests for targets one after another over one persistent connection, recording their latencies. """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for target in targets:
+            start = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            if status != 200:
+                raise RuntimeError(f"{target} answered {status}")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def _loadTest(requests, clients, genesPerQuery, distinct, fileFormat, dataDir):
+    """ Start a server on a free localhost port and load it, returning the results of loadTest(). """
+    server = QueryServer(dataDir)
+    listening = await server.start(HOST, 0)
+    port = listening.sockets[0].getsockname()[1]
+    datasets = catalogNames(dataDir)
+    if not datasets:
+        raise ValueError("there are no datasets to query")
+    generator = random.Random(0)
+    genesOf = {
+        name: list(server.executor.submit(_datasetGenes, name, dataDir).result())
+        for name in datasets
+    }
+    # a pool of distinct queries that the requests are drawn from, so identical
+    # concurrent requests happen as they would with many viewers
+    pool = []
+    for number in range(distinct):
+        name = datasets[number % len(datasets)]
+        genes = generator.sample(genesOf[name], min(genesPerQuery, len(genesOf[name])))
+        replicates = generator.choice(["average", "replicate1", "all"])
+        params = urlencode(
+            {
+                "genes": ",".join(genes),
+                "dataset": name,
+                "replicates": replicates,
+                "format": fileFormat,
+            }
+        )
+        pool.append(f"/view?{params}")
+    targets = [generator.choice(pool) for _ in range(requests)]
+    latencies = []
+    start = time.perf_counter()
+    async with listening:
+        await asyncio.gather(
+            *(
+                _loadClient(HOST, port, targets[client::clients], latencies)
+                for client in range(clients)
+            )
+        )
+    seconds = time.perf_counter() - start
+    latencies = np.sort(latencies) * 1000
+    return {
+        "requests": requests,
+        "clients": clients,
+        "seconds": round(seconds, 3),
+        "requestsPerSecond": round(requests / seconds, 1),
+        "p50ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99ms": round(float(np.percentile(latencies, 99)), 2),
+        "coalesced": server.coalesced,
+        "errors": server.errors,
+    }
+
+
+def _datasetGenes(name, dataDir):
+    """ Gene names of a dataset. """
+    return loadDataset(name, dataDir).annotations.index.unique()
+
+
+def loadTest(
+    requests=1000,
+    clients=16,
+    genesPerQuery=20,
+    distinct=50,
+    fileFormat="json",
+    dataDir=DATA_DIR,
+):
+    """ Start a query server on localhost and send it requests for views of random genes from clients concurrent persistent connections, drawn from a pool of distinct queries, returning the throughput, latency percentiles and number of coalesced requests. """
+    return asyncio.run(
+        _loadTest(requests, clients, genesPerQuery, distinct, fileFormat, dataDir)
+    )
+
+
+def main():
+    """ Serve gene queries on localhost, or load test a server. """
+    parser = argparse.ArgumentParser(
+        description="Serve gene queries of the datasets in data/ over HTTP"
+    )
+    parser.add_argument("--host", default=HOST, help="Address to listen on")
+    parser.add_argument("--port", type=int, default=PORT, help="Port to listen on")
+    parser.add_argument(
+        "--workers", type=int, help="Number of threads answering queries"
+    )
+    parser.add_argument(
+        "--load-test",
+        type=int,
+        metavar="REQUESTS",
+        help="Instead of serving, send this many requests to a server on localhost",
+    )
+    parser.add_argument(
+        "--clients",
+        type=int,
+        default=16,
+        help="Number of concurrent connections of the load test",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(CONTENT_TYPES),
+        default="json",
+        help="Format of the responses of the load test",
+    )
+    args = parser.parse_args()
+    if args.load_test is not None:
+        results = loadTest(args.load_test, args.clients, fileFormat=args.format)
+        print(json.dumps(results, indent=1))
+        return
+    print(f"serving {len(catalogNames())} datasets on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(QueryServer(workers=args.workers).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""
+Module that aggregates the replicates of every timepoint of a dataset. The
+(timepoint, replicate) of every sample comes from the schema of the dataset (see
+datasetSchema), and every statistic is computed for all genes at once by a single
+vectorized reduction over a genes x timepoints x replicates array.
+
+Functions:
+    aggregate(): per timepoint statistics of the replicates of every gene
+    averageColumns(): names of the per timepoint columns shown by the visualizer
+    writeAggregates(): precompute the statistics of a dataset and store them
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+AGGREGATES_FILE = "aggregates.npy"
+STATISTICS = ("mean", "median", "sd", "sem", "n")
+
+
+def aggregate(matrix, sampleIndex, statistics=STATISTICS):
+    """ Compute statistics over the replicates of every timepoint for every row of a genes x samples matrix, returning the sorted timepoints and a dictionary of statistic -> genes x timepoints array. """
+    timepoints, timepointCodes = np.unique(
+        sampleIndex.get_level_values("timepoint"), return_inverse=True
+    )
+    # position of every sample among the replicates of its timepoint
+    replicateSlots = pd.Series(timepointCodes).groupby(timepointCodes).cumcount()
+    replicateSlots = replicateSlots.to_numpy()
+    # scatter the samples into a genes x timepoints x replicates array padded
+    # with nan where a timepoint has fewer replicates than the others
+    cube = np.full(
+        (matrix.shape[0], len(timepoints), replicateSlots.max() + 1),
+        np.nan,
+        dtype="float64",
+    )
+    cube[:, timepointCodes, replicateSlots] = matrix
+    results = {}
+    # timepoints without any value of a gene give nan, errstate rather than a
+    # warnings filter so that datasets can be written from several threads
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n = np.sum(~np.isnan(cube), axis=2)
+        mean = np.nansum(cube, axis=2) / n
+        sd = np.sqrt(np.nansum((cube - mean[:, :, None]) ** 2, axis=2) / (n - 1))
+        # 0 / -1 rather than nan where there is no value
+        sd[n == 0] = np.nan
+        for statistic in statistics:
+            if statistic == "mean":
+                results[statistic] = mean
+            elif statistic == "median":
+                results[statistic] = _median(cube, n)
+            elif statistic == "sd":
+                results[statistic] = sd
+            elif statistic == "sem":
+                results[statistic] = sd / np.sqrt(n)
+            elif statistic == "n":
+                results[statistic] = n.astype("float64")
+            else:
+                raise ValueError(f"unknown statistic {statistic!r}")
+    return timepoints, results
+
+
+def _median(cube, n):
+    """ Median over the replicates of a genes x timepoints x replicates array, nan where a timepoint has no value, taken only where it has some so that nanmedian does not warn. """
+    if (n > 0).all():
+        return np.nanmedian(cube, axis=2)
+    median = np.full(n.shape, np.nan)
+    if (n > 0).any():
+        median[n > 0] = np.nanmedian(cube[n > 0], axis=1)
+    return median
+
+
+def averageColumns(timepoints, statistic="average"):
+    """ Names of the per timepoint columns of an aggregated dataframe, such as 2hrs_average. """
+    return [f"{timepoint:g}hrs_{statistic}" for timepoint in timepoints]
+
+
+def writeAggregates(path, matrix, schema):
+    """ Precompute every statistic of a dataset into path/aggregates.npy, returning the timepoints and statistics or None when its schema is not a time course. """
+    if not schema.isTimeCourse():
+        return None
+    timepoints, results = aggregate(matrix, schema.sampleIndex())
+    aggregatesPath = os.path.join(path, AGGREGATES_FILE)
+    with open(f"{aggregatesPath}.tmp", "wb") as f:
+        stacked = np.stack([results[statistic] for statistic in STATISTICS])
+        np.save(f, stacked.astype("float32"))
+    os.replace(f"{aggregatesPath}.tmp", aggregatesPath)
+    return timepoints, results
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+Module that builds the search index of a dataset: one row per lower cased key
+(gene symbol, homologene id, and every RefSeq id of the gene, with and without its
+version) and the gene it leads to, sorted by key, precomputed into search.parquet
+when the dataset is written. Loaded into sorted arrays, a prefix is the contiguous
+range of keys found by two binary searches, a wildcard pattern only scans the range
+of its literal prefix, and exact keys are a dictionary lookup.
+
+Classes:
+    SearchIndex: sorted search keys of the genes of a dataset
+
+Functions:
+    buildSearchIndex(): search keys of the annotation columns of a dataset
+    writeSearchIndex(): precompute the search index of a dataset
+"""
+
+import fnmatch
+import os
+import re
+import numpy as np
+import pandas as pd
+
+SEARCH_FILE = "search.parquet"
+FIELDS = ("symbol", "hgid", "refseq")
+
+
+def buildSearchIndex(annotations):
+    """ Dataframe of the (key, field, gene) search keys of the annotation columns of a dataset, sorted by key. """
+    genes = annotations["Gene Name"].astype(str)
+    frames = [
+        pd.DataFrame({"key": genes.str.lower(), "field": "symbol", "gene": genes})
+    ]
+    if "HG ID" in annotations:
+        hgIDs = pd.to_numeric(annotations["HG ID"], errors="coerce")
+        known = hgIDs.notna().to_numpy()
+        frames.append(
+            pd.DataFrame(
+                {
+                    "key": hgIDs[known].astype("int64").astype(str).to_numpy(),
+                    "field": "hgid",
+                    "gene": genes[known].to_numpy(),
+                }
+            )
+        )
+    if "RefSeq" in annotations:
+        # one key per id of genes with several, with and without its version
+        refSeqs = pd.DataFrame(
+            {"key": annotations["RefSeq"].astype(str).str.lower(), "gene": genes}
+        )
+        refSeqs = refSeqs[annotations["RefSeq"].notna().to_numpy()]
+        refSeqs = refSeqs.assign(key=refSeqs["key"].str.split(",")).explode("key")
+        refSeqs["key"] = refSeqs["key"].str.strip()
+        unversioned = refSeqs.assign(key=refSeqs["key"].str.split(".").str[0])
+        frames.append(pd.concat([refSeqs, unversioned]).assign(field="refseq"))
+    index = pd.concat(frames, ignore_index=True)[["key", "field", "gene"]]
+    index = index[index["key"] != ""].drop_duplicates()
+    return index.sort_values("key", kind="mergesort").reset_index(drop=True)
+
+
+def writeSearchIndex(path, annotations):
+    """ Precompute the search index of a dataset into path/search.parquet. """
+    index = buildSearchIndex(annotations)
+    searchPath = os.path.join(path, SEARCH_FILE)
+    index.astype({"field": "category"}).to_parquet(f"{searchPath}.tmp", index=False)
+    os.replace(f"{searchPath}.tmp", searchPath)
+
+
+class SearchIndex:
+    """
+    Class to hold the search index of a dataset as sorted arrays.
+
+    Initialized: sorted array of lower cased keys, field and gene of every key,
+    and key -> genes map for exact lookups
+
+    Methods: prefixRange(): positions of the keys that start with a prefix,
+    match(): genes with a key matching a pattern, exact(): genes with a key
+    """
+
+    def __init__(self, index):
+        self.keys = index["key"].to_numpy(dtype=object)
+        self.fields = index["field"].astype(str).to_numpy(dtype=object)
+        self.genes = index["gene"].to_numpy(dtype=object)
+        self.exactGenes = {}
+        for key, gene in zip(self.keys, self.genes):
+            self.exactGenes.setdefault(key, []).append(gene)
+
+    def prefixRange(self, prefix):
+        """ Start and end positions of the keys that start with a lower cased prefix. """
+        start = np.searchsorted(self.keys, prefix, side="left")
+        # every key starting with prefix sorts before prefix followed by the
+        # highest character
+        end = np.searchsorted(self.keys, prefix + "\U0010ffff", side="left")
+        return start, end
+
+    def match(self, pattern, fields=FIELDS):
+        """ Array of the genes, with duplicates, that have a key of one of fields matching a case insensitive pattern, a prefix when it has no wildcards. """
+        pattern = pattern.lower()
+        literal = re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+        start, end = self.prefixRange(literal)
+        positions = np.arange(start, end)
+        if literal != pattern:
+            # only the keys sharing the literal prefix of the pattern are scanned
+            regex = re.compile(fnmatch.translate(pattern))
+            keys = self.keys[start:end]
+            positions = positions[[regex.match(key) is not None for key in keys]]
+        if set(fields) != set(FIELDS):
+            positions = positions[np.isin(self.fields[positions], list(fields))]
+        return self.genes[positions]
+
+    def exact(self, key):
+        """ Genes that have a lower cased key. """
+        return self.exactGenes.get(key, [])
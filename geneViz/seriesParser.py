@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+"""
+Module that streams GEO series matrix files into typed pandas dataframes without
+holding the raw text of the file in memory.
+
+Peak memory: the metadata header is consumed one line at a time and only the
+!Series_* and !Sample_* rows are kept. The expression table is parsed by pandas in
+chunks of chunkSize rows straight into float columns, so the largest allocation is
+the concatenation of the typed chunks. Peak memory is therefore bounded by roughly
+2 * (probes * samples * itemsize + probe id strings) plus one chunk of raw text,
+independent of how large the file is on disk. For a float32 table that is about
+8 bytes per expression value, compared to several full copies of every value as a
+python string in the old readlines based parser.
+
+Classes:
+    SeriesMatrix: parsed series matrix made up of the expression table and the
+    series/sample metadata found in the header of the file
+
+Functions:
+    openSeriesFile(): open a plain or gzip compressed series matrix file as text
+    parseSeriesMatrix(): stream a series matrix file into a SeriesMatrix
+    seriesName(): name of a series file without its .txt/.gz extensions
+"""
+
+import gzip
+import os
+import pandas as pd
+
+TABLE_BEGIN = "!series_matrix_table_begin"
+PROBE_COLUMN = "affy_gene_probe_id"
+# GEO writes missing expression values as empty fields or as null
+NA_VALUES = ["", "null", "NULL", "NA", "NaN"]
+
+
+class SeriesMatrix:
+    """
+    Class to hold the result of parsing a series matrix file.
+
+    Initialized: pandas dataframe with one row per probe where the first column is
+    the probe id and the rest are the typed expression values named after the sample
+    titles, dictionary of the !Series_* header rows, dictionary of the !Sample_*
+    header rows with one value per sample, and the list of GSM ids of the samples in
+    the same order as the columns of the table
+    """
+
+    def __init__(self, df, seriesInfo, sampleInfo, sampleIDs):
+        self.df = df
+        self.seriesInfo = seriesInfo
+        self.sampleInfo = sampleInfo
+        self.sampleIDs = sampleIDs
+
+    @property
+    def platform(self):
+        """ GPL id of the platform the series was run on, None if it is not in the header. """
+        return self.seriesInfo.get("platform_id")
+
+
+def openSeriesFile(filenamePath):
+    """ Open a series matrix file for reading as text, transparently decompressing .gz files. """
+    if filenamePath.endswith(".gz"):
+        return gzip.open(filenamePath, "rt")
+    return open(filenamePath, "r")
+
+
+def seriesName(fileName):
+    """ Strip the directories and the .gz and .txt extensions off a series matrix file name. """
+    fileName = os.path.basename(fileName)
+    if fileName.endswith(".gz"):
+        fileName = fileName[:-3]
+    if fileName.endswith(".txt"):
+        fileName = fileName[:-4]
+    return fileName
+
+
+def _splitHeaderLine(line):
+    """ Split a tab separated header line and strip the quotes around every field. """
+    return [field.strip().strip('"') for field in line.rstrip("\n").split("\t")]
+
+
+def parseSeriesMatrix(filenamePath, dtype="float32", chunkSize=50000):
+    """ Stream a series matrix file into a SeriesMatrix with typed expression columns. """
+    seriesInfo = {}
+    sampleInfo = {}
+    with openSeriesFile(filenamePath) as f:
+        # walk the metadata header one line at a time until the table starts
+        for line in f:
+            if line.startswith(TABLE_BEGIN):
+                break
+            if line.startswith("!Series_"):
+                fields = _splitHeaderLine(line)
+                # keep only the first value of repeated rows such as summary
+                seriesInfo.setdefault(fields[0][len("!Series_") :], fields[1])
+            elif line.startswith("!Sample_"):
+                fields = _splitHeaderLine(line)
+                sampleInfo.setdefault(fields[0][len("!Sample_") :], fields[1:])
+        else:
+            raise ValueError(f"{filenamePath} has no {TABLE_BEGIN} line")
+
+        # first row of the table holds ID_REF and the GSM id of every sample
+        sampleIDs = _splitHeaderLine(next(f))[1:]
+        titles = sampleInfo.get("title", sampleIDs)
+        if len(titles) != len(sampleIDs):
+            raise ValueError(
+                f"{filenamePath} has {len(titles)} sample titles but {len(sampleIDs)} table columns"
+            )
+        # read the rest of the table in typed chunks, the end marker is a comment
+        chunks = pd.read_csv(
+            f,
+            sep="\t",
+            header=None,
+            names=[PROBE_COLUMN] + sampleIDs,
+            dtype={PROBE_COLUMN: str, **{sample: dtype for sample in sampleIDs}},
+            na_values=NA_VALUES,
+            keep_default_na=False,
+            comment="!",
+            chunksize=chunkSize,
+        )
+        chunks = list(chunks)
+        if chunks:
+            df = pd.concat(chunks, ignore_index=True)
+        else:
+            df = pd.DataFrame(columns=[PROBE_COLUMN] + sampleIDs)
+
+    # name expression columns after the sample titles
+    df.columns = [PROBE_COLUMN] + list(titles)
+    return SeriesMatrix(df, seriesInfo, sampleInfo, sampleIDs)
@@ -0,0 +1,21 @@
+"""
+Shared setup of the tests. The modules of geneViz import each other by their flat
+names and resolve data/, infiles/ and cache/ relative to geneViz/, so the tests
+import them from there and run every test from a scratch geneViz/ of its own.
+"""
+
+import os
+import sys
+import pytest
+
+GENEVIZ_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "geneViz")
+sys.path.insert(0, os.path.abspath(GENEVIZ_DIR))
+
+
+@pytest.fixture
+def workDir(tmp_path, monkeypatch):
+    """ Scratch copy of the folder structure, with the test running from its geneViz/ so ../data, ../infiles, ../outfiles and ../cache all fall inside it. """
+    for folder in ("geneViz", "data", "infiles", "outfiles", "cache"):
+        (tmp_path / folder).mkdir()
+    monkeypatch.chdir(tmp_path / "geneViz")
+    return tmp_path
@@ -0,0 +1,168 @@
+"""
+Tests of the mygene backend against a local stand-in of the mygene api, an
+http.server answering POST /query/ as mygene does.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import pytest
+import annotationBackend
+from annotationBackend import MyGeneBackend
+from annotationCache import AnnotationCache
+
+pytest.importorskip("mygene")
+
+PROBES = [f"{i}_at" for i in range(25)]
+
+
+class StubMyGene:
+    """
+    Local stand-in of the mygene api that records the batches it was asked for and
+    how many were in flight at once. Probes listed in failures make their batch
+    fail that many times, unknown ones are answered as not found.
+    """
+
+    def __init__(self, latency=0.02):
+        self.latency = latency
+        self.batches = []
+        self.failures = {}
+        self.unknown = set()
+        self.inflight = 0
+        self.maxInflight = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                # mygene sends the probes quoted and comma separated
+                terms = parse_qs(body.decode())["q"][0].split(",")
+                probes = [term.strip().strip("\"") for term in terms]
+                status, answer = stub.answer(probes)
+                content = json.dumps(answer).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def answer(self, probes):
+        with self.lock:
+            self.batches.append(probes)
+            self.inflight += 1
+            self.maxInflight = max(self.maxInflight, self.inflight)
+            failing = [probe for probe in probes if self.failures.get(probe, 0)]
+            for probe in failing:
+                self.failures[probe] -= 1
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.inflight -= 1
+        if failing:
+            return 500, {"error": "unavailable"}
+        hits = []
+        for probe in probes:
+            if probe in self.unknown:
+                hits.append({"query": probe, "notfound": True})
+                continue
+            number = int(probe.split("_")[0])
+            hits.append(
+                {
+                    "query": probe,
+                    "_id": str(number),
+                    "symbol": f"Gene{number}",
+                    "name": f"gene {number}",
+                    "homologene": {"id": 1000 + number},
+                    "refseq": {"genomic": [f"NG_{number}", f"NC_{number}"]},
+                }
+            )
+        return 200, hits
+
+
+@pytest.fixture
+def stub():
+    stub = StubMyGene()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnnotationCache(str(tmp_path / "annotations.sqlite"))
+
+
+def backend(stub, cache=None, **options):
+    options = {"batchSize": 10, "backoff": 0.01, **options}
+    return MyGeneBackend(cache, url=stub.url, **options)
+
+
+def test_batches(stub):
+    annotated = backend(stub).annotate("GPL81", PROBES)
+    assert sorted(len(batch) for batch in stub.batches) == [5, 10, 10]
+    assert sorted(probe for batch in stub.batches for probe in batch) == sorted(PROBES)
+    assert sorted(annotated["affy_gene_probe_id"]) == sorted(PROBES)
+    row = annotated.set_index("affy_gene_probe_id").loc["3_at"]
+    assert row["Gene Name"] == "Gene3" and row["HG ID"] == 1003.0
+    assert row["RefSeq"] == "NG_3,NC_3"
+
+
+def test_concurrency_is_bounded(stub):
+    stub.latency = 0.1
+    backend(stub, batchSize=2, concurrency=3).annotate("GPL81", PROBES)
+    assert len(stub.batches) == 13
+    assert stub.maxInflight == 3
+
+
+def test_retries_with_exponential_backoff(stub, monkeypatch):
+    # time.sleep is patched for every module, the stub must not sleep itself
+    stub.latency = 0
+    sleeps = []
+    sleep = time.sleep
+    monkeypatch.setattr(
+        annotationBackend.time, "sleep", lambda s: sleeps.append(s) or sleep(s)
+    )
+    stub.failures["3_at"] = 2
+    annotated = backend(stub, retries=3).annotate("GPL81", PROBES)
+    assert len(annotated) == len(PROBES)
+    # the batch of 3_at was asked for three times, the others once
+    assert sum("3_at" in batch for batch in stub.batches) == 3
+    assert sleeps == [0.01, 0.02]
+
+
+def test_failed_batch_raises_after_retries(stub):
+    stub.failures["3_at"] = 3
+    with pytest.raises(RuntimeError, match="1 of 3 annotation batches failed"):
+        backend(stub, retries=2).annotate("GPL81", PROBES)
+    assert sum("3_at" in batch for batch in stub.batches) == 3
+
+
+def test_resumes_from_checkpoint(stub, cache):
+    stub.failures["3_at"] = 1
+    with pytest.raises(RuntimeError):
+        backend(stub, cache, retries=0).annotate("GPL81", PROBES)
+    stub.batches.clear()
+    annotated = backend(stub, cache, retries=0).annotate("GPL81", PROBES)
+    # only the batch that failed is asked for again
+    assert stub.batches == [PROBES[:10]]
+    assert sorted(annotated["affy_gene_probe_id"]) == sorted(PROBES)
+
+
+def test_warm_cache_makes_no_remote_calls(stub, cache):
+    stub.unknown = {"24_at"}
+    first = backend(stub, cache).annotate("GPL81", PROBES)
+    stub.batches.clear()
+    second = backend(stub, cache).annotate("GPL81", PROBES)
+    assert stub.batches == []
+    assert len(first) == len(second) == len(PROBES) - 1
+    assert cache.stats() == {"hits": len(PROBES), "misses": len(PROBES)}
@@ -0,0 +1,54 @@
+import pandas as pd
+import annotationCache
+from annotationCache import ANNOTATION_COLUMNS, AnnotationCache
+
+
+def annotations(probes):
+    return pd.DataFrame(
+        [(probe, 1.0, "Ryr1", "ryanodine receptor 1", "NG_1") for probe in probes],
+        columns=ANNOTATION_COLUMNS,
+    )
+
+
+def test_hits_and_misses(tmp_path):
+    cache = AnnotationCache(str(tmp_path / "a.sqlite"))
+    cache.store("GPL81", annotations(["1_at", "2_at"]), notFound=["3_at"])
+    found, missing = cache.lookup("GPL81", ["1_at", "2_at", "3_at", "4_at"])
+    # probes the service did not know are hits, but are not returned
+    assert found["affy_gene_probe_id"].tolist() == ["1_at", "2_at"]
+    assert missing == ["4_at"]
+    assert cache.stats() == {"hits": 3, "misses": 1}
+    # other platforms do not share entries
+    assert cache.lookup("GPL1261", ["1_at"])[1] == ["1_at"]
+    assert cache.stats() == {"hits": 3, "misses": 2}
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    path = str(tmp_path / "a.sqlite")
+    AnnotationCache(path).store("GPL81", annotations(["1_at"]))
+    cache = AnnotationCache(path, ttl=60)
+    assert cache.lookup("GPL81", ["1_at"])[1] == []
+    now = annotationCache.time.time()
+    monkeypatch.setattr(annotationCache.time, "time", lambda: now + 61)
+    assert cache.lookup("GPL81", ["1_at"])[1] == ["1_at"]
+    # without a ttl entries never expire
+    assert AnnotationCache(path).lookup("GPL81", ["1_at"])[1] == []
+
+
+def test_other_version_invalidates(tmp_path):
+    path = str(tmp_path / "a.sqlite")
+    AnnotationCache(path, version="1").store("GPL81", annotations(["1_at"]))
+    cache = AnnotationCache(path, version="2")
+    found, missing = cache.lookup("GPL81", ["1_at"])
+    assert found.empty and missing == ["1_at"]
+    cache.store("GPL81", annotations(["1_at"]))
+    assert AnnotationCache(path, version="1").lookup("GPL81", ["1_at"])[1] == ["1_at"]
+
+
+def test_series_without_platform_are_cached(tmp_path):
+    cache = AnnotationCache(str(tmp_path / "a.sqlite"))
+    cache.store(None, annotations(["1_at"]), notFound=["2_at"])
+    found, missing = cache.lookup(None, ["1_at", "2_at"])
+    assert found["affy_gene_probe_id"].tolist() == ["1_at"]
+    assert missing == []
+    assert cache.lookup("GPL81", ["1_at"])[1] == ["1_at"]
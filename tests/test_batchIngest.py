@@ -0,0 +1,31 @@
+from batchIngest import ingestBatch
+
+
+def test_files_of_the_same_series_are_skipped(workDir):
+    fileNames = [
+        "a/GSE1_series_matrix.txt",
+        "GSE1_series_matrix.txt.gz",
+        "GSE2_series_matrix.txt",
+        "GSE2_series_matrix.txt",
+    ]
+    results = ingestBatch(fileNames, {}, False, useCache=False)
+    assert sorted(results) == [
+        (
+            "GSE1_series_matrix.txt.gz",
+            "skipped",
+            0.0,
+            "same series GSE1_series_matrix as a/GSE1_series_matrix.txt",
+        ),
+        (
+            "GSE2_series_matrix.txt",
+            "skipped",
+            0.0,
+            "no sample types in manifest",
+        ),
+        (
+            "a/GSE1_series_matrix.txt",
+            "skipped",
+            0.0,
+            "same series GSE1_series_matrix as GSE1_series_matrix.txt.gz",
+        ),
+    ]
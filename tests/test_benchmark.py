@@ -0,0 +1,47 @@
+import os
+import pytest
+from benchmark import compareResults, runIsolated
+
+
+def double(value):
+    return 2 * value
+
+
+def fail():
+    raise KeyError("no such stage")
+
+
+def die():
+    # as the kernel does to a process out of memory, without a word
+    os._exit(9)
+
+
+def test_run_isolated_returns():
+    assert runIsolated(double, 21) == 42
+
+
+def test_run_isolated_raises_with_child_traceback():
+    with pytest.raises(RuntimeError, match="no such stage"):
+        runIsolated(fail)
+
+
+def test_run_isolated_reports_dead_child():
+    with pytest.raises(RuntimeError, match="exit code 9"):
+        runIsolated(die)
+
+
+def results(seconds, peakMB, genes=100):
+    return {
+        "config": {"genes": genes},
+        "stages": {"parse": {"seconds": seconds, "peakMB": peakMB}},
+    }
+
+
+def test_compare_results():
+    baseline = results(1.0, 100)
+    assert compareResults(results(1.1, 105), baseline) == []
+    assert len(compareResults(results(1.5, 200), baseline)) == 2
+    # below the noise floors however large the ratio
+    assert compareResults(results(0.04, 100), results(0.01, 100)) == []
+    with pytest.raises(ValueError):
+        compareResults(results(1.0, 100, genes=200), baseline)
@@ -0,0 +1,58 @@
+import pytest
+from commandLineParse import CommandLineParse
+
+
+@pytest.mark.parametrize(
+    "argv, command",
+    [
+        (["ingest", "-i", "x.txt"], "ingest"),
+        (["-a", "-i", "x.txt", "-t", "skin"], "ingest"),
+        (["-s"], "serve"),
+        (["-i", "x.txt"], "convert"),
+    ],
+)
+def test_subcommands(argv, command):
+    assert CommandLineParse(argv).args.command == command
+
+
+@pytest.mark.parametrize(
+    "argv", [["-ao", "-i", "x.txt", "-t", "skin"], ["-oaix.txt", "-t", "skin"]]
+)
+def test_legacy_combined_flags(argv):
+    parsed = CommandLineParse(argv)
+    assert parsed.args.command == "ingest"
+    assert parsed.args.output and parsed.args.input == "x.txt"
+
+
+def test_legacy_convert_ignores_ingest_options():
+    parsed = CommandLineParse(["-i", "x.csv", "-t", "skin", "-o", "-c", "mean"])
+    assert parsed.args.command == "convert"
+    assert parsed.args.input == "x.csv"
+    assert parsed.forwarded == []
+
+
+def test_legacy_serve_forwards_to_streamlit():
+    parsed = CommandLineParse(["-s", "--server.port", "8501"])
+    assert parsed.forwarded == ["--server.port", "8501"]
+
+
+@pytest.mark.parametrize("argv", [["-a", "-s", "-i", "x.txt"], ["-as"]])
+def test_annotate_and_see_are_exclusive(capsys, argv):
+    with pytest.raises(SystemExit):
+        CommandLineParse(argv)
+    assert "cannot be used together" in capsys.readouterr().err
+
+
+def test_unknown_option_of_ingest(capsys):
+    with pytest.raises(SystemExit):
+        CommandLineParse(["ingest", "-i", "x.txt", "--bogus"])
+    assert "--bogus" in capsys.readouterr().err
+
+
+def test_ingest_of_a_file_needs_sample_types(monkeypatch, capsys):
+    import main
+
+    monkeypatch.setattr("sys.argv", ["main.py", "ingest", "-i", "x.txt"])
+    with pytest.raises(SystemExit):
+        main.main()
+    assert "sample types (-t)" in capsys.readouterr().err
@@ -0,0 +1,39 @@
+import shutil
+import datasetStore
+from datasetStore import catalogNames, readCatalog, writeDataset
+from test_datasetStore import annotated
+
+
+def test_catalog_follows_data_changed_by_hand(workDir):
+    dataDir = str(workDir / "data")
+    writeDataset(annotated(), "GSE1", dataDir)
+    assert catalogNames(dataDir) == ["GSE1"]
+    # a legacy pickle copied in and a dataset deleted without this module
+    annotated().to_pickle(workDir / "data" / "legacy.pkl")
+    shutil.rmtree(workDir / "data" / "GSE1")
+    catalog = readCatalog(dataDir)
+    assert catalog["name"].tolist() == ["legacy"]
+    assert catalog["genes"].tolist() == [3]
+    assert catalogNames(dataDir) == ["legacy"]
+
+
+def test_unchanged_data_is_not_scanned(workDir, monkeypatch):
+    dataDir = str(workDir / "data")
+    writeDataset(annotated(), "GSE1", dataDir)
+    assert catalogNames(dataDir) == ["GSE1"]
+    scans = []
+    listDatasets = datasetStore.listDatasets
+    monkeypatch.setattr(
+        datasetStore,
+        "listDatasets",
+        lambda *args: scans.append(args) or listDatasets(*args),
+    )
+    for _ in range(3):
+        assert catalogNames(dataDir) == ["GSE1"]
+        assert readCatalog(dataDir)["name"].tolist() == ["GSE1"]
+    assert scans == []
+    # a dataset copied in by hand changes data/, which is scanned once
+    annotated().to_pickle(workDir / "data" / "legacy.pkl")
+    assert catalogNames(dataDir) == ["GSE1", "legacy"]
+    assert catalogNames(dataDir) == ["GSE1", "legacy"]
+    assert len(scans) == 1
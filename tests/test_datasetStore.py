@@ -0,0 +1,113 @@
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+import datasetStore
+from datasetStore import (
+    listDatasets,
+    readCatalog,
+    readDataset,
+    readExpression,
+    writeDataset,
+    writePartitions,
+)
+from geneIndex import GeneIndex
+
+SAMPLES = ["0hrs_skin_replicate1", "2hrs_skin_replicate1"]
+SAMPLES += ["0hrs_heart_replicate1", "2hrs_heart_replicate1"]
+PARTITIONS = {"skin": SAMPLES[:2], "heart": SAMPLES[2:]}
+
+
+def annotated():
+    """ Annotated dataframe of three genes and the samples of two sample types. """
+    df = pd.DataFrame(
+        {
+            "HG ID": [1.0, 2.0, None],
+            "Gene Name": ["Ryr1", "Ints7", "Actb"],
+            "Gene Description": ["a", "b", "c"],
+            "RefSeq": ["NM_1", "NM_2", "NM_3"],
+        }
+    )
+    for i, sample in enumerate(SAMPLES):
+        df[sample] = [1.0 + i, 2.0 + i, 3.0 + i]
+    return df
+
+
+def indexed(dataDir):
+    """ Datasets of the gene index and the catalog of data/. """
+    catalog = readCatalog(str(dataDir))["name"].tolist()
+    return sorted(GeneIndex(str(dataDir)).datasets()), catalog
+
+
+def test_one_type_then_several(workDir):
+    dataDir = workDir / "data"
+    writeDataset(annotated(), "GSE1", str(dataDir), sampleType="skin")
+    writePartitions(annotated(), "GSE1", PARTITIONS, str(dataDir))
+    names = ["GSE1/heart", "GSE1/skin"]
+    assert listDatasets(str(dataDir)) == names
+    assert indexed(dataDir) == (names, names)
+    assert not (dataDir / "GSE1" / "table.parquet").exists()
+
+
+def test_several_types_then_one(workDir):
+    dataDir = workDir / "data"
+    writePartitions(annotated(), "GSE1", PARTITIONS, str(dataDir))
+    writeDataset(annotated(), "GSE1", str(dataDir), sampleType="skin")
+    assert listDatasets(str(dataDir)) == ["GSE1"]
+    assert indexed(dataDir) == (["GSE1"], ["GSE1"])
+    assert not any(path.is_dir() for path in (dataDir / "GSE1").iterdir())
+
+
+def test_fewer_partitions(workDir):
+    dataDir = workDir / "data"
+    writePartitions(annotated(), "GSE1", PARTITIONS, str(dataDir))
+    writePartitions(annotated(), "GSE1", {"skin": SAMPLES[:2]}, str(dataDir))
+    assert listDatasets(str(dataDir)) == ["GSE1/skin"]
+    assert indexed(dataDir) == (["GSE1/skin"], ["GSE1/skin"])
+
+
+def test_failed_rewrite_keeps_the_table_its_index_points_into(workDir, monkeypatch):
+    dataDir = str(workDir / "data")
+    writeDataset(annotated(), "GSE1", dataDir)
+    # other genes, so every row moves, failing before the write completes
+    renamed = annotated().assign(**{"Gene Name": ["Zzz1", "Aaa1", "Mmm1"]})
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(datasetStore, "writeSearchIndex", fail)
+    with pytest.raises(OSError):
+        writeDataset(renamed, "GSE1", dataDir)
+    found = readDataset("GSE1", genes=["Ryr1", "Actb"], dataDir=dataDir)
+    assert found["Gene Name"].tolist() == ["Actb", "Ryr1"]
+    assert found["RefSeq"].tolist() == ["NM_3", "NM_1"]
+
+
+def tableVersion(dataDir):
+    """ Version of the table of GSE1 on disk. """
+    metadata = pq.read_schema(os.path.join(dataDir, "GSE1", "table.parquet")).metadata
+    return metadata[b"geneviz.version"].decode()
+
+
+def test_index_of_another_version_is_not_used(workDir, monkeypatch):
+    dataDir = str(workDir / "data")
+    writeDataset(annotated(), "GSE1", dataDir)
+    renamed = annotated().assign(**{"Gene Name": ["Zzz1", "Aaa1", "Mmm1"]})
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    # the table is rewritten but its offsets never reach the index
+    monkeypatch.setattr(GeneIndex, "addDataset", fail)
+    with pytest.raises(OSError):
+        writeDataset(renamed, "GSE1", dataDir)
+    monkeypatch.undo()
+    found = readDataset("GSE1", genes=["Zzz1", "Aaa1"], dataDir=dataDir)
+    assert found["RefSeq"].tolist() == ["NM_2", "NM_1"]
+    values = readExpression("GSE1", genes=["Zzz1", "Aaa1"], dataDir=dataDir)
+    assert values.iloc[:, 0].tolist() == [1.0, 2.0]
+    # the sidecars were written for the new version, which a rebuild indexes
+    GeneIndex(dataDir).rebuild()
+    assert GeneIndex(dataDir).rowsOf("GSE1", ["Zzz1"], tableVersion(dataDir)) == {
+        "Zzz1": 2
+    }
@@ -0,0 +1,50 @@
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+from datasetSummary import QUANTILES, geneSummary, sampleQuantiles
+from replicates import aggregate
+
+
+@pytest.fixture(autouse=True)
+def noWarnings():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        yield
+
+
+def test_genes_and_samples_without_values_are_nan():
+    matrix = np.array([[1.0, 3.0], [np.nan, np.nan]], dtype="float32")
+    summary = geneSummary(["Ryr1", "Actb"], matrix)
+    assert summary["min"].tolist()[0] == 1.0
+    assert summary["max"].tolist()[0] == 3.0
+    assert summary.iloc[1, 1:].isna().all()
+    quantiles = sampleQuantiles(matrix[1:], ["s1", "s2"])
+    assert quantiles.shape == (2, len(QUANTILES))
+    assert quantiles.isna().all().all()
+
+
+def test_dataset_without_samples():
+    summary = geneSummary(["Ryr1", "Actb"], np.zeros((2, 0), dtype="float32"))
+    assert summary["Gene Name"].tolist() == ["Ryr1", "Actb"]
+    assert summary[["min", "max"]].isna().all().all()
+    assert sampleQuantiles(np.zeros((2, 0)), []).shape == (0, len(QUANTILES))
+
+
+def test_dataset_without_genes():
+    quantiles = sampleQuantiles(np.zeros((0, 2)), ["s1", "s2"])
+    assert quantiles.isna().all().all()
+    assert len(geneSummary([], np.zeros((0, 2)))) == 0
+
+
+def test_timepoints_without_values_are_nan():
+    matrix = np.array([[1.0, 3.0, 5.0], [np.nan, np.nan, 2.0]])
+    sampleIndex = pd.MultiIndex.from_arrays(
+        [[0.0, 0.0, 2.0], [1, 2, 1]], names=["timepoint", "replicate"]
+    )
+    timepoints, results = aggregate(matrix, sampleIndex)
+    assert timepoints.tolist() == [0.0, 2.0]
+    assert results["median"][0].tolist() == [2.0, 5.0]
+    assert np.isnan(results["median"][1, 0])
+    assert results["n"][1].tolist() == [0.0, 1.0]
+    assert np.isnan(results["sd"][1]).all()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from exportEngine import exportFrame
+
+
+def annotated(genes=250):
+    """ Annotated dataframe of some genes, a few without homologene id. """
+    hgIDs = [np.nan if gene % 7 == 0 else float(gene) for gene in range(genes)]
+    df = pd.DataFrame(
+        {"HG ID": hgIDs, "Gene Name": [f"g{gene}" for gene in range(genes)]}
+    )
+    df["0hrs_skin_replicate1"] = np.arange(genes, dtype="float32") / 4
+    df["2hrs_skin_replicate1"] = np.arange(genes, dtype="float32") * 2
+    return df
+
+
+def readText(path, separator):
+    """ Dataframe of a csv or tsv export, decompressing every gzip member or zstd frame. """
+    compression = {"gz": "gzip", "zst": "zstd"}.get(path.rsplit(".", 1)[-1])
+    with pa.input_stream(path, compression=compression) as stream:
+        return pd.read_csv(stream, sep=separator)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("compression", ["none", "gzip", "zstd"])
+@pytest.mark.parametrize("fileFormat, separator", [("csv", ","), ("tsv", "\t")])
+def test_chunked_text_round_trip(tmp_path, fileFormat, separator, compression, workers):
+    df = annotated()
+    path = exportFrame(
+        df,
+        str(tmp_path / "GSE1"),
+        fileFormat,
+        compression,
+        chunkSize=60,
+        workers=workers,
+    )
+    exported = readText(path, separator)
+    assert exported["Gene Name"].tolist() == df["Gene Name"].tolist()
+    assert exported["HG ID"].astype("float64").equals(df["HG ID"])
+    values = exported.iloc[:, 2:].to_numpy()
+    assert np.array_equal(values, df.iloc[:, 2:].to_numpy())
+    # every chunk was written once, the header only in the first
+    assert len(exported) == len(df)
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "zstd"])
+def test_chunked_parquet_round_trip(tmp_path, compression):
+    df = annotated()
+    path = exportFrame(df, str(tmp_path / "GSE1"), "parquet", compression, chunkSize=60)
+    assert pq.ParquetFile(path).num_row_groups == 5
+    pd.testing.assert_frame_equal(pd.read_parquet(path), df)
+
+
+@pytest.mark.parametrize("fileFormat", ["csv", "parquet"])
+def test_failed_export_leaves_no_file(tmp_path, fileFormat):
+    def chunks():
+        yield annotated(10)
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        exportFrame(chunks(), str(tmp_path / "GSE1"), fileFormat, workers=1)
+    assert list(tmp_path.iterdir()) == []
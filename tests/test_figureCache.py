@@ -0,0 +1,97 @@
+import os
+import pytest
+from matplotlib.figure import Figure
+import figureCache
+from datasetCache import LRUCache
+from figureCache import cachedFigure, figureKey
+
+
+@pytest.fixture
+def figures(monkeypatch):
+    """ Empty in memory figure cache in place of the one of the process. """
+    cache = LRUCache(64 * 1024 ** 2)
+    monkeypatch.setattr(figureCache, "FIGURES", cache)
+    return cache
+
+
+class Drawer:
+    """ Figure builder that counts how many times it was called. """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        fig = Figure(figsize=(1, 1))
+        fig.add_subplot().plot([0, 1], [0, self.calls])
+        return fig
+
+
+def key(versions, **extra):
+    """ Key of the individual figure of Ryr1 in GSE1 for a dataset -> version map. """
+    page = ("individual", ["GSE1"], ["Ryr1"], "mean", "series")
+    return figureKey(*page, versions, **extra)
+
+
+def test_key_changes_with_the_dataset_version():
+    assert key({"GSE1": "a"}) == key({"GSE1": "a"})
+    assert key({"GSE1": "a"}) != key({"GSE1": "b"})
+    # versions of datasets the figure does not show are ignored
+    assert key({"GSE1": "a"}) == key({"GSE1": "a", "GSE2": "b"})
+    assert key({"GSE1": "a"}) != key({"GSE1": "a"}, threshold=5)
+
+
+def test_memory_then_disk(figures, tmp_path):
+    draw = Drawer()
+    first = cachedFigure(key({"GSE1": "a"}), draw, figureDir=str(tmp_path))
+    assert first.startswith(b"\x89PNG")
+    assert os.listdir(tmp_path) == [f"{key({'GSE1': 'a'})}.png"]
+    assert cachedFigure(key({"GSE1": "a"}), draw, figureDir=str(tmp_path)) == first
+    assert (figures.hits, draw.calls) == (1, 1)
+    # another process, or a restart, reads it back from the directory
+    figures.clear()
+    assert cachedFigure(key({"GSE1": "a"}), draw, figureDir=str(tmp_path)) == first
+    assert draw.calls == 1
+
+
+def test_new_version_is_drawn_again(figures, tmp_path):
+    draw = Drawer()
+    first = cachedFigure(key({"GSE1": "a"}), draw, figureDir=str(tmp_path))
+    second = cachedFigure(key({"GSE1": "b"}), draw, figureDir=str(tmp_path))
+    assert draw.calls == 2
+    assert first != second
+
+
+def test_without_a_directory_only_memory_is_used(figures, tmp_path):
+    draw = Drawer()
+    cachedFigure(key({"GSE1": "a"}), draw, "svg", figureDir="")
+    figures.clear()
+    data = cachedFigure(key({"GSE1": "a"}), draw, "svg", figureDir="")
+    assert b"<svg" in data
+    assert draw.calls == 2
+    with pytest.raises(ValueError):
+        cachedFigure(key({"GSE1": "a"}), draw, "gif", figureDir="")
+
+
+def test_memory_eviction(monkeypatch, tmp_path):
+    draw = Drawer()
+    size = len(figureCache.renderFigure(Drawer()()))
+    # room for a single figure
+    figures = LRUCache(size * 1.5)
+    monkeypatch.setattr(figureCache, "FIGURES", figures)
+    cachedFigure(key({"GSE1": "a"}), draw, figureDir="")
+    cachedFigure(key({"GSE1": "b"}), draw, figureDir="")
+    assert len(figures.entries) == 1
+    cachedFigure(key({"GSE1": "a"}), draw, figureDir="")
+    assert draw.calls == 3
+
+
+def test_directory_eviction(figures, monkeypatch, tmp_path):
+    draw = Drawer()
+    first = cachedFigure(key({"GSE1": "a"}), draw, figureDir=str(tmp_path))
+    # room for a little more than a single figure
+    monkeypatch.setattr(figureCache, "FIGURE_DIR_MB", len(first) * 1.5 / 1024 ** 2)
+    os.utime(tmp_path / f"{key({'GSE1': 'a'})}.png", (0, 0))
+    cachedFigure(key({"GSE1": "b"}), draw, figureDir=str(tmp_path))
+    # the oldest figure was removed
+    assert os.listdir(tmp_path) == [f"{key({'GSE1': 'b'})}.png"]
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+from fileCleaner import ExistingData, SeriesData
+from ingestOptions import POLICIES
+from seriesParser import PROBE_COLUMN, SeriesMatrix
+
+
+def seriesData():
+    """ SeriesData of a parsed series whose genes have several probes, some tied. """
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({PROBE_COLUMN: [f"{i}_at" for i in range(40)]})
+    for sample in ("0hrs_skin_replicate1", "2hrs_skin_replicate1"):
+        df[sample] = rng.integers(0, 3, size=40).astype("float64")
+    series = SeriesMatrix(df, {"platform_id": "GPL1"}, {}, ["GSM1", "GSM2"])
+    return SeriesData(False, "GSE1_series_matrix.txt", ["skin"], series)
+
+
+def annotations(probes):
+    """ Annotations of the probes, four per gene. """
+    return pd.DataFrame(
+        {
+            PROBE_COLUMN: probes,
+            "HG ID": 1.0,
+            "Gene Name": [f"g{int(probe[:-3]) % 10}" for probe in probes],
+            "Gene Description": "",
+            "RefSeq": "",
+        }
+    )
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_collapse_ignores_annotation_order(policy):
+    data = seriesData()
+    data.geneAnnotateDf = annotations(data.affyProbeIDs)
+    data.combineDataFrame(policy)
+    expected = data.combinedDf.sort_values("Gene Name", ignore_index=True)
+    shuffled = np.random.default_rng(1).permutation(data.affyProbeIDs)
+    data.geneAnnotateDf = annotations(list(shuffled))
+    data.combineDataFrame(policy)
+    actual = data.combinedDf.sort_values("Gene Name", ignore_index=True)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_csv_without_gene_names_is_rejected(workDir):
+    pd.DataFrame({"Symbol": ["Ryr1"], "0hrs_skin_replicate1": [1.0]}).to_csv(
+        workDir / "infiles" / "GSE1.csv", index=False
+    )
+    with pytest.raises(ValueError, match="GSE1.csv has no Gene Name column"):
+        ExistingData("GSE1.csv")
+    assert not (workDir / "data" / "GSE1").exists()
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+from matplotlib.collections import LineCollection, PathCollection, PolyCollection
+from matplotlib.image import AxesImage
+from geneFigures import chooseView, comparisonFigure, individualFigure
+
+HOURS = np.array([0.0, 0.0, 2.0, 2.0, 4.0])
+
+
+def matrix(genes):
+    """ Genes x samples matrix of increasing values, with a missing one. """
+    values = np.arange(genes * len(HOURS), dtype="float64").reshape(genes, -1)
+    values[0, 1] = np.nan
+    return values
+
+
+def tidy():
+    """ Tidy frame of two genes in two datasets, one without a homologene id. """
+    rows = []
+    for dataset in ("GSE1", "GSE2"):
+        for gene, hgID in (("Ryr1", 1.0), ("Actb", np.nan)):
+            for hours in HOURS:
+                rows.append((dataset, gene, hgID, hours, hours + len(rows)))
+    columns = ["dataset", "Gene Name", "HG ID", "timepoint", "value"]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def artists(fig, kind):
+    """ Artists of a kind, or of a subclass of it, drawn on the main axes of a figure. """
+    ax = fig.axes[0]
+    return [artist for artist in ax.get_children() if isinstance(artist, kind)]
+
+
+def legendLabels(fig):
+    """ Texts of the legend of the main axes of a figure. """
+    legend = fig.axes[0].get_legend()
+    return [] if legend is None else [text.get_text() for text in legend.get_texts()]
+
+
+def test_choose_view():
+    assert chooseView(30, threshold=30) == "series"
+    assert chooseView(31, threshold=30) == "band"
+    assert chooseView(31, "heatmap", threshold=30) == "heatmap"
+    with pytest.raises(ValueError):
+        chooseView(1, "pie")
+
+
+def test_series_is_one_line_collection():
+    fig = individualFigure(matrix(3), HOURS, ["a", "b", "c"], "GSE1")
+    (lines,) = artists(fig, LineCollection)
+    assert len(lines.get_segments()) == 3
+    assert legendLabels(fig) == ["a", "b", "c"]
+    # genes are only named up to the threshold
+    fig = individualFigure(matrix(3), HOURS, ["a", "b", "c"], "GSE1", "series", 2)
+    assert len(artists(fig, LineCollection)[0].get_segments()) == 3
+    assert legendLabels(fig) == []
+
+
+def test_band_above_the_threshold():
+    fig = individualFigure(matrix(40), HOURS, [str(i) for i in range(40)], "GSE1")
+    assert len(artists(fig, PolyCollection)) == 2
+    (median,) = fig.axes[0].get_lines()
+    assert median.get_xdata().tolist() == [0.0, 2.0, 4.0]
+    assert legendLabels(fig) == ["median of 40 genes"]
+
+
+def test_heatmap():
+    fig = individualFigure(matrix(3), HOURS, ["a", "b", "c"], "GSE1", "heatmap")
+    (image,) = artists(fig, AxesImage)
+    assert image.get_array().shape == (3, len(HOURS))
+    # the colorbar has axes of its own
+    assert len(fig.axes) == 2
+    assert len(fig.axes[0].get_yticklabels()) == 3
+    empty = individualFigure(np.zeros((0, 5)), HOURS, [], "GSE1", "heatmap")
+    assert artists(empty, AxesImage) == []
+
+
+def test_comparison_views():
+    frame = tidy()
+    fig = comparisonFigure(frame, "Comparison", "series")
+    (points,) = artists(fig, PathCollection)
+    assert len(points.get_offsets()) == len(frame)
+    assert len(legendLabels(fig)) == 4
+    fig = comparisonFigure(frame, "Comparison", "band")
+    assert len(artists(fig, PolyCollection)) == 4
+    assert len(fig.axes[0].get_lines()) == 2
+    assert legendLabels(fig) == ["GSE1 (2 genes)", "GSE2 (2 genes)"]
+    fig = comparisonFigure(frame, "Comparison", "heatmap")
+    (image,) = artists(fig, AxesImage)
+    assert image.get_array().shape == (4, 3)
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+from datasetStore import writeDataset
+from geneSearch import parseGeneList, parseGmt, resolveGenes, searchGenes
+
+
+def dataset(genes, hgIDs):
+    """ Annotated dataframe of genes with one sample. """
+    return pd.DataFrame(
+        {
+            "HG ID": hgIDs,
+            "Gene Name": genes,
+            "Gene Description": "",
+            "RefSeq": [f"NM_{i}" for i in range(len(genes))],
+            "0hrs_skin_replicate1": 1.0,
+        }
+    )
+
+
+@pytest.fixture
+def dataDir(workDir):
+    dataDir = str(workDir / "data")
+    mouse = ["Actb", "Actbl2", "Act", "Ryr1", "Hoxa1"]
+    writeDataset(dataset(mouse, [1.0, 2.0, 3.0, 4.0, None]), "mouse", dataDir)
+    writeDataset(dataset(["RYR1", "ACTB"], [4.0, 1.0]), "human", dataDir)
+    return dataDir
+
+
+def test_exact_symbol_first_then_shorter(dataDir):
+    found, total = searchGenes("actb", ["mouse", "human"], dataDir=dataDir)
+    assert found == ["ACTB", "Actb", "Actbl2"]
+    assert total == 3
+    assert searchGenes("act", ["mouse"], dataDir=dataDir)[0][0] == "Act"
+
+
+def test_paging(dataDir):
+    pages = [
+        searchGenes("*", ["mouse"], page, pageSize=2, dataDir=dataDir)
+        for page in (1, 2, 3, 4)
+    ]
+    assert [total for _, total in pages] == [5, 5, 5, 5]
+    assert [len(found) for found, _ in pages] == [2, 2, 1, 0]
+    assert sum((found for found, _ in pages), []) == sorted(
+        ["Actb", "Actbl2", "Act", "Ryr1", "Hoxa1"], key=lambda gene: (len(gene), gene)
+    )
+
+
+def test_resolve_symbols_ids_and_patterns(dataDir):
+    names = ["ryr1", "Ryr1", "4", "nm_2", "Hox*", "Nope", " "]
+    found, misses = resolveGenes(names, ["mouse", "human"], dataDir=dataDir)
+    # any case names both species, the exact spelling only that gene
+    assert found == ["Ryr1", "RYR1", "Act", "Hoxa1"]
+    assert misses == ["Nope"]
+    assert resolveGenes(["Ryr1"], ["mouse", "human"], dataDir)[0] == ["Ryr1"]
+
+
+def test_parse_lists():
+    genes = parseGeneList("Ryr1, Actb;Hoxa1\n Ints7")
+    assert genes == ["Ryr1", "Actb", "Hoxa1", "Ints7"]
+    gmt = "SET1\tdesc\tRyr1\tActb\nbad line\nSET2\t\tHoxa1\t\n"
+    assert parseGmt(gmt) == {"SET1": ["Ryr1", "Actb"], "SET2": ["Hoxa1"]}
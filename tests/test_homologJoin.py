@@ -0,0 +1,26 @@
+from datasetStore import writeDataset
+from geneFigures import comparisonFigure
+from homologJoin import homologQuery
+from test_datasetStore import annotated
+
+
+def test_genes_without_homologene_id_match_by_symbol(workDir):
+    dataDir = str(workDir / "data")
+    writeDataset(annotated(), "GSE1", dataDir)
+    writeDataset(annotated(), "GSE2", dataDir)
+    frame = homologQuery(["Ryr1", "Actb"], ["GSE1", "GSE2"], dataDir=dataDir)
+    pairs = set(zip(frame["dataset"], frame["Gene Name"]))
+    genes = ("Ryr1", "Actb")
+    assert pairs == {(name, gene) for name in ("GSE1", "GSE2") for gene in genes}
+    assert frame.loc[frame["Gene Name"] == "Actb", "HG ID"].isna().all()
+    figure = comparisonFigure(frame, "title", view="series")
+    labels = [text.get_text() for text in figure.axes[0].get_legend().get_texts()]
+    assert sorted(labels) == [
+        "Actb_GSE1",
+        "Actb_GSE2",
+        "Ryr1_GSE1 (HG 1)",
+        "Ryr1_GSE2 (HG 1)",
+    ]
+    heatmap = comparisonFigure(frame, "title", view="heatmap")
+    rows = [text.get_text() for text in heatmap.axes[0].get_yticklabels()]
+    assert sorted(rows) == ["GSE1 Actb", "GSE1 HG 1", "GSE2 Actb", "GSE2 HG 1"]
@@ -0,0 +1,72 @@
+"""
+Tests of the offline backend annotating probes from a GPL annotation table.
+"""
+
+import math
+import os
+import pytest
+from annotationBackend import PlatformTableBackend
+
+ANNOT = """^Annotation
+!Annotation_platform = GPL81
+#ID = probe id
+!platform_table_begin
+ID\tGene title\tGene symbol\tGene ID\tHomoloGene\tRefSeq Transcript ID
+1000_at\tryanodine receptor 1\tRyr1\t20190\t68069\tNM_009109
+1001_at\tactin, beta\tActb\t11461\t\tNM_007393
+1002_at\t\t\t\t\t
+1003_at\tryanodine receptor 1\tRyr1\t20190\t68069\tNM_009109
+!platform_table_end
+"""
+
+
+def writeTable(workDir, name, text):
+    """ Path of an annotation table written to infiles/. """
+    path = workDir / "infiles" / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_annotate_from_table(workDir):
+    backend = PlatformTableBackend(writeTable(workDir, "GPL81.annot", ANNOT))
+    assert backend.platform == "GPL81"
+    probes = ["1003_at", "1001_at", "1002_at", "9999_at", "1003_at"]
+    annotated = backend.annotate("GPL81", probes)
+    # probes without a symbol or missing from the table are left out
+    assert annotated["affy_gene_probe_id"].tolist() == ["1003_at", "1001_at"]
+    assert annotated["Gene Name"].tolist() == ["Ryr1", "Actb"]
+    assert annotated["HG ID"].iloc[0] == 68069
+    assert math.isnan(annotated["HG ID"].iloc[1])
+    assert annotated["RefSeq"].tolist() == ["NM_009109", "NM_007393"]
+    # series that do not name their platform are annotated too
+    assert len(backend.annotate(None, probes)) == 2
+
+
+def test_table_of_another_platform_is_rejected(workDir):
+    backend = PlatformTableBackend(writeTable(workDir, "GPL81.annot", ANNOT))
+    with pytest.raises(ValueError, match="annotates GPL81, not GPL1261"):
+        backend.annotate("GPL1261", ["1000_at"])
+
+
+def test_table_is_serialized_once(workDir):
+    path = writeTable(workDir, "GPL81.annot", ANNOT)
+    PlatformTableBackend(path)
+    serialized = workDir / "cache" / "platforms" / "GPL81.annot.pkl"
+    assert serialized.exists()
+    # the serialized copy is used while it is newer than the table
+    writeTable(workDir, "GPL81.annot", ANNOT.replace("Ryr1", "Ryr2"))
+    os.utime(path, (0, 0))
+    backend = PlatformTableBackend(path)
+    assert backend.platform == "GPL81"
+    assert backend.annotate("GPL81", ["1000_at"])["Gene Name"].tolist() == ["Ryr1"]
+    # and the table parsed again once it changed
+    later = serialized.stat().st_mtime + 10
+    os.utime(path, (later, later))
+    backend = PlatformTableBackend(path)
+    assert backend.annotate("GPL81", ["1000_at"])["Gene Name"].tolist() == ["Ryr2"]
+
+
+def test_table_without_symbols_is_rejected(workDir):
+    text = "ID\tGene title\n1000_at\tryanodine receptor 1\n"
+    with pytest.raises(ValueError, match="has no Gene Name column"):
+        PlatformTableBackend(writeTable(workDir, "GPL2.txt", text))
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ingestOptions import POLICIES
+from probeCollapse import collapseProbes
+
+GENES = np.array(["Ryr1", "Ints7", "Ryr1", "Actb", "Ryr1", "Ints7"])
+
+
+def probes():
+    """ Matrix of a few series rows of which the probes of GENES are every other row. """
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(2 * len(GENES), 4))
+    return matrix, np.arange(len(GENES))[::-1] * 2
+
+
+def expected(matrix, policy):
+    """ Collapsed matrix of a policy computed with a pandas groupby. """
+    frame = pd.DataFrame(matrix).assign(gene=GENES)
+    groups = frame.groupby("gene", sort=False)
+    if policy == "first":
+        return groups.first().to_numpy()
+    if policy in ("mean", "median"):
+        return getattr(groups, policy)().to_numpy()
+    values = frame.drop(columns="gene")
+    score = values.mean(axis=1) if policy == "max-mean" else values.var(axis=1, ddof=0)
+    return values.loc[score.groupby(GENES, sort=False).idxmax()].to_numpy()
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_collapse_rows_of_a_larger_matrix(policy):
+    matrix, rows = probes()
+    genes, representatives, collapsed, counts = collapseProbes(
+        GENES, matrix, policy, rows
+    )
+    assert genes.tolist() == ["Ryr1", "Ints7", "Actb"]
+    assert counts.tolist() == [3, 2, 1]
+    assert np.allclose(collapsed, expected(matrix[rows], policy))
+    # the same as collapsing the gathered rows
+    gathered = collapseProbes(GENES, matrix[rows], policy)
+    assert np.array_equal(representatives, gathered[1])
+    assert np.allclose(collapsed, gathered[2])
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import pytest
+from queryServer import QueryServer
+
+
+def respond(workDir, method, target, body=b""):
+    """ Status and decoded body of the answer of a server on an empty data/. """
+    server = QueryServer(str(workDir / "data"))
+    status, content, _ = asyncio.run(server._respond(method, target, body))
+    return status, json.loads(content)
+
+
+@pytest.mark.parametrize(
+    "query", ["page=abc", "page=0", "pageSize=-1", "pageSize=1.5"]
+)
+def test_bad_page_is_a_client_error(workDir, query):
+    status, answer = respond(workDir, "GET", f"/search?pattern=Ry&{query}")
+    assert status == 400
+    assert "must be" in answer["error"]
+
+
+@pytest.mark.parametrize("body", [b"[]", b'"x"', b"{"])
+def test_body_must_be_a_json_object(workDir, body):
+    status, answer = respond(workDir, "POST", "/search", body)
+    assert status == 400
+    assert "JSON" in answer["error"]
+
+
+def test_search_pages(workDir):
+    status, answer = respond(workDir, "GET", "/search?pattern=Ry&page=2&pageSize=5")
+    assert status == 200
+    assert answer == {"genes": [], "total": 0}
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [{"genes": 5}, {"genes": ["Ryr1", 5]}, {"datasets": [None]}, {"format": []}],
+)
+def test_fields_of_the_wrong_type_are_a_client_error(workDir, fields):
+    body = json.dumps(fields).encode()
+    status, answer = respond(workDir, "POST", "/query", body)
+    assert status == 400
+    assert "must be" in answer["error"]
+
+
+@pytest.mark.parametrize(
+    "head", [b"GARBAGE\r\n\r\n", b"GET /datasets HTTP/1.1\r\nContent-Length: x\r\n\r\n"]
+)
+def test_malformed_request_is_a_client_error(workDir, head):
+    async def send():
+        server = QueryServer(str(workDir / "data"))
+        listening = await server.start("127.0.0.1", 0)
+        port = listening.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(head)
+        answer = await reader.read()
+        writer.close()
+        listening.close()
+        await listening.wait_closed()
+        return answer
+
+    answer = asyncio.run(send())
+    assert answer.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+    assert b"Connection: close" in answer
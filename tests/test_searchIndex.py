@@ -0,0 +1,47 @@
+import pandas as pd
+from searchIndex import SearchIndex, buildSearchIndex
+
+ANNOTATIONS = pd.DataFrame(
+    {
+        "HG ID": [68069.0, 20190.0, None, 7.0, None],
+        "Gene Name": ["Ryr1", "Ryr2", "Ryr3", "Hoxa1", "Hoxb1"],
+        "RefSeq": ["NM_009109.2,NM_001.1", "NM_023868", None, "NM_010449", ""],
+    }
+)
+
+
+def searchIndex():
+    return SearchIndex(buildSearchIndex(ANNOTATIONS))
+
+
+def test_keys_are_sorted_and_lower_cased():
+    keys = buildSearchIndex(ANNOTATIONS)["key"].tolist()
+    assert keys == sorted(keys)
+    assert "ryr1" in keys and "68069" in keys
+    # every refseq id of a gene, with and without its version
+    assert {"nm_009109.2", "nm_009109", "nm_001.1", "nm_001"} <= set(keys)
+    assert "" not in keys
+
+
+def test_prefix_search():
+    index = searchIndex()
+    assert sorted(index.match("RY")) == ["Ryr1", "Ryr2", "Ryr3"]
+    assert sorted(index.match("nm_0091")) == ["Ryr1", "Ryr1"]
+    assert list(index.match("zz")) == []
+    start, end = index.prefixRange("hox")
+    assert sorted(index.genes[start:end]) == ["Hoxa1", "Hoxb1"]
+
+
+def test_wildcards_and_fields():
+    index = searchIndex()
+    assert sorted(index.match("hox?1")) == ["Hoxa1", "Hoxb1"]
+    assert sorted(index.match("*2", fields=("symbol",))) == ["Ryr2"]
+    assert sorted(index.match("ryr[13]")) == ["Ryr1", "Ryr3"]
+    assert list(index.match("7", fields=("refseq",))) == []
+
+
+def test_exact_keys():
+    index = searchIndex()
+    assert index.exact("68069") == ["Ryr1"]
+    assert index.exact("nm_023868") == ["Ryr2"]
+    assert index.exact("ryr") == []
@@ -0,0 +1,62 @@
+import gzip
+import numpy as np
+import pytest
+from seriesParser import PROBE_COLUMN, parseSeriesMatrix, seriesName
+
+SERIES = """!Series_title\t"Skin time course"
+!Series_summary\t"first summary"
+!Series_summary\t"second summary"
+!Series_platform_id\t"GPL81"
+!Sample_title\t"0hrs_skin_replicate1"\t"2hrs_skin_replicate1"
+!Sample_geo_accession\t"GSM1"\t"GSM2"
+!series_matrix_table_begin
+"ID_REF"\t"GSM1"\t"GSM2"
+"1000_at"\t1.5\t2.25
+"1001_at"\tnull\t3
+"1002_at"\t\t-4.5
+"1003_at"\t5\t6
+!series_matrix_table_end
+"""
+
+
+@pytest.fixture(params=["txt", "txt.gz"])
+def seriesFile(tmp_path, request):
+    path = tmp_path / f"GSE1_series_matrix.{request.param}"
+    if request.param.endswith(".gz"):
+        with gzip.open(path, "wt") as f:
+            f.write(SERIES)
+    else:
+        path.write_text(SERIES)
+    return str(path)
+
+
+@pytest.mark.parametrize("chunkSize", [1, 50000])
+def test_parse_series_matrix(seriesFile, chunkSize):
+    series = parseSeriesMatrix(seriesFile, chunkSize=chunkSize)
+    df = series.df
+    assert df.columns.tolist() == [
+        PROBE_COLUMN,
+        "0hrs_skin_replicate1",
+        "2hrs_skin_replicate1",
+    ]
+    # the end marker is a comment, not a probe
+    assert df[PROBE_COLUMN].tolist() == ["1000_at", "1001_at", "1002_at", "1003_at"]
+    assert (df.dtypes[1:] == "float32").all()
+    expected = [[1.5, 2.25], [np.nan, 3.0], [np.nan, -4.5], [5.0, 6.0]]
+    assert np.array_equal(df.iloc[:, 1:].to_numpy(), expected, equal_nan=True)
+    assert series.platform == "GPL81"
+    assert series.seriesInfo["summary"] == "first summary"
+    assert series.sampleInfo["geo_accession"] == ["GSM1", "GSM2"]
+    assert series.sampleIDs == ["GSM1", "GSM2"]
+
+
+def test_file_without_table_is_rejected(tmp_path):
+    path = tmp_path / "GSE1_series_matrix.txt"
+    path.write_text(SERIES.split("!series_matrix_table_begin")[0])
+    with pytest.raises(ValueError, match="has no !series_matrix_table_begin"):
+        parseSeriesMatrix(str(path))
+
+
+def test_series_name():
+    assert seriesName("a/GSE1_series_matrix.txt.gz") == "GSE1_series_matrix"
+    assert seriesName("GSE1_series_matrix.txt") == "GSE1_series_matrix"
@@ -0,0 +1,45 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+import pytest
+from benchmark import HEAVY_MODULES, STARTUP_BUDGET, STARTUP_COMMANDS
+from conftest import GENEVIZ_DIR
+
+# runs main.py as python would and prints the modules it imported last
+PROBE = """
+import json, runpy, sys
+sys.path.insert(0, ".")
+sys.argv = ["main.py"] + sys.argv[1:]
+try:
+    runpy.run_path("main.py", run_name="__main__")
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def startup(arguments, repeats=3):
+    """ Median wall time of main.py with arguments in a fresh python, and the top level modules it imported. """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run = subprocess.run(
+            [sys.executable, "-c", PROBE] + list(arguments),
+            cwd=GENEVIZ_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times.append(time.perf_counter() - start)
+    modules = json.loads(run.stdout.splitlines()[-1])
+    return statistics.median(times), {module.split(".")[0] for module in modules}
+
+
+@pytest.mark.parametrize("arguments", STARTUP_COMMANDS, ids=" ".join)
+def test_startup_within_budget_without_heavy_modules(arguments):
+    seconds, modules = startup(arguments)
+    assert not modules.intersection(HEAVY_MODULES)
+    assert seconds <= STARTUP_BUDGET
+